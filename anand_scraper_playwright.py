@@ -1,9 +1,28 @@
+import argparse
 import asyncio
+import os
+import time
 from playwright.async_api import async_playwright
 import re
 import json
 
-BASE_URL = "https://tds.s-anand.net"
+# Docsify course site; --base-url and --sidebar scrape another course or term
+BASE_URL = os.getenv("COURSE_BASE_URL", "https://tds.s-anand.net")
+OUTPUT_FILE = "anand_scraped.jsonl"
+CONCURRENCY = 8  # pages open at once in the shared browser
+PAGE_TIMEOUT = 15000  # ms
+
+# Requests that don't affect the rendered text
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = ("google-analytics.com", "googletagmanager.com", "doubleclick.net")
+
+# Docsify renders the page's markdown into .markdown-section; ready once it has real text
+CONTENT_READY_JS = """() => {
+    const el = document.querySelector(".markdown-section");
+    if (!el) return false;
+    const text = el.innerText.trim();
+    return text.length > 0 && !/^Loading/.test(text);
+}"""
 
 # Paste full _sidebar.md content here (or load from file)
 sidebar_md = """
@@ -126,38 +145,90 @@ def extract_slugs_from_sidebar(md_text):
     slugs = [f.replace(".md", "") for f in filenames]
     return sorted(set(slugs))  # deduplicate
 
-async def scrape_page(playwright, slug):
-    browser = await playwright.chromium.launch()
-    page = await browser.new_page()
+async def block_unneeded(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(h in request.url for h in BLOCKED_HOSTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def scrape_page(page, slug):
     url = f"{BASE_URL}/#/{slug}"
     print(f"🔍 Visiting: {url}")
-    await page.goto(url)
+    start = time.perf_counter()
     try:
-        await page.wait_for_selector("main", timeout=10000)
-        await asyncio.sleep(1.5)  # ensure Vue renders markdown
+        # Pages are reused, and moving between slugs only changes the hash, so
+        # clear the previous article first to avoid reading stale content
+        await page.evaluate("() => { const el = document.querySelector('.markdown-section'); if (el) el.innerHTML = ''; }")
+        await page.goto(url, wait_until="domcontentloaded", timeout=PAGE_TIMEOUT)
+        await page.wait_for_function(CONTENT_READY_JS, timeout=PAGE_TIMEOUT)
         content = await page.inner_text("main")
+        # Rendered article with its heading anchors, for structure-aware chunking
+        html = await page.inner_html(".markdown-section")
     except Exception as e:
         content = f"[ERROR: {e}]"
-    await browser.close()
+        html = ""
     return {
         "title": slug.replace("-", " ").title(),
         "content": content,
+        "html": html,
         "url": url
-    }
+    }, time.perf_counter() - start
 
-async def main():
-    slugs = extract_slugs_from_sidebar(sidebar_md)
+async def main(concurrency=CONCURRENCY, sidebar=sidebar_md):
+    slugs = extract_slugs_from_sidebar(sidebar)
     print(f"✅ Found {len(slugs)} slugs from _sidebar.md")
 
-    results = []
+    queue = asyncio.Queue()
+    for slug in slugs:
+        queue.put_nowait(slug)
+    timings = []
+    start = time.perf_counter()
+
     async with async_playwright() as playwright:
-        for slug in slugs:
-            post = await scrape_page(playwright, slug)
-            results.append(post)
+        # One browser and context for the whole crawl; each worker reuses one page
+        browser = await playwright.chromium.launch()
+        context = await browser.new_context()
+        await context.route("**/*", block_unneeded)
+
+        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+            async def worker():
+                page = await context.new_page()
+                while not queue.empty():
+                    slug = queue.get_nowait()
+                    post, elapsed = await scrape_page(page, slug)
+                    # Write each page as soon as it's done
+                    f.write(json.dumps(post, ensure_ascii=False) + "\n")
+                    f.flush()
+                    ok = not post["content"].startswith("[ERROR")
+                    timings.append((slug, elapsed, len(post["content"]), ok))
+                    print(f"{'✅' if ok else '❌'} {slug}: {elapsed:.2f}s")
+                await page.close()
+
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, len(slugs)))))
+
+        await browser.close()
 
-    with open("anand_scraped.jsonl", "w", encoding="utf-8") as f:
-        for item in results:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
-    print("✅ All pages saved to anand_scraped.jsonl")
+    total = time.perf_counter() - start
+    print("\n⏱️ Timing report (slowest first)")
+    print(f"{'slug':<45} {'seconds':>8} {'chars':>8}")
+    for slug, elapsed, chars, ok in sorted(timings, key=lambda t: -t[1]):
+        print(f"{slug:<45} {elapsed:>8.2f} {chars:>8}{'' if ok else '  ERROR'}")
+    times = sorted(t[1] for t in timings)
+    if times:
+        print(f"{len(times)} pages in {total:.1f}s with {concurrency} workers "
+              f"(median {times[len(times) // 2]:.2f}s, max {times[-1]:.2f}s per page)")
+    print(f"✅ All pages saved to {OUTPUT_FILE}")
 
-asyncio.run(main())
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Scrape course pages into anand_scraped.jsonl")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--base-url", default=BASE_URL, help="course site (Docsify)")
+    ap.add_argument("--sidebar", help="the site's _sidebar.md (defaults to the TDS sidebar above)")
+    args = ap.parse_args()
+    BASE_URL = args.base_url.rstrip("/")
+    sidebar = sidebar_md
+    if args.sidebar:
+        with open(args.sidebar, "r", encoding="utf-8") as f:
+            sidebar = f.read()
+    asyncio.run(main(args.concurrency, sidebar))
@@ -0,0 +1,241 @@
+import json
+import math
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+# --- CONFIG ---
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+METRICS = ("l2", "ip")  # "ip" = inner product on L2-normalized vectors (cosine)
+DEFAULT_PARAMS = {
+    "nlist": None,  # IVF cells; None = 4 * sqrt(n), capped so each cell gets ~39 training points
+    "nprobe": 16,  # IVF cells visited per query
+    "pq_m": 48,  # PQ sub-quantizers (must divide the dimension)
+    "pq_nbits": 8,  # bits per PQ code
+    "hnsw_m": 32,  # HNSW graph degree
+    "ef_construction": 200,
+    "ef_search": 64,  # HNSW candidate list size per query
+}
+EXACT_SEARCH_ROWS = 4096  # filters matching at most this many rows are searched exactly
+MAX_FILTERED_EF_SEARCH = 2048  # cap on the efSearch of selective filtered HNSW searches
+
+
+def info_path(index_path: str) -> str:
+    # semantic_index.faiss -> semantic_index.json
+    return os.path.splitext(index_path)[0] + ".json"
+
+
+def ids_path(index_path: str) -> str:
+    # semantic_index.faiss -> semantic_index.ids.npy (ids currently in the index)
+    return os.path.splitext(index_path)[0] + ".ids.npy"
+
+
+def supports_updates(info: dict) -> bool:
+    # HNSW graphs can't delete vectors, so they are always rebuilt
+    return bool(info.get("ids")) and info["type"] != "hnsw"
+
+
+def _base_index(index: faiss.Index) -> faiss.Index:
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _nlist_for(n: int, nlist: Optional[int]) -> int:
+    if nlist is None:
+        nlist = int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // 39 or 1))
+
+
+def build_index(
+    embeddings: np.ndarray, index_type: str = "flat", metric: str = "l2",
+    ids: Optional[np.ndarray] = None, **params
+) -> Tuple[faiss.Index, dict]:
+    """Build and fill a FAISS index of the given type.
+
+    With `ids`, vectors are stored under those stable ids (IVF natively, other
+    types through IndexIDMap2) so the index can later be updated in place;
+    otherwise search results are row numbers.
+
+    Returns the index and an info dict (type, metric, parameters, size) that
+    `save_index` stores next to it so readers can query it the same way.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; choose from {INDEX_TYPES}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}; choose from {METRICS}")
+    params = {**DEFAULT_PARAMS, **{k: v for k, v in params.items() if v is not None}}
+
+    vectors = np.ascontiguousarray(embeddings, dtype="float32")
+    n, dim = vectors.shape
+    if metric == "ip":
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+        params = {}
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss_metric)
+        index.hnsw.efConstruction = params["ef_construction"]
+        params = {k: params[k] for k in ("hnsw_m", "ef_construction", "ef_search")}
+    else:
+        nlist = _nlist_for(n, params["nlist"])
+        quantizer = faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss_metric)
+            params = {"nlist": nlist, "nprobe": params["nprobe"]}
+        else:
+            if dim % params["pq_m"]:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the dimension {dim}")
+            index = faiss.IndexIVFPQ(
+                quantizer, dim, nlist, params["pq_m"], params["pq_nbits"], faiss_metric
+            )
+            params = {
+                "nlist": nlist,
+                "nprobe": params["nprobe"],
+                "pq_m": params["pq_m"],
+                "pq_nbits": params["pq_nbits"],
+            }
+        index.train(vectors)
+
+    if ids is None:
+        index.add(vectors)
+    else:
+        if index_type in ("flat", "hnsw"):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+    info = {
+        "type": index_type,
+        "metric": metric,
+        "params": params,
+        "count": int(index.ntotal),
+        "dim": dim,
+        "ids": ids is not None,
+    }
+    apply_search_params(index, info)
+    return index, info
+
+
+def apply_search_params(index: faiss.Index, info: dict, nprobe: Optional[int] = None,
+                        ef_search: Optional[int] = None):
+    # Search-time knobs aren't all saved in the .faiss file, so set them on load
+    params = info.get("params", {})
+    if info["type"] in ("ivf_flat", "ivf_pq"):
+        faiss.extract_index_ivf(index).nprobe = nprobe or params.get("nprobe", DEFAULT_PARAMS["nprobe"])
+    elif info["type"] == "hnsw":
+        _base_index(index).hnsw.efSearch = ef_search or params.get("ef_search", DEFAULT_PARAMS["ef_search"])
+
+
+def enable_reconstruct(index: faiss.Index, info: dict):
+    """Let `reconstruct` read vectors back by id. Flat/HNSW indexes (IndexIDMap2
+    when they have ids) already can; IVF needs a direct map from id to list
+    position, a hash table when ids are stable chunk ids."""
+    if info["type"] in ("ivf_flat", "ivf_pq"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable if info.get("ids") else faiss.DirectMap.Array)
+
+
+def reconstruct(index: faiss.Index, ids) -> np.ndarray:
+    # Stored vectors of `ids` (approximate for IVF-PQ); normalized if the metric is "ip"
+    return index.reconstruct_batch(np.ascontiguousarray(ids, dtype=np.int64))
+
+
+def row_selector(info: dict, bitmap: np.ndarray, ids: Optional[np.ndarray] = None) -> faiss.IDSelector:
+    """IDSelector for the corpus rows set in `bitmap` (packed, little bit order).
+
+    Indexes without ids return corpus rows, so the bitmap is used as-is; with
+    ids the selected rows' chunk ids go into a hash set. The selector doesn't
+    copy the bitmap: keep it alive as long as the selector."""
+    if not info.get("ids"):
+        # n is the bitmap's size in bytes; rows past its end are never selected
+        return faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    rows = np.flatnonzero(np.unpackbits(bitmap, count=len(ids), bitorder="little"))
+    return faiss.IDSelectorBatch(np.ascontiguousarray(ids[rows], dtype=np.int64))
+
+
+def search_params(index: faiss.Index, info: dict, selector: faiss.IDSelector,
+                  selected: float = 1.0) -> faiss.SearchParameters:
+    """Search parameters restricted to `selector`, which keeps the fraction
+    `selected` of the rows.
+
+    The index's nprobe / efSearch are scaled by 1 / `selected`, so a filtered
+    search still visits about as many matching vectors as an unfiltered one
+    and fills k: IVF up to every list (exhaustive), HNSW up to
+    MAX_FILTERED_EF_SEARCH."""
+    scale = 1 / max(selected, 1e-9)
+    if info["type"] in ("ivf_flat", "ivf_pq"):
+        ivf = faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, math.ceil(ivf.nprobe * scale)))
+    if info["type"] == "hnsw":
+        ef_search = _base_index(index).hnsw.efSearch
+        return faiss.SearchParametersHNSW(
+            sel=selector, efSearch=max(ef_search, min(MAX_FILTERED_EF_SEARCH, math.ceil(ef_search * scale)))
+        )
+    return faiss.SearchParameters(sel=selector)
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int, info: dict) -> np.ndarray:
+    """Positions in `vectors` of each query's k nearest (-1 padded), by brute
+    force with the index's metric. For filters matching so few rows that
+    scanning them beats the index."""
+    metric = faiss.METRIC_INNER_PRODUCT if info["metric"] == "ip" else faiss.METRIC_L2
+    _, positions = faiss.knn(queries, prepare_queries(vectors, info), min(k, len(vectors)), metric)
+    return positions
+
+
+def update_index(index: faiss.Index, info: dict, add_vectors: np.ndarray,
+                 add_ids: np.ndarray, remove_ids: np.ndarray):
+    """Apply a delta in place: drop `remove_ids`, then add the new vectors."""
+    if not supports_updates(info):
+        raise ValueError(f"{info['type']} index without ids can't be updated in place")
+    if len(remove_ids):
+        index.remove_ids(faiss.IDSelectorBatch(np.ascontiguousarray(remove_ids, dtype=np.int64)))
+    if len(add_ids):
+        vectors = prepare_queries(add_vectors, info)
+        index.add_with_ids(vectors, np.ascontiguousarray(add_ids, dtype=np.int64))
+    info["count"] = int(index.ntotal)
+
+
+def save_index(index: faiss.Index, info: dict, path: str, ids: Optional[np.ndarray] = None):
+    # Index and id list go first; the info file is written last
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    if ids is not None:
+        np.save(ids_path(path) + ".tmp.npy", np.asarray(ids, dtype=np.int64))
+        os.replace(ids_path(path) + ".tmp.npy", ids_path(path))
+    os.replace(tmp_path, path)
+    with open(info_path(path) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    os.replace(info_path(path) + ".tmp", info_path(path))
+
+
+def load_index_ids(path: str) -> Optional[np.ndarray]:
+    if not os.path.exists(ids_path(path)):
+        return None
+    return np.load(ids_path(path))
+
+
+def load_index(path: str, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[faiss.Index, dict]:
+    index = faiss.read_index(path)
+    if os.path.exists(info_path(path)):
+        with open(info_path(path), "r", encoding="utf-8") as f:
+            info = json.load(f)
+    else:
+        # Indexes built before the info file existed were always flat L2
+        info = {"type": "flat", "metric": "l2", "params": {}, "count": int(index.ntotal), "dim": index.d}
+    apply_search_params(index, info, nprobe=nprobe, ef_search=ef_search)
+    return index, info
+
+
+def prepare_queries(vectors: np.ndarray, info: dict) -> np.ndarray:
+    # Queries must be normalized the same way as the indexed vectors
+    vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, info["dim"])
+    if info["metric"] == "ip":
+        vectors = vectors.copy()
+        faiss.normalize_L2(vectors)
+    return vectors
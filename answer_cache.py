@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+# --- CONFIG ---
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 24 * 3600  # seconds
+DEFAULT_SIMILARITY = 0.95  # cosine similarity for a near-duplicate hit
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def normalize_question(question: str) -> str:
+    # Case, punctuation and whitespace differences shouldn't miss the cache
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def index_fingerprint(path: str) -> str:
+    # Changes whenever the FAISS index file is rebuilt
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+class AnswerCache:
+    """LRU + TTL cache of answers keyed on the normalized question.
+
+    Besides exact matches, `get_similar` returns the answer of a previously seen
+    question whose embedding has cosine similarity >= `similarity`. Entries are
+    bound by count and by an estimate of their size in bytes, and the whole
+    cache is dropped when the index version changes. Answers from different
+    indexes (e.g. per-course shards) are kept apart by `scope`.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+        similarity: float = DEFAULT_SIMILARITY,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        path: Optional[str] = None,
+        index_version: str = "",
+    ):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.max_bytes = max_bytes
+        self.path = path
+        self.index_version = index_version
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> entry dict, oldest first
+        # Unit-norm question embeddings, one row per slot
+        self._vectors = np.zeros((max_entries, dim), dtype="float32")
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._bytes = 0
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- lookups ---
+    def get_exact(self, question: str, scope: str = "") -> Optional[dict]:
+        key = self._key(question, scope)
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry["value"]
+
+    def get_similar(self, embedding: np.ndarray, scope: str = "") -> Optional[dict]:
+        if self.similarity > 1:
+            self.stats["misses"] += 1
+            return None
+        query = self._unit(embedding)
+        with self._lock:
+            while self._entries:
+                used = [e["slot"] for e in self._entries.values() if e["scope"] == scope]
+                if not used:
+                    break
+                sims = self._vectors[used] @ query
+                best = int(np.argmax(sims))
+                if sims[best] < self.similarity:
+                    break
+                key = self._slot_keys[used[best]]
+                entry = self._live_entry(key)
+                if entry is None:
+                    continue  # expired and evicted; look again
+                self._entries.move_to_end(key)
+                self.stats["semantic_hits"] += 1
+                return entry["value"]
+            self.stats["misses"] += 1
+            return None
+
+    # --- updates ---
+    def put(self, question: str, embedding: np.ndarray, value: dict, scope: str = ""):
+        self._put(self._key(question, scope), embedding, value, scope)
+
+    def _put(self, key: str, embedding: np.ndarray, value: dict, scope: str, expires: Optional[float] = None):
+        size = self._size_of(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and (
+                not self._free_slots or self._bytes + size > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+            slot = self._free_slots.pop()
+            self._vectors[slot] = self._unit(embedding)
+            self._slot_keys[slot] = key
+            self._entries[key] = {
+                "value": value,
+                "scope": scope,
+                "slot": slot,
+                "expires": expires or time.time() + self.ttl,
+                "size": size,
+            }
+            self._bytes += size
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def set_index_version(self, version: str):
+        # Answers were built from the old index's chunks; drop them all
+        if version != self.index_version:
+            self.clear()
+            self.index_version = version
+
+    def info(self) -> dict:
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "llm_calls_saved": hits,
+        }
+
+    # --- persistence ---
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            rows = [
+                {
+                    "key": key,
+                    "scope": e["scope"],
+                    "value": e["value"],
+                    "expires": e["expires"],
+                    "embedding": self._vectors[e["slot"]].tolist(),
+                }
+                for key, e in self._entries.items()
+                if e["expires"] > now
+            ]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"index_version": self.index_version}) + "\n")
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        now = time.time()
+        skipped = 0
+        # A damaged or truncated cache file only costs the entries it lost
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline() or "{}")
+                if header.get("index_version") != self.index_version:
+                    print("Answer cache was built for another index version, ignoring it.")
+                    return
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                        if row["expires"] <= now:
+                            continue
+                        self._put(row["key"], np.array(row["embedding"], dtype="float32"), row["value"],
+                                  row.get("scope", ""), row["expires"])
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        skipped += 1
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Can't read the answer cache {self.path} ({e}), starting empty.")
+            return
+        if skipped:
+            print(f"Skipped {skipped} unreadable entries in {self.path}")
+        print(f"Loaded {len(self._entries)} cached answers from {self.path}")
+
+    # --- internals (caller holds the lock) ---
+    @staticmethod
+    def _key(question: str, scope: str) -> str:
+        key = normalize_question(question)
+        return f"{scope}|{key}" if scope else key
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires"] <= time.time():
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._slot_keys[entry["slot"]] = None
+        self._free_slots.append(entry["slot"])
+        self._bytes -= entry["size"]
+
+    def _unit(self, embedding):
+        vec = np.asarray(embedding, dtype="float32").reshape(-1)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _size_of(self, key, value):
+        return len(key) + len(json.dumps(value)) + self.dim * 4
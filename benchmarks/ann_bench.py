@@ -0,0 +1,130 @@
+"""Recall@k, query latency and memory of the ANN index types in ann_index.py.
+
+Builds every index type over a synthetic clustered corpus (MiniLM-sized,
+384-d) and compares it with the exact flat index:
+
+    python benchmarks/ann_bench.py --n 100000 --queries 1000
+    python benchmarks/ann_bench.py --n 1000000 --types flat ivf_pq hnsw --metric ip
+    python benchmarks/ann_bench.py --n 100000 --selectivity 0.5 0.1 0.01
+
+Memory is the serialized index size, which is what a server keeps resident.
+--selectivity also times filtered searches (an IDSelector over a random
+bitset keeping that fraction of rows, as filtered retrieval does), with
+recall against the exact filtered results.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import INDEX_TYPES, build_index, prepare_queries, row_selector, search_params
+
+
+def synthetic_corpus(n, dim, n_queries, seed=0):
+    # Gaussian clusters, roughly like topic-grouped sentence embeddings
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, n // 500)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    data = np.empty((n, dim), dtype="float32")
+    for start in range(0, n, 100_000):
+        end = min(n, start + 100_000)
+        labels = rng.integers(0, n_clusters, end - start)
+        data[start:end] = centers[labels] + 0.5 * rng.standard_normal((end - start, dim), dtype="float32")
+    labels = rng.integers(0, n_clusters, n_queries)
+    queries = centers[labels] + 0.5 * rng.standard_normal((n_queries, dim), dtype="float32")
+    return data, queries
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k]) & set(t[:k]) - {-1}) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def single_query_ms(index, q, k, params=None):
+    # p50 / p99 of one-query searches, like the serving path
+    latencies = []
+    for row in q[: min(200, len(q))]:
+        start = time.perf_counter()
+        index.search(row.reshape(1, -1), k, params=params)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return (round(latencies[len(latencies) // 2] * 1000, 3),
+            round(latencies[int(len(latencies) * 0.99)] * 1000, 3))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--metric", choices=("l2", "ip"), default="l2")
+    ap.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    ap.add_argument("--nprobe", type=int, default=None)
+    ap.add_argument("--ef-search", type=int, default=None)
+    ap.add_argument("--selectivity", type=float, nargs="*", default=[],
+                    help="fractions of rows kept by filtered searches")
+    ap.add_argument("--json", help="also write results to this file")
+    args = ap.parse_args()
+
+    print(f"Generating {args.n} x {args.dim} corpus...")
+    data, queries = synthetic_corpus(args.n, args.dim, args.queries)
+
+    rng = np.random.default_rng(1)
+    bitmaps = {s: np.packbits(rng.random(args.n) < s, bitorder="little") for s in args.selectivity}
+    results = []
+    truth = None
+    filtered_truth = {}
+    for index_type in ["flat"] + [t for t in args.types if t != "flat"]:
+        start = time.perf_counter()
+        index, info = build_index(data, index_type, args.metric,
+                                  nprobe=args.nprobe, ef_search=args.ef_search)
+        build_s = time.perf_counter() - start
+        q = prepare_queries(queries, info)
+
+        # Batch throughput, then single-query latency like the serving path
+        start = time.perf_counter()
+        _, found = index.search(q, args.k)
+        batch_qps = len(q) / (time.perf_counter() - start)
+        p50, p99 = single_query_ms(index, q, args.k)
+
+        if truth is None:
+            truth = found
+        result = {
+            "type": index_type,
+            "metric": args.metric,
+            "params": info["params"],
+            "build_s": round(build_s, 2),
+            f"recall@{args.k}": round(recall_at_k(found, truth, args.k), 4),
+            "p50_ms": p50,
+            "p99_ms": p99,
+            "batch_qps": round(batch_qps, 1),
+            "memory_mb": round(faiss.serialize_index(index).nbytes / 2**20, 1),
+        }
+        for selectivity, bitmap in bitmaps.items():
+            params = search_params(index, info, row_selector(info, bitmap), selectivity)
+            _, found = index.search(q, args.k, params=params)
+            filtered_truth.setdefault(selectivity, found)
+            p50, _ = single_query_ms(index, q, args.k, params)
+            result[f"filtered_{selectivity:g}"] = {
+                f"recall@{args.k}": round(recall_at_k(found, filtered_truth[selectivity], args.k), 4),
+                "p50_ms": p50,
+            }
+        results.append(result)
+        if index_type in args.types:
+            print(json.dumps(result))
+        del index
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"n": args.n, "dim": args.dim, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Latency/throughput of retrieval with and without query micro-batching.
+
+Runs in-process against the real model and index (run from the repo root):
+
+    python benchmarks/batching_bench.py --concurrency 1 8 32 64 --queries 512
+
+"unbatched" runs embed + search per query in the threadpool, like
+`get_relevant_chunks`; "batched" goes through MicroBatcher, which merges the
+queries that arrive together into one encode and one index.search call.
+
+Per-stage p50/p95/p99 come from the app's own spans: every stage for
+"unbatched" (encode, index_search, bm25_search, rerank, ...), and the embed /
+search waits for "batched", whose inner stages are shared by the batch. Use
+INDEX_PATH / CORPUS_PREFIX to run against a synthetic corpus (synth_corpus.py),
+--questions for its question file, and --json to save the results.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.concurrency import run_in_threadpool
+
+import main
+from bench_common import load_questions, summarize, summarize_stages, write_results
+from metrics import collect_timings, span
+from query_batcher import MicroBatcher
+
+QUESTIONS = [
+    "How do I deploy to Vercel?",
+    "What is the deadline for GA4?",
+    "How do I install uv?",
+    "Which Python version should I use?",
+    "npx command not found",
+    "How are the project marks computed?",
+    "Docker build fails with permission denied",
+    "How to use Playwright for scraping?",
+]
+
+
+async def run(retrieve, questions, concurrency, total):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    timings = []
+
+    async def one(i):
+        # Make every question unique so nothing is answered from a cache
+        question = f"{questions[i % len(questions)]} #{i}"
+        async with semaphore:
+            start = time.perf_counter()
+            timings.append(await retrieve(question))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "qps": round(total / elapsed, 2),
+        "latency": summarize(latencies),
+        "stages": summarize_stages(timings),
+    }
+
+
+async def main_async(args):
+    main.load_resources()
+    questions = load_questions(args.questions, QUESTIONS)
+
+    def timed_retrieve(question):
+        with collect_timings(all_stages=True) as timings:
+            main.get_relevant_chunks(question, 5)
+        return timings
+
+    async def unbatched(question):
+        return await run_in_threadpool(timed_retrieve, question)
+
+    embed = MicroBatcher(main.embed_questions, args.batch_size, args.wait_ms)
+    search = MicroBatcher(main.search_chunks_batch, args.batch_size, args.wait_ms)
+
+    async def batched(question):
+        with collect_timings() as timings:
+            with span("embed"):
+                embedding = await embed.submit(question)
+            with span("search"):
+                await search.submit((question, embedding, 5))
+        return timings
+
+    # Warm up the model and threadpool
+    await run(unbatched, questions, 4, 16)
+
+    results = []
+    print(f"{'mode':<10} {'conc':>5} {'qps':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}")
+    for concurrency in args.concurrency:
+        for name, fn in (("unbatched", unbatched), ("batched", batched)):
+            r = await run(fn, questions, concurrency, args.queries)
+            results.append({"bench": "retrieval", "mode": name, "corpus": len(main.generation.corpus), **r})
+            lat = r["latency"]
+            print(f"{name:<10} {concurrency:>5} {r['qps']:>8.1f} {lat['p50_ms']:>8.1f} "
+                  f"{lat['p95_ms']:>8.1f} {lat['p99_ms']:>8.1f}")
+    print(f"batched embed stats: {embed.info()}")
+    if args.json:
+        write_results(args.json, results)
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    ap.add_argument("--queries", type=int, default=512)
+    ap.add_argument("--batch-size", type=int, default=main.QUERY_BATCH_SIZE)
+    ap.add_argument("--wait-ms", type=float, default=main.QUERY_BATCH_WAIT_MS)
+    ap.add_argument("--questions", help="question file (one {\"question\": ...} per line)")
+    ap.add_argument("--json", help="write machine-readable results to this file")
+    asyncio.run(main_async(ap.parse_args()))
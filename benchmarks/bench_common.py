@@ -0,0 +1,72 @@
+"""Shared helpers for the benchmark scripts: latency percentiles and the
+machine-readable results file that run_suite.py compares across releases.
+
+A results file is one JSON object:
+
+    {"env": {"git": ..., "time": ..., "python": ..., "cpus": ...},
+     "results": [{"bench": "http", "corpus": 100000, "concurrency": 16,
+                  "qps": ..., "latency": {"p50_ms": ..., "p95_ms": ..., "p99_ms": ...},
+                  "stages": {"embed": {...}, "search": {...}, "llm": {...}}}, ...]}
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(seconds):
+    """p50/p95/p99/mean/max of a list of durations, in milliseconds."""
+    if not len(seconds):
+        return {}
+    ms = np.asarray(seconds, dtype="float64") * 1000
+    summary = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    summary.update(mean_ms=round(float(ms.mean()), 3), max_ms=round(float(ms.max()), 3))
+    return summary
+
+
+def summarize_stages(timings):
+    """Per-stage summaries of a list of {stage: seconds} dicts (one per request)."""
+    stages = {}
+    for t in timings:
+        for stage, seconds in t.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {stage: summarize(values) for stage, values in sorted(stages.items())}
+
+
+def environment():
+    try:
+        git = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                             capture_output=True, text=True).stdout.strip()
+    except OSError:
+        git = ""
+    return {
+        "git": git,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(path, results, **extra):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"env": environment(), **extra, "results": results}, f, indent=2)
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_questions(path, default):
+    if not path:
+        return list(default)
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
@@ -0,0 +1,60 @@
+"""Bulk encoding throughput of generate_embeddings.py per worker count.
+
+    python benchmarks/embed_bench.py --workers 1 2 4 8 --chunks 4000
+
+Encodes the first --chunks texts of chunks.jsonl through the same process
+pool generate_embeddings.py uses (threads per worker = cores / workers unless
+--threads is given) and prints one JSON line per worker count with chunks/sec.
+Nothing is written to the corpus.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_embeddings
+from encoder import BACKEND, BACKENDS, MODEL_NAME
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    ap.add_argument("--chunks", type=int, default=4000)
+    ap.add_argument("--threads", type=int, default=None)
+    ap.add_argument("--model", default=MODEL_NAME)
+    ap.add_argument("--backend", default=BACKEND, choices=BACKENDS)
+    args = ap.parse_args()
+
+    with open(generate_embeddings.INPUT_FILE, "r", encoding="utf-8") as f:
+        texts = [json.loads(line)["text"] for line in islice(f, args.chunks)]
+    batches = [texts[i:i + generate_embeddings.READ_BATCH]
+               for i in range(0, len(texts), generate_embeddings.READ_BATCH)]
+    cores = os.cpu_count() or 1
+    print(f"{len(texts)} chunks, {cores} cores, {args.model} ({args.backend})")
+
+    for workers in sorted(set(args.workers)):
+        threads = args.threads or max(1, cores // workers)
+        initargs = (args.model, args.backend, threads)
+        with ProcessPoolExecutor(workers, initializer=generate_embeddings._init_worker,
+                                 initargs=initargs) as pool:
+            # Load the model in every worker before timing
+            list(pool.map(generate_embeddings._encode, [["warm-up"]] * workers))
+            start = time.perf_counter()
+            encoded = sum(len(v) for v in pool.map(generate_embeddings._encode, batches))
+            elapsed = time.perf_counter() - start
+        print(json.dumps({
+            "workers": workers,
+            "threads_per_worker": threads,
+            "chunks": encoded,
+            "seconds": round(elapsed, 3),
+            "chunks_per_s": round(encoded / elapsed, 1),
+        }))
+
+
+if __name__ == "__main__":
+    main()
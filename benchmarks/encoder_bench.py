@@ -0,0 +1,96 @@
+"""CPU encode throughput and retrieval drift of the embedding backends.
+
+Export the model with its ONNX copies first:
+
+    python encoder.py export all-MiniLM-L6-v2 --onnx --quantize
+    python benchmarks/encoder_bench.py --backends torch onnx onnx-int8 --docs 2000
+
+Encodes a sample of corpus chunks and the labeled eval questions with every
+backend and prints one JSON line per backend:
+
+    docs_per_s       chunk texts encoded per second (batch of --batch-size)
+    query_ms         median latency of encoding one question
+    cosine_mean/min  similarity of its chunk vectors to the first backend's
+    overlap@k        share of each question's top-k sample chunks that the
+                     first backend also ranks in its top-k
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus_store import CORPUS_PREFIX, CorpusStore
+from encoder import BACKENDS, MODEL_NAME, Encoder
+
+
+def unit(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(queries, docs, k):
+    scores = unit(queries) @ unit(docs).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=MODEL_NAME)
+    ap.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    ap.add_argument("--docs", type=int, default=2000, help="corpus chunks to encode")
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--questions", default=os.path.join(os.path.dirname(__file__), "eval_questions.jsonl"))
+    args = ap.parse_args()
+
+    corpus = CorpusStore(CORPUS_PREFIX)
+    step = max(1, len(corpus) // args.docs)
+    docs = [corpus.field(i, "text") for i in range(0, len(corpus), step)][:args.docs]
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip()]
+    print(f"{len(docs)} chunks, {len(questions)} questions, model {args.model}")
+
+    reference = None
+    for backend in args.backends:
+        encoder = Encoder(args.model, backend, threads=args.threads)
+        encoder.encode(docs[:args.batch_size], batch_size=args.batch_size)  # warm-up
+
+        start = time.perf_counter()
+        doc_vectors = encoder.encode(docs, batch_size=args.batch_size)
+        docs_per_s = len(docs) / (time.perf_counter() - start)
+
+        query_times = []
+        query_vectors = []
+        for question in questions:
+            start = time.perf_counter()
+            query_vectors.append(encoder.encode([question])[0])
+            query_times.append(time.perf_counter() - start)
+        query_vectors = np.array(query_vectors)
+
+        ranked = top_k(query_vectors, doc_vectors, args.k)
+        result = {
+            "backend": backend,
+            "docs_per_s": round(docs_per_s, 1),
+            "query_ms": round(statistics.median(query_times) * 1000, 2),
+        }
+        if reference is None:
+            reference = (doc_vectors, ranked)
+        else:
+            cosine = (unit(doc_vectors) * unit(reference[0])).sum(axis=1)
+            overlap = [len(set(a) & set(b)) / args.k for a, b in zip(ranked, reference[1])]
+            result.update(
+                cosine_mean=round(float(cosine.mean()), 5),
+                cosine_min=round(float(cosine.min()), 5),
+                **{f"overlap@{args.k}": round(float(np.mean(overlap)), 3)},
+            )
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Local fake of the Discourse JSON API used by discourse_scraper.py.
+
+Serves a synthetic category with long topics (so the crawler has to follow
+post_stream.stream), injects latency and random 429/503 responses, and counts
+requests:
+
+    python benchmarks/fake_discourse_server.py --port 9100 --topics 200 --fail-rate 0.05
+    DISCOURSE_BASE_URL=http://127.0.0.1:9100 python discourse_scraper.py
+
+POST /bump/{topic_id} adds a reply to a topic (to test incremental crawls) and
+GET /stats returns request counters.
+"""
+import argparse
+import asyncio
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+
+PAGE_SIZE = 30
+config = {"latency": 0.05, "fail_rate": 0.0}
+topics = {}
+stats = {"requests": 0, "errors_injected": 0, "in_flight": 0, "peak_in_flight": 0}
+
+
+def make_topics(n, seed=0):
+    rng = random.Random(seed)
+    next_post_id = 1
+    for i in range(n):
+        tid = 1000 + i
+        posts = []
+        for number in range(1, rng.randint(1, 60) + 1):
+            posts.append({"id": next_post_id, "post_number": number,
+                          "cooked": f"<p>Topic {tid} post {number}</p>"})
+            next_post_id += 1
+        topics[tid] = {
+            "id": tid,
+            "title": f"Topic {tid}",
+            "created_at": f"2025-{1 + i % 3:02d}-{1 + i % 28:02d}T10:00:00.000Z",
+            "bumped_at": "2025-04-01T00:00:00.000Z",
+            "posts": posts,
+        }
+    return next_post_id
+
+
+def listing_entry(topic):
+    return {"id": topic["id"], "title": topic["title"], "created_at": topic["created_at"],
+            "bumped_at": topic["bumped_at"], "posts_count": len(topic["posts"])}
+
+
+@app.middleware("http")
+async def simulate(request: Request, call_next):
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    try:
+        if request.url.path.startswith(("/c/", "/t/")):
+            await asyncio.sleep(config["latency"])
+            if random.random() < config["fail_rate"]:
+                stats["errors_injected"] += 1
+                return JSONResponse({"error": "try again"}, status_code=random.choice([429, 503]))
+        return await call_next(request)
+    finally:
+        stats["in_flight"] -= 1
+
+
+@app.get("/c/{slug:path}/{category_id}.json")
+async def category(slug: str, category_id: int, page: int = 0):
+    ordered = list(topics.values())[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+    return {"topic_list": {"topics": [listing_entry(t) for t in ordered]}}
+
+
+@app.get("/t/{topic_id}.json")
+async def topic(topic_id: int):
+    t = topics.get(topic_id)
+    if t is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return {"id": topic_id, "title": t["title"],
+            "post_stream": {"posts": t["posts"][:20], "stream": [p["id"] for p in t["posts"]]}}
+
+
+@app.get("/t/{topic_id}/posts.json")
+async def topic_posts(topic_id: int, request: Request):
+    wanted = {int(pid) for pid in request.query_params.getlist("post_ids[]")}
+    posts = [p for p in topics[topic_id]["posts"] if p["id"] in wanted]
+    return {"post_stream": {"posts": posts}}
+
+
+@app.post("/bump/{topic_id}")
+async def bump(topic_id: int):
+    t = topics[topic_id]
+    number = len(t["posts"]) + 1
+    t["posts"].append({"id": 10_000_000 + topic_id * 1000 + number, "post_number": number,
+                       "cooked": f"<p>Topic {topic_id} reply {number}</p>"})
+    t["bumped_at"] = f"2025-04-02T00:00:{number % 60:02d}.000Z"
+    return listing_entry(t)
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/stats/reset")
+async def reset_stats():
+    stats.update(requests=0, errors_injected=0, in_flight=0, peak_in_flight=0)
+    return stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--topics", type=int, default=200)
+    ap.add_argument("--latency", type=float, default=config["latency"])
+    ap.add_argument("--fail-rate", type=float, default=config["fail_rate"])
+    args = ap.parse_args()
+    config.update(latency=args.latency, fail_rate=args.fail_rate)
+    make_topics(args.topics)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,117 @@
+"""Concurrency load test for POST /api/ (or /api/stream) against the local stub LLM.
+
+Start the stub and the app first (see stub_llm_server.py) with the answer cache
+disabled (ANSWER_CACHE_SIZE=0) so every question reaches the LLM, and with
+TIMING_HEADER=1 for the per-stage breakdown, then:
+
+    python benchmarks/load_test.py --concurrency 1 4 16 32
+    python benchmarks/load_test.py --stream --json results/http.json
+
+For each concurrency level it fires `requests` questions with at most
+`concurrency` outstanding and reports questions/sec, p50/p95/p99 latency
+(time to first byte too with --stream), the peak number of LLM calls the stub
+saw in flight at once, and p50/p95/p99 of every stage from X-Timing.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_common import load_questions, summarize, summarize_stages, write_results
+from metrics import TIMING_HEADER, parse_timings
+
+QUESTIONS = [
+    "How do I deploy to Vercel?",
+    "What is the deadline for GA4?",
+    "How do I install uv?",
+    "Which Python version should I use?",
+]
+
+
+async def run_level(client, target, stub, questions, concurrency, total, stream=False, unique=False):
+    await client.post(f"{stub}/stats/reset")
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, first_bytes, timings = [], [], []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        question = questions[i % len(questions)]
+        if unique:
+            question = f"{question} #{i}"
+        async with semaphore:
+            start = time.perf_counter()
+            async with client.stream("POST", target, json={"question": question}) as res:
+                first_byte = None
+                async for _ in res.aiter_bytes():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - start
+            if res.status_code != 200:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+            first_bytes.append(first_byte or latencies[-1])
+            if TIMING_HEADER in res.headers:
+                timings.append(parse_timings(res.headers[TIMING_HEADER]))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    stats = (await client.get(f"{stub}/stats")).json()
+    result = {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "wall_s": round(elapsed, 3),
+        "qps": round((total - errors) / elapsed, 2),
+        "latency": summarize(latencies),
+        "peak_llm_in_flight": stats["peak_in_flight"],
+        "stages": summarize_stages(timings),
+    }
+    if stream:
+        result["first_byte"] = summarize(first_bytes)
+    return result
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--target", default="http://127.0.0.1:8000")
+    ap.add_argument("--stub", default="http://127.0.0.1:9000")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    ap.add_argument("--requests", type=int, default=64)
+    ap.add_argument("--stream", action="store_true", help="load POST /api/stream instead of /api/")
+    ap.add_argument("--questions", help="question file (one {\"question\": ...} per line)")
+    ap.add_argument("--unique", action="store_true", help="make every question unique (defeats caches)")
+    ap.add_argument("--json", help="write machine-readable results to this file")
+    args = ap.parse_args()
+    base = args.target.rstrip("/")
+    base = base[:-len("/api")] if base.endswith("/api") else base  # also accept the old .../api/ target
+    target = base + ("/api/stream" if args.stream else "/api/")
+    questions = load_questions(args.questions, QUESTIONS)
+
+    results = []
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        print(f"{'conc':>5} {'reqs':>5} {'errs':>5} {'qps':>7} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} "
+              f"{'llm_in_flight':>14}")
+        for level in args.concurrency:
+            r = await run_level(client, target, args.stub, questions, level, args.requests,
+                                args.stream, args.unique)
+            results.append({"bench": "http_stream" if args.stream else "http", **r})
+            lat = r["latency"] or {"p50_ms": 0, "p95_ms": 0, "p99_ms": 0}
+            print(f"{r['concurrency']:>5} {r['requests']:>5} {r['errors']:>5} {r['qps']:>7} "
+                  f"{lat['p50_ms']:>8.1f} {lat['p95_ms']:>8.1f} {lat['p99_ms']:>8.1f} {r['peak_llm_in_flight']:>14}")
+            for stage, s in r["stages"].items():
+                print(f"      {stage:<16} p50 {s['p50_ms']:>8.1f}  p95 {s['p95_ms']:>8.1f}  p99 {s['p99_ms']:>8.1f}")
+    if args.json:
+        write_results(args.json, results)
+    return results
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""Wall time and throughput of the offline pipeline scripts on synthetic documents.
+
+    python benchmarks/synth_corpus.py --n 10000 --docs
+    python benchmarks/pipeline_bench.py --data bench_data/10000 --json results/pipeline.json
+
+Runs split_into_chunks.py, generate_embeddings.py and faiss_index.py as the
+refresh job does, in <data>/pipeline (the raw documents are linked in), so
+the real model encodes the chunks. With --refresh (the default) it then runs
+the three stages again to time a no-change refresh, which should reuse every
+document's chunks and every vector; a refresh that writes a different
+chunks.jsonl (synth_corpus.py --docs includes a duplicated document) fails.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_common import REPO_ROOT, write_results
+
+RAW_FILES = ("anand_scraped.jsonl", "discourse_posts.jsonl")
+
+
+def count_lines(path):
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def run_stage(name, script, args, workdir, env):
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(REPO_ROOT, script), *args], cwd=workdir, env=env,
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        print(proc.stdout[-2000:], proc.stderr[-2000:])
+        raise SystemExit(f"{script} failed with exit code {proc.returncode}")
+    print(f"  {name:<16} {elapsed:>8.2f}s")
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", required=True, help="directory written by synth_corpus.py --docs")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="generate_embeddings.py --workers")
+    ap.add_argument("--chunk-workers", type=int, default=1, help="split_into_chunks.py --workers")
+    ap.add_argument("--type", default="flat", help="faiss_index.py --type")
+    ap.add_argument("--no-refresh", action="store_true", help="skip the second, no-change run")
+    ap.add_argument("--json", help="write machine-readable results to this file")
+    args = ap.parse_args()
+
+    workdir = os.path.join(args.data, "pipeline")
+    os.makedirs(workdir, exist_ok=True)
+    for name in RAW_FILES:
+        link = os.path.join(workdir, name)
+        if not os.path.exists(link):
+            os.symlink(os.path.abspath(os.path.join(args.data, name)), link)
+    # Start from scratch; the corpus and index paths are relative to the work dir
+    for name in os.listdir(workdir):
+        if name.startswith(("corpus.", "semantic_index.", "chunks.jsonl")):
+            os.remove(os.path.join(workdir, name))
+    env = {k: v for k, v in os.environ.items() if k not in ("CORPUS_PREFIX", "INDEX_PATH")}
+
+    docs = sum(count_lines(os.path.join(workdir, name)) for name in RAW_FILES)
+    print(f"{docs} documents in {workdir}")
+    stages = {
+        "chunk": run_stage("chunk", "split_into_chunks.py", ["--workers", str(args.chunk_workers)], workdir, env),
+    }
+    chunks = count_lines(os.path.join(workdir, "chunks.jsonl"))
+    stages["embed"] = run_stage("embed", "generate_embeddings.py", ["--workers", str(args.workers)], workdir, env)
+    stages["index"] = run_stage("index", "faiss_index.py", ["--type", args.type, "--rebuild"], workdir, env)
+    if not args.no_refresh:
+        with open(os.path.join(workdir, "chunks.jsonl"), "rb") as f:
+            first_chunks = f.read()
+        stages["refresh_chunk"] = run_stage("refresh_chunk", "split_into_chunks.py",
+                                            ["--workers", str(args.chunk_workers)], workdir, env)
+        with open(os.path.join(workdir, "chunks.jsonl"), "rb") as f:
+            if f.read() != first_chunks:
+                raise SystemExit("A no-change run of split_into_chunks.py changed chunks.jsonl")
+        stages["refresh_embed"] = run_stage("refresh_embed", "generate_embeddings.py",
+                                            ["--workers", str(args.workers)], workdir, env)
+        stages["refresh_index"] = run_stage("refresh_index", "faiss_index.py", ["--type", args.type], workdir, env)
+
+    result = {
+        "bench": "pipeline",
+        "documents": docs,
+        "corpus": chunks,
+        "workers": args.workers,
+        "stages_s": {name: round(seconds, 3) for name, seconds in stages.items()},
+        "chunks_per_s": {
+            "chunk": round(chunks / stages["chunk"], 1),
+            "embed": round(chunks / stages["embed"], 1),
+            "index": round(chunks / stages["index"], 1),
+        },
+    }
+    print(f"{chunks} chunks; chunks/sec: {result['chunks_per_s']}")
+    if args.json:
+        write_results(args.json, [result])
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""hit@k of dense vs hybrid (BM25 + vector, RRF) retrieval on a labeled question set,
+and of MMR diversification with different lambdas.
+
+Each line of the question file is {"question": ..., "urls": [expected urls]};
+a question counts as a hit at k if any of its top-k chunks comes from one of
+those urls. Run from the repo root after building the index:
+
+    python benchmarks/retrieval_eval.py --questions benchmarks/eval_questions.jsonl
+    python benchmarks/retrieval_eval.py --weights 0.3 0.5 0.7
+    python benchmarks/retrieval_eval.py --lambdas 1.0 0.7 0.5
+
+The per-url cap and similarity cutoff (RETRIEVAL_MAX_PER_URL,
+RETRIEVAL_MIN_SIMILARITY) apply as configured in the environment.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+KS = (1, 3, 5, 10)
+
+
+def evaluate(questions, mode):
+    hits = {k: 0 for k in KS}
+    elapsed = 0.0
+    for item in questions:
+        embedding = main.embed_question(item["question"])
+        start = time.perf_counter()
+        chunks = main.search_chunks(item["question"], embedding, max(KS), mode)
+        elapsed += time.perf_counter() - start
+        urls = [chunk["url"] for chunk in chunks]
+        for k in KS:
+            if any(u in item["urls"] for u in urls[:k]):
+                hits[k] += 1
+    n = len(questions)
+    return {f"hit@{k}": round(hits[k] / n, 3) for k in KS} | {"search_ms": round(elapsed / n * 1000, 3)}
+
+
+def main_cli():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", default=os.path.join(os.path.dirname(__file__), "eval_questions.jsonl"))
+    ap.add_argument("--weights", type=float, nargs="+", default=[main.HYBRID_SPARSE_WEIGHT],
+                    help="BM25 weights to try in hybrid mode")
+    ap.add_argument("--lambdas", type=float, nargs="+", default=[],
+                    help="MMR lambdas to try in the default retrieval mode (1 = no diversification)")
+    args = ap.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = [json.loads(line) for line in f if line.strip()]
+    main.load_resources()
+    if main.generation.bm25 is None:
+        print("No BM25 index found; run faiss_index.py first. Showing dense only.")
+
+    print(f"{len(questions)} questions")
+    print(json.dumps({"mode": "dense", **evaluate(questions, "dense")}))
+    if main.generation.bm25 is not None:
+        for weight in args.weights:
+            main.HYBRID_SPARSE_WEIGHT = weight
+            print(json.dumps({"mode": "hybrid", "sparse_weight": weight, **evaluate(questions, "hybrid")}))
+    for lambda_ in args.lambdas:
+        main.RETRIEVAL_MMR_LAMBDA = lambda_
+        print(json.dumps({"mode": main.RETRIEVAL_MODE, "mmr_lambda": lambda_, **evaluate(questions, None)}))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,156 @@
+"""Run the whole offline benchmark suite and compare it with a previous run.
+
+    python benchmarks/run_suite.py --sizes 1000 100000 --out results/$(git rev-parse --short HEAD).json
+    python benchmarks/run_suite.py --sizes 100000 --baseline results/v1.json --out results/v2.json
+
+For each corpus size it generates a synthetic corpus (synth_corpus.py, reused
+if bench_data/<n> exists), then runs:
+
+    retrieval   batching_bench.py in-process against that corpus
+    http        load_test.py against the app (uvicorn) and the stub LLM,
+    http_stream   both started here, for POST /api/ and POST /api/stream
+    pipeline    pipeline_bench.py (--pipeline; runs the real embedding model)
+
+and writes every result into one JSON file. With --baseline, results with the
+same bench/mode/corpus/concurrency are compared: p95 latency up or qps down by
+more than --tolerance is reported as a regression and the exit code is 1.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_common import REPO_ROOT, load_results, write_results
+
+BENCH_DIR = os.path.join(REPO_ROOT, "benchmarks")
+
+
+def python(script, *args, env=None):
+    subprocess.run([sys.executable, os.path.join(BENCH_DIR, script), *map(str, args)], env=env, check=True)
+
+
+def wait_for(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit(f"{url} not ready after {timeout}s")
+
+
+def run_http(args, data_dir, env, tmp):
+    stub_port, app_port = args.port + 1, args.port
+    stub = subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "stub_llm_server.py"), "--port", str(stub_port),
+                             "--latency", str(args.llm_latency), "--token-delay", str(args.token_delay)])
+    app_env = dict(env, AIPIPE_LLM_URL=f"http://127.0.0.1:{stub_port}/v1/chat/completions",
+                   ANSWER_CACHE_SIZE="0", TIMING_HEADER="1")
+    app = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port)],
+                           cwd=REPO_ROOT, env=app_env)
+    results = []
+    try:
+        wait_for(f"http://127.0.0.1:{app_port}/ready")
+        for stream in (False, True):
+            out = os.path.join(tmp, f"http_{stream}.json")
+            python("load_test.py", "--target", f"http://127.0.0.1:{app_port}", "--stub", f"http://127.0.0.1:{stub_port}",
+                   "--requests", args.requests, "--questions", os.path.join(data_dir, "questions.jsonl"),
+                   "--concurrency", *args.concurrency, "--unique", "--json", out, *(["--stream"] if stream else []))
+            results += load_results(out)["results"]
+    finally:
+        app.terminate()
+        stub.terminate()
+        app.wait()
+        stub.wait()
+    return results
+
+
+def result_key(r):
+    return (r["bench"], r.get("mode"), r.get("corpus"), r.get("concurrency"))
+
+
+def compare(baseline, current, tolerance):
+    """Regression messages for results present in both runs."""
+    old = {result_key(r): r for r in baseline}
+    regressions = []
+    for r in current:
+        b = old.get(result_key(r))
+        if b is None:
+            continue
+        name = "/".join(str(part) for part in result_key(r) if part is not None)
+        checks = []
+        if "latency" in r and r["latency"] and b.get("latency"):
+            checks.append(("p95_ms", b["latency"]["p95_ms"], r["latency"]["p95_ms"], True))
+        if "qps" in r and "qps" in b:
+            checks.append(("qps", b["qps"], r["qps"], False))
+        for stage, seconds in r.get("stages_s", {}).items():
+            if stage in b.get("stages_s", {}):
+                checks.append((f"{stage}_s", b["stages_s"][stage], seconds, True))
+        for metric, before, after, lower_is_better in checks:
+            if not before:
+                continue
+            change = (after - before) / before
+            worse = change > tolerance if lower_is_better else change < -tolerance
+            if worse:
+                regressions.append(f"{name} {metric}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 100_000], help="corpus sizes (chunks)")
+    ap.add_argument("--type", default="flat", help="index type of the synthetic corpora")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--requests", type=int, default=256)
+    ap.add_argument("--llm-latency", type=float, default=0.5, help="stub LLM latency (s)")
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    ap.add_argument("--port", type=int, default=8100, help="app port; the stub uses the next one")
+    ap.add_argument("--pipeline", action="store_true", help="also time the offline pipeline (smallest size)")
+    ap.add_argument("--skip", nargs="*", default=[], choices=("retrieval", "http"))
+    ap.add_argument("--out", default=os.path.join("bench_results", time.strftime("%Y%m%d-%H%M%S") + ".json"))
+    ap.add_argument("--baseline", help="previous results file to compare with")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    args = ap.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            data_dir = os.path.abspath(os.path.join("bench_data", str(n)))
+            if not os.path.exists(os.path.join(data_dir, "semantic_index.json")):
+                python("synth_corpus.py", "--n", n, "--out", data_dir, "--type", args.type,
+                       *(["--docs"] if args.pipeline and n == min(args.sizes) else []))
+            env = dict(os.environ, INDEX_PATH=os.path.join(data_dir, "semantic_index.faiss"),
+                       CORPUS_PREFIX=os.path.join(data_dir, "corpus"))
+            print(f"\n=== {n} chunks ===")
+            if "retrieval" not in args.skip:
+                out = os.path.join(tmp, "retrieval.json")
+                python("batching_bench.py", "--queries", args.requests, "--concurrency", *args.concurrency,
+                       "--questions", os.path.join(data_dir, "questions.jsonl"), "--json", out, env=env)
+                results += load_results(out)["results"]
+            if "http" not in args.skip:
+                results += [dict(r, corpus=n) for r in run_http(args, data_dir, env, tmp)]
+            if args.pipeline and n == min(args.sizes):
+                out = os.path.join(tmp, "pipeline.json")
+                python("pipeline_bench.py", "--data", data_dir, "--json", out)
+                results += load_results(out)["results"]
+
+    write_results(args.out, results, sizes=args.sizes, index_type=args.type, llm_latency=args.llm_latency)
+    print(f"\nWrote {len(results)} results to {args.out}")
+    if args.baseline:
+        regressions = compare(load_results(args.baseline)["results"], results, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
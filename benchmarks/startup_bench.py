@@ -0,0 +1,103 @@
+"""Import-to-first-response time of the app in each startup mode.
+
+Starts the stub LLM, then for every run launches `uvicorn main:app` in a fresh
+process and measures, from process start:
+
+    import_s       `python -c "import main"` on its own
+    listening_s    first successful GET /healthz
+    ready_s        first 200 from GET /ready
+    first_answer_s first 200 from POST /api/ (sent once ready)
+
+    python benchmarks/startup_bench.py --modes eager background --runs 3
+
+Prints one JSON line per mode with the median of each measurement. Export the
+model first (`python encoder.py export paraphrase-MiniLM-L3-v2`) to compare
+against loading it from the Hugging Face cache.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(fn, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if fn():
+                return True
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError
+
+
+def time_import():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def run_once(mode, port, llm_url, timeout):
+    env = {**os.environ, "STARTUP_MODE": mode, "AIPIPE_LLM_URL": llm_url, "ANSWER_CACHE_SIZE": "0"}
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            wait_for(lambda: client.get(f"{base}/healthz").status_code == 200, timeout)
+            listening = time.perf_counter() - start
+            # In eager mode /ready is already 200 once the port is open
+            wait_for(lambda: client.get(f"{base}/ready").status_code == 200, timeout)
+            ready = time.perf_counter() - start
+            res = client.post(f"{base}/api/", json={"question": "How do I install uv?"})
+            res.raise_for_status()
+            first_answer = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"listening_s": listening, "ready_s": ready, "first_answer_s": first_answer}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modes", nargs="+", default=["eager", "background"])
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--stub-port", type=int, default=9765)
+    ap.add_argument("--timeout", type=float, default=120)
+    args = ap.parse_args()
+
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "stub_llm_server.py"),
+         "--port", str(args.stub_port), "--latency", "0"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    llm_url = f"http://127.0.0.1:{args.stub_port}/v1/chat/completions"
+    try:
+        wait_for(lambda: httpx.get(f"http://127.0.0.1:{args.stub_port}/stats").status_code == 200, 30)
+        import_s = statistics.median(time_import() for _ in range(args.runs))
+        for mode in args.modes:
+            runs = [run_once(mode, args.port, llm_url, args.timeout) for _ in range(args.runs)]
+            result = {"mode": mode, "import_s": round(import_s, 3)}
+            for key in runs[0]:
+                result[key] = round(statistics.median(r[key] for r in runs), 3)
+            print(json.dumps(result))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
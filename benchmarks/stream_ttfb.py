@@ -0,0 +1,60 @@
+"""Time-to-first-byte comparison of POST /api/ and POST /api/stream.
+
+Run the app against the stub LLM (see stub_llm_server.py), then:
+
+    python benchmarks/stream_ttfb.py --runs 10
+
+Reports, per endpoint, the median time until the first bytes arrive, until the
+first answer token, and until the response is complete.
+"""
+import argparse
+import statistics
+import time
+
+import httpx
+
+QUESTION = "How do I deploy to Vercel?"
+
+
+def time_blocking(client, base):
+    start = time.perf_counter()
+    with client.stream("POST", f"{base}/api/", json={"question": QUESTION}) as res:
+        first_byte = None
+        for _ in res.iter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return first_byte, first_byte, total
+
+
+def time_streaming(client, base):
+    start = time.perf_counter()
+    first_byte = first_token = None
+    with client.stream("POST", f"{base}/api/stream", json={"question": QUESTION}) as res:
+        for line in res.iter_lines():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            if first_token is None and line.startswith("event: token"):
+                first_token = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return first_byte, first_token, total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://127.0.0.1:8000")
+    ap.add_argument("--runs", type=int, default=10)
+    args = ap.parse_args()
+
+    with httpx.Client(timeout=120) as client:
+        print(f"{'endpoint':<12} {'ttfb_ms':>9} {'first_token_ms':>15} {'total_ms':>9}")
+        for name, fn in (("/api/", time_blocking), ("/api/stream", time_streaming)):
+            runs = [fn(client, args.base) for _ in range(args.runs)]
+            ttfb, first_token, total = (
+                statistics.median(r[i] for r in runs if r[i] is not None) * 1000 for i in range(3)
+            )
+            print(f"{name:<12} {ttfb:>9.1f} {first_token:>15.1f} {total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Local stand-in for the AIPIPE chat-completions endpoint.
+
+Sleeps for a configurable latency and returns a canned completion (or, for
+`"stream": true` payloads, streams it word by word as OpenAI-style SSE), while
+tracking how many requests are in flight so load tests can see whether the
+Virtual TA really overlaps its LLM calls.
+
+    python benchmarks/stub_llm_server.py --port 9000 --latency 1.0 --token-delay 0.02
+    python benchmarks/stub_llm_server.py --latency 1.0 --jitter 0.5 --error-rate 0.05
+    AIPIPE_LLM_URL=http://127.0.0.1:9000/v1/chat/completions uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+LATENCY = 1.0  # seconds per completion (time to first token when streaming)
+TOKEN_DELAY = 0.02  # seconds between streamed tokens
+JITTER = 0.0  # extra latency, uniform in [0, JITTER] seconds
+ERROR_RATE = 0.0  # share of requests answered with a 503
+ANSWER = "This is a stub answer from the local LLM server."
+
+stats = {"in_flight": 0, "peak_in_flight": 0, "requests": 0, "errors": 0}
+
+
+def latency():
+    return LATENCY + random.uniform(0, JITTER)
+
+
+def usage_for(payload):
+    # Word counts stand in for tokens, so usage metrics have something to count
+    prompt = sum(len(str(m.get("content", "")).split()) for m in payload.get("messages", []))
+    completion = len(ANSWER.split())
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def stream_chunk(content=None, finish_reason=None):
+    delta = {"content": content} if content is not None else {}
+    chunk = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+async def stream_completion(usage=None):
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(latency())
+        for i, word in enumerate(ANSWER.split(" ")):
+            if i:
+                await asyncio.sleep(TOKEN_DELAY)
+            yield stream_chunk(word if i == 0 else " " + word)
+        yield stream_chunk(finish_reason="stop")
+        if usage is not None:
+            # Sent last with empty choices, as with stream_options.include_usage
+            yield "data: " + json.dumps({"id": "chatcmpl-stub", "choices": [], "usage": usage}) + "\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        stats["in_flight"] -= 1
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    payload = await request.json()
+    stats["requests"] += 1
+    if random.random() < ERROR_RATE:
+        stats["errors"] += 1
+        return JSONResponse({"error": {"message": "stub overloaded"}}, status_code=503)
+    if payload.get("stream"):
+        include_usage = (payload.get("stream_options") or {}).get("include_usage")
+        return StreamingResponse(stream_completion(usage_for(payload) if include_usage else None),
+                                 media_type="text/event-stream")
+
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(latency())
+    finally:
+        stats["in_flight"] -= 1
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": ANSWER},
+            "finish_reason": "stop",
+        }],
+        "usage": usage_for(payload),
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/stats/reset")
+async def reset_stats():
+    stats.update(in_flight=0, peak_in_flight=0, requests=0, errors=0)
+    return stats
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--latency", type=float, default=LATENCY)
+    ap.add_argument("--token-delay", type=float, default=TOKEN_DELAY)
+    ap.add_argument("--jitter", type=float, default=JITTER, help="extra random latency, up to this many seconds")
+    ap.add_argument("--error-rate", type=float, default=ERROR_RATE, help="share of requests failing with 503")
+    args = ap.parse_args()
+    LATENCY = args.latency
+    TOKEN_DELAY = args.token_delay
+    JITTER = args.jitter
+    ERROR_RATE = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port)
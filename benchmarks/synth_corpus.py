@@ -0,0 +1,176 @@
+"""Synthetic corpus for benchmarks: 1k to 1M chunks without scraping or encoding.
+
+    python benchmarks/synth_corpus.py --n 100000
+    python benchmarks/synth_corpus.py --n 1000000 --type ivf_pq --metric ip --no-bm25
+    python benchmarks/synth_corpus.py --n 10000 --docs   # + raw docs for pipeline_bench.py
+
+Writes into --out (default bench_data/<n>):
+
+    chunks.jsonl                    chunk records as split_into_chunks.py writes them
+    corpus.*                        binary corpus with random clustered vectors
+    semantic_index.faiss/.json/...  FAISS, BM25 and filter bitset indexes over them
+    questions.jsonl                 questions made of topic words, for the load drivers
+    anand_scraped.jsonl,            (--docs) raw pages/topics that produce roughly
+    discourse_posts.jsonl           n chunks when run through the offline pipeline
+
+Texts mix per-topic words with Zipf-distributed filler, and vectors are
+Gaussian clusters per topic, so BM25 and vector search both have structure
+to find. The vectors don't come from the model; point the app at the corpus
+with INDEX_PATH=<out>/semantic_index.faiss CORPUS_PREFIX=<out>/corpus.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import INDEX_TYPES, METRICS, build_index, save_index
+from bm25_index import BM25Index, bm25_path
+from chunk_filters import FilterIndex, corpus_records, filters_path
+from corpus_store import CorpusStore, CorpusWriter, chunk_id, content_hash
+from encoder import MODEL_NAME
+from index_generation import write_build_marker
+
+COURSE_WORDS = (
+    "uv pip venv python docker fastapi vercel github pages npx node deploy install error module "
+    "deadline marks project ga1 ga2 ga3 ga4 ga5 llm embeddings prompt api key token playwright scrape "
+    "pandas sql duckdb excel regression notebook colab kaggle json csv http cors port localhost"
+).split()
+BATCH = 10_000
+CHUNKS_PER_DOC = 8
+TOPIC_WORDS = 12
+TAGS = ("ga1", "ga2", "ga3", "ga4", "ga5", "project1", "project2")
+FIRST_DAY = date(2025, 1, 1)  # documents are dated over the following year
+
+
+class Vocabulary:
+    def __init__(self, n_topics, rng, size=20_000):
+        filler = [f"w{i}" for i in range(size)]
+        self.filler = np.array(COURSE_WORDS + filler)
+        # Zipf-like frequencies, like natural text
+        weights = 1.0 / np.arange(1, len(self.filler) + 1)
+        self.p = weights / weights.sum()
+        self.topics = rng.integers(0, len(self.filler), (n_topics, TOPIC_WORDS))
+
+    def texts(self, rng, topics, words):
+        # One text per topic; sampled for the whole batch at once
+        n_topic = max(1, words // 4)
+        topic_words = np.take_along_axis(self.topics[topics], rng.integers(0, TOPIC_WORDS, (len(topics), n_topic)), 1)
+        filler = rng.choice(len(self.filler), (len(topics), words - n_topic), p=self.p)
+        picks = rng.permuted(np.concatenate([topic_words, filler], axis=1), axis=1)
+        return [" ".join(row) for row in self.filler[picks]]
+
+
+def generate(args):
+    rng = np.random.default_rng(args.seed)
+    n_topics = max(1, args.n // 500)
+    vocab = Vocabulary(n_topics, rng)
+    centers = rng.standard_normal((n_topics, args.dim)).astype("float32")
+    os.makedirs(args.out, exist_ok=True)
+    prefix = os.path.join(args.out, "corpus")
+
+    start = time.perf_counter()
+    meta = {"model": MODEL_NAME, "backend": "synthetic"}
+    with open(os.path.join(args.out, "chunks.jsonl"), "w", encoding="utf-8") as chunks_file, \
+            CorpusWriter(prefix, meta=meta) as writer:
+        for batch_start in range(0, args.n, BATCH):
+            size = min(BATCH, args.n - batch_start)
+            rows = np.arange(batch_start, batch_start + size)
+            # Consecutive chunks belong to one document, and a document to one topic
+            docs = rows // CHUNKS_PER_DOC
+            topics = docs % n_topics
+            vectors = centers[topics] + 0.5 * rng.standard_normal((size, args.dim), dtype="float32")
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            records = []
+            texts = vocab.texts(rng, topics, args.words)
+            for row, doc, text in zip(rows, docs, texts):
+                url = f"https://synthetic.example/t/{doc}"
+                record = {
+                    "text": text,
+                    "title": f"Topic {doc}",
+                    "url": url,
+                    "heading": "",
+                    "link": f"{url}/{row % CHUNKS_PER_DOC + 1}",
+                    "doc_hash": content_hash(f"{url}\x00{doc}"),
+                    # Filter attributes: alternate sources, a tag and a date per document
+                    "source": "discourse" if doc % 2 else "course",
+                    "created_at": (FIRST_DAY + timedelta(days=int(doc % 365))).isoformat(),
+                    "tags": TAGS[doc % len(TAGS)] if doc % 2 else "",
+                }
+                record["chunk_id"] = chunk_id(record)
+                chunks_file.write(json.dumps(record) + "\n")
+                records.append(record)
+            writer.add_many(records, vectors, [r["chunk_id"] for r in records])
+            print(f"  {batch_start + size} / {args.n} chunks", end="\r")
+    print(f"\nWrote {args.n} chunks in {time.perf_counter() - start:.1f}s")
+
+    corpus = CorpusStore(prefix)
+    index_path = os.path.join(args.out, "semantic_index.faiss")
+    start = time.perf_counter()
+    index, info = build_index(np.ascontiguousarray(corpus.embeddings), args.type, args.metric,
+                              ids=np.asarray(corpus.ids))
+    save_index(index, info, index_path, ids=np.asarray(corpus.ids))
+    print(f"Built {args.type} index in {time.perf_counter() - start:.1f}s")
+    if not args.no_bm25:
+        start = time.perf_counter()
+        BM25Index.build(corpus.field(i, "text") for i in range(len(corpus))).save(bm25_path(index_path))
+        print(f"Built BM25 index in {time.perf_counter() - start:.1f}s")
+    FilterIndex.build(corpus_records(corpus)).save(filters_path(index_path))
+    write_build_marker(index_path, {"count": len(corpus), "type": info["type"]})
+
+    with open(os.path.join(args.out, "questions.jsonl"), "w", encoding="utf-8") as f:
+        for i in range(args.questions):
+            topic = int(rng.integers(0, n_topics))
+            words = vocab.filler[vocab.topics[topic][rng.choice(TOPIC_WORDS, 6, replace=False)]]
+            f.write(json.dumps({"question": f"How do I {' '.join(words)}?"}) + "\n")
+
+    if args.docs:
+        write_docs(args, rng, vocab, n_topics)
+
+
+def write_docs(args, rng, vocab, n_topics):
+    # Half course pages (HTML with headings), half forum topics (one post per chunk)
+    n_docs = max(2, args.n // CHUNKS_PER_DOC)
+    with open(os.path.join(args.out, "anand_scraped.jsonl"), "w", encoding="utf-8") as pages, \
+            open(os.path.join(args.out, "discourse_posts.jsonl"), "w", encoding="utf-8") as topics:
+        for doc in range(n_docs):
+            topic = doc % n_topics
+            sections = vocab.texts(rng, np.full(CHUNKS_PER_DOC, topic), args.words)
+            if doc % 2:
+                posts = [{"post_number": i + 1, "created_at": "2025-01-01T00:00:00Z", "cooked": f"<p>{text}</p>"}
+                         for i, text in enumerate(sections)]
+                topics.write(json.dumps({
+                    "title": f"Topic {doc}", "content": "\n\n".join(p["cooked"] for p in posts), "posts": posts,
+                    "url": f"https://synthetic.example/t/{doc}", "topic_id": doc,
+                }) + "\n")
+            else:
+                html = "".join(f'<h2 id="s{i}">Section {i}</h2><p>{text}</p>' for i, text in enumerate(sections))
+                page = json.dumps({
+                    "title": f"Page {doc}", "content": "\n\n".join(sections), "html": html,
+                    "url": f"https://synthetic.example/#/page-{doc}",
+                }) + "\n"
+                # Scrapes can list a page twice; the first one is written twice, back to back
+                pages.write(page * (2 if doc == 0 else 1))
+    print(f"Wrote {n_docs} raw documents for the offline pipeline")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=10_000, help="chunks")
+    ap.add_argument("--out", help="output directory (default bench_data/<n>)")
+    ap.add_argument("--words", type=int, default=120, help="words per chunk")
+    ap.add_argument("--dim", type=int, default=384, help="vector size (the query model's)")
+    ap.add_argument("--type", choices=INDEX_TYPES, default="flat")
+    ap.add_argument("--metric", choices=METRICS, default="l2")
+    ap.add_argument("--no-bm25", action="store_true")
+    ap.add_argument("--questions", type=int, default=200)
+    ap.add_argument("--docs", action="store_true", help="also write raw documents for pipeline_bench.py")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    args.out = args.out or os.path.join("bench_data", str(args.n))
+    generate(args)
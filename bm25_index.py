@@ -0,0 +1,155 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# --- CONFIG ---
+K1 = 1.2
+B = 0.75
+RRF_K = 60  # rank offset in reciprocal-rank fusion
+
+# Keep things students type verbatim: GA4, uv, npx, node-fetch, ModuleNotFoundError, 3.11
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in into is it its of on "
+    "or so that the their then there these this to was we what when where which who why "
+    "will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        # Also index the parts of compound tokens so "node-fetch" matches "fetch"
+        if not token.isalnum():
+            tokens.extend(p for p in re.split(r"[._\-/]", token) if p and p not in STOPWORDS)
+    return tokens
+
+
+def bm25_path(index_path: str) -> str:
+    # semantic_index.faiss -> semantic_index.bm25.npz
+    return os.path.splitext(index_path)[0] + ".bm25.npz"
+
+
+class BM25Index:
+    """In-memory BM25 over corpus rows with CSR (array-backed) postings.
+
+    Postings of term t are doc_ids/tfs[offsets[t]:offsets[t + 1]], so a query
+    touches only the arrays of its own terms and the whole index is a handful
+    of numpy arrays plus the vocabulary.
+    """
+
+    def __init__(self, vocab: dict, offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_len: np.ndarray):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        n_docs = len(doc_len)
+        df = np.diff(offsets).astype("float32")
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype("float32")
+        avg_len = float(doc_len.mean()) if n_docs else 1.0
+        # Per-doc part of the BM25 denominator, precomputed once
+        self.norm = (K1 * (1 - B + B * doc_len / max(avg_len, 1e-9))).astype("float32")
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> "BM25Index":
+        vocab = {}
+        postings = []  # per term: list of (doc, tf)
+        doc_len = []
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                tid = vocab.setdefault(term, len(vocab))
+                if tid == len(postings):
+                    postings.append([])
+                postings[tid].append((doc, tf))
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        doc_ids = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=offsets[-1])
+        tfs = np.fromiter((min(tf, 65535) for p in postings for _, tf in p), dtype=np.uint16, count=offsets[-1])
+        return cls(vocab, offsets, doc_ids, tfs, np.array(doc_len, dtype=np.int32))
+
+    def search(self, query: str, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (rows, scores) for the query, best first; only rows set in the
+        boolean `mask` (one per row) when given."""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype="float32")
+        docs, scores = [], []
+        for tid in term_ids:
+            start, end = self.offsets[tid], self.offsets[tid + 1]
+            d = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype("float32")
+            docs.append(d)
+            scores.append(self.idf[tid] * tf * (K1 + 1) / (tf + self.norm[d]))
+        docs = np.concatenate(docs)
+        scores = np.concatenate(scores)
+        if mask is not None:
+            keep = mask[docs]
+            docs, scores = docs[keep], scores[keep]
+            if not len(docs):
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype="float32")
+        # Sum per document over only the touched docs
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores).astype("float32")
+        if len(totals) > k:
+            top = np.argpartition(-totals, k)[:k]
+        else:
+            top = np.arange(len(totals))
+        top = top[np.argsort(-totals[top])]
+        return unique_docs[top].astype(np.int64), totals[top]
+
+    def save(self, path: str):
+        terms = sorted(self.vocab, key=self.vocab.get)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            vocab=np.frombuffer(json.dumps(terms).encode("utf-8"), dtype=np.uint8),
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            doc_len=self.doc_len,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path) as data:
+            terms = json.loads(data["vocab"].tobytes().decode("utf-8"))
+            return cls({t: i for i, t in enumerate(terms)}, data["offsets"], data["doc_ids"],
+                       data["tfs"], data["doc_len"])
+
+
+def load_bm25(index_path: str) -> Optional[BM25Index]:
+    path = bm25_path(index_path)
+    return BM25Index.load(path) if os.path.exists(path) else None
+
+
+def reciprocal_rank_fusion(dense_rows, sparse_rows, sparse_weight: float = 0.5,
+                           k: Optional[int] = None, return_scores: bool = False):
+    """Fuse two ranked row lists: score = w_d / (RRF_K + rank_d) + w_s / (RRF_K + rank_s).
+
+    Returns the fused rows, or (rows, scores) with `return_scores`."""
+    scores = {}
+    for weight, rows in ((1.0 - sparse_weight, dense_rows), (sparse_weight, sparse_rows)):
+        for rank, row in enumerate(rows):
+            row = int(row)
+            if row >= 0:
+                scores[row] = scores.get(row, 0.0) + weight / (RRF_K + rank + 1)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    fused = fused[:k] if k is not None else fused
+    if return_scores:
+        return fused, [scores[row] for row in fused]
+    return fused
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# --- CONFIG ---
+SOURCES = ("discourse", "course")  # forum posts / course notes pages
+NO_DATE = np.iinfo(np.int32).min  # chunks without a date never match a date range
+SELECTION_CACHE_SIZE = 64  # compiled filters kept per index
+EPOCH = date(1970, 1, 1)
+
+
+class RowFilter(NamedTuple):
+    """Restricts retrieval to chunks matching every given attribute: any of
+    `sources`, any of `tags`, created between `since` and `until` (inclusive,
+    days since 1970-01-01)."""
+    sources: Tuple[str, ...] = ()
+    tags: Tuple[str, ...] = ()
+    since: Optional[int] = None
+    until: Optional[int] = None
+
+    def key(self) -> str:
+        # Stable text form, for cache and coalescing keys
+        return json.dumps(self._asdict(), sort_keys=True)
+
+
+def filters_path(index_path: str) -> str:
+    # semantic_index.faiss -> semantic_index.filters.npz
+    return os.path.splitext(index_path)[0] + ".filters.npz"
+
+
+def day_number(value) -> int:
+    # ISO timestamp/date string or date -> days since 1970-01-01
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00")).date()
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def chunk_attributes(record: dict) -> Tuple[str, Tuple[str, ...], int]:
+    """(source, tags, created day) of a corpus record. Corpora written before
+    these fields were stored get their source from the url."""
+    source = record.get("source") or ("discourse" if "/t/" in (record.get("url") or "") else "course")
+    tags = tuple(t for t in (record.get("tags") or "").split(",") if t)
+    created = record.get("created_at")
+    try:
+        day = day_number(created) if created else NO_DATE
+    except ValueError:
+        day = NO_DATE
+    return source, tags, day
+
+
+def corpus_records(corpus) -> Iterator[dict]:
+    # Only the fields the filters need, without decoding the chunk texts
+    names = [name for name in ("url", "source", "created_at", "tags") if name in corpus.fields]
+    for i in range(len(corpus)):
+        yield {name: corpus.field(i, name) for name in names}
+
+
+def _pack(mask: np.ndarray) -> np.ndarray:
+    # Bit i of byte i // 8 is row i: the layout faiss.IDSelectorBitmap reads
+    return np.packbits(mask, bitorder="little")
+
+
+class FilterIndex:
+    """Per-attribute bitsets over the corpus rows: one packed bitset per
+    source and per tag, and each row's creation day for date ranges.
+
+    `select(row_filter)` combines them into the rows a filtered search may
+    return; compiled selections are cached, since the same few filters
+    (current term, forum only, ...) are asked over and over.
+    """
+
+    def __init__(self, count: int, bitsets: dict, days: np.ndarray):
+        self.count = count
+        self.bitsets = bitsets  # "source:<name>" / "tag:<name>" -> packed uint8 bitset
+        self.days = days
+        self._selections = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def build(cls, records: Iterable[dict]) -> "FilterIndex":
+        rows = {}  # bitset name -> rows
+        days = []
+        for row, record in enumerate(records):
+            source, tags, day = chunk_attributes(record)
+            rows.setdefault(f"source:{source}", []).append(row)
+            for tag in tags:
+                rows.setdefault(f"tag:{tag}", []).append(row)
+            days.append(day)
+        count = len(days)
+        bitsets = {}
+        for name, members in rows.items():
+            mask = np.zeros(count, dtype=bool)
+            mask[members] = True
+            bitsets[name] = _pack(mask)
+        return cls(count, bitsets, np.array(days, dtype=np.int32))
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp.npz"
+        names = sorted(self.bitsets)
+        np.savez(
+            tmp_path,
+            names=np.frombuffer(json.dumps(names).encode("utf-8"), dtype=np.uint8),
+            bitsets=np.stack([self.bitsets[n] for n in names]) if names else np.zeros((0, 0), np.uint8),
+            days=self.days,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FilterIndex":
+        with np.load(path) as data:
+            names = json.loads(data["names"].tobytes().decode("utf-8"))
+            days = data["days"]
+            return cls(len(days), dict(zip(names, data["bitsets"])), days)
+
+    def values(self, attribute: str) -> list:
+        prefix = attribute + ":"
+        return sorted(name[len(prefix):] for name in self.bitsets if name.startswith(prefix))
+
+    def bitmap(self, row_filter: RowFilter) -> np.ndarray:
+        """Packed bitset of the rows matching `row_filter`: values of one
+        attribute are OR-ed, attributes AND-ed."""
+        empty = np.zeros((self.count + 7) // 8, dtype=np.uint8)
+        result = np.full_like(empty, 0xFF)
+        for attribute, wanted in (("source", row_filter.sources), ("tag", row_filter.tags)):
+            if wanted:
+                any_of = empty.copy()
+                for value in wanted:
+                    bits = self.bitsets.get(f"{attribute}:{value}")
+                    if bits is not None:
+                        np.bitwise_or(any_of, bits, out=any_of)
+                np.bitwise_and(result, any_of, out=result)
+        if row_filter.since is not None or row_filter.until is not None:
+            in_range = self.days != NO_DATE
+            if row_filter.since is not None:
+                in_range &= self.days >= row_filter.since
+            if row_filter.until is not None:
+                in_range &= self.days <= row_filter.until
+            np.bitwise_and(result, _pack(in_range), out=result)
+        # Clear the padding bits past the last row
+        if self.count % 8:
+            result[-1] &= (1 << (self.count % 8)) - 1
+        return result
+
+    def select(self, row_filter: RowFilter, compile_selection):
+        """Cached `compile_selection(bitmap, mask)` for `row_filter`."""
+        with self._lock:
+            if row_filter in self._selections:
+                self._selections.move_to_end(row_filter)
+                return self._selections[row_filter]
+        bitmap = self.bitmap(row_filter)
+        mask = np.unpackbits(bitmap, count=self.count, bitorder="little").astype(bool)
+        selection = compile_selection(bitmap, mask)
+        with self._lock:
+            self._selections[row_filter] = selection
+            while len(self._selections) > SELECTION_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return selection
+
+    def info(self) -> dict:
+        dated = self.days[self.days != NO_DATE]
+        return {
+            "sources": self.values("source"),
+            "tags": self.values("tag"),
+            "first_day": str(EPOCH.fromordinal(EPOCH.toordinal() + int(dated.min()))) if len(dated) else None,
+            "last_day": str(EPOCH.fromordinal(EPOCH.toordinal() + int(dated.max()))) if len(dated) else None,
+        }
+
+
+def load_filters(index_path: str) -> Optional[FilterIndex]:
+    path = filters_path(index_path)
+    return FilterIndex.load(path) if os.path.exists(path) else None
@@ -0,0 +1,144 @@
+import re
+from typing import List, Optional, Tuple
+
+# --- CONFIG ---
+DEFAULT_TOKEN_BUDGET = 1200  # context tokens sent to the LLM per question
+DEFAULT_ENCODING = "o200k_base"  # tiktoken encoding of gpt-4o / gpt-4o-mini
+MIN_MERGE_OVERLAP = 8  # words two chunks must share at a seam to be merged
+MAX_MERGE_OVERLAP = 120  # longest seam looked for (chunks overlapped by 50 words)
+SHINGLE_SIZE = 5  # words per shingle for near-duplicate detection
+DUPLICATE_CONTAINMENT = 0.8  # share of a chunk's shingles already in the context
+SEPARATOR = "\n\n"
+WORD_RE = re.compile(r"\S+")
+ESTIMATE_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    """Counts LLM tokens locally. Uses tiktoken when it is installed (its
+    encoding files are cached on first use; the Docker image bakes them in),
+    otherwise estimates from words and punctuation."""
+
+    def __init__(self, encoding: str = DEFAULT_ENCODING):
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding)
+        except Exception as e:
+            print(f"tiktoken unavailable ({e}); estimating context tokens")
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return int(len(ESTIMATE_RE.findall(text)) * 1.1) + 1
+
+    def truncate(self, text: str, tokens: int) -> str:
+        if self._encoding is not None:
+            return self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:tokens])
+        words = WORD_RE.findall(text)
+        kept = words[:max(1, len(words) * tokens // max(self.count(text), 1))]
+        return " ".join(kept)
+
+
+def _seam(first: List[str], second: List[str]) -> int:
+    # Longest run of words that ends `first` and starts `second`
+    for m in range(min(len(first), len(second), MAX_MERGE_OVERLAP), MIN_MERGE_OVERLAP - 1, -1):
+        if first[-m:] == second[:m]:
+            return m
+    return 0
+
+
+def _after_words(text: str, n: int) -> str:
+    # `text` with its first n words removed, keeping the rest's formatting
+    for i, match in enumerate(WORD_RE.finditer(text)):
+        if i == n:
+            return text[match.start():]
+    return ""
+
+
+def _shingles(words: List[str]) -> set:
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def merge_chunks(chunks: List[dict]) -> Tuple[List[dict], int]:
+    """Merge chunks of the same page that overlap end-to-start (neighbouring
+    chunks of one document) and drop chunks whose text is mostly contained in
+    a better-ranked one. Keeps rank order: a merged chunk takes the place of
+    its better-ranked part. Returns (chunks, dropped count)."""
+    merged = []  # dicts: chunk, words, url
+    dropped = 0
+    for chunk in chunks:
+        text = chunk.get("text") or ""
+        words = WORD_RE.findall(text)
+        if not words:
+            dropped += 1
+            continue
+        url = chunk.get("url")
+        for entry in merged:
+            if url is None or entry["url"] != url:
+                continue
+            m = _seam(entry["words"], words)
+            if m:
+                entry["text"] = entry["text"] + " " + _after_words(text, m)
+                entry["words"] = entry["words"] + words[m:]
+                break
+            m = _seam(words, entry["words"])
+            if m:
+                entry["text"] = text + " " + _after_words(entry["text"], m)
+                entry["words"] = words + entry["words"][m:]
+                break
+        else:
+            merged.append({"chunk": chunk, "text": text, "words": words, "url": url})
+            continue
+        dropped += 1
+
+    kept, seen = [], set()
+    for entry in merged:
+        shingles = _shingles(entry["words"])
+        if len(shingles & seen) >= DUPLICATE_CONTAINMENT * len(shingles):
+            dropped += 1
+            continue
+        seen |= shingles
+        kept.append(dict(entry["chunk"], text=entry["text"]))
+    return kept, dropped
+
+
+class ContextBuilder:
+    """Builds the LLM context from ranked chunks: overlapping and duplicate
+    chunks are merged or dropped, then chunks are packed in rank order into
+    `budget` tokens. Chunks that don't fit are skipped in favour of smaller,
+    lower-ranked ones; the best chunk is truncated if it alone is too long."""
+
+    def __init__(self, budget: int = DEFAULT_TOKEN_BUDGET, counter: Optional[TokenCounter] = None):
+        self.budget = budget
+        self.counter = counter or TokenCounter()
+
+    def build(self, chunks: List[dict]) -> Tuple[str, dict]:
+        """Returns (context, stats), stats being the tokens of the plain join of
+        all chunks ("candidate"), of the context sent ("sent") and the difference
+        ("saved"), plus how many chunks were merged/dropped and packed."""
+        separator_tokens = self.counter.count(SEPARATOR)
+        candidate = sum(self.counter.count(c.get("text") or "") for c in chunks)
+        candidate += separator_tokens * max(len(chunks) - 1, 0)
+
+        unique, dropped = merge_chunks(chunks)
+        parts, used = [], 0
+        for chunk in unique:
+            tokens = self.counter.count(chunk["text"])
+            cost = tokens + (separator_tokens if parts else 0)
+            if used + cost <= self.budget:
+                parts.append(chunk["text"])
+                used += cost
+            elif not parts:
+                parts.append(self.counter.truncate(chunk["text"], self.budget))
+                used = self.counter.count(parts[0])
+
+        stats = {
+            "candidate": candidate,
+            "sent": used,
+            "saved": max(candidate - used, 0),
+            "deduplicated": dropped,
+            "packed": len(parts),
+        }
+        return SEPARATOR.join(parts), stats
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+from typing import Iterable, Optional
+
+import numpy as np
+
+# --- CONFIG ---
+CORPUS_PREFIX = os.getenv("CORPUS_PREFIX", "corpus")  # corpus.json, corpus.offsets.npy, corpus.blob, corpus.embeddings.npy
+# heading/link: section and deep link of a chunk; source/created_at/tags: what
+# retrieval filters on (chunk_filters.py)
+FIELDS = ("text", "url", "title", "heading", "link", "source", "created_at", "tags")
+
+# Layout:
+#   <prefix>.json            header: {"count", "fields", "dim", "has_ids", "meta"}
+#   <prefix>.blob            UTF-8 field values, back to back
+#   <prefix>.offsets.npy     uint64[count * len(fields) + 1]; field j of row i is
+#                            blob[offsets[i*F + j] : offsets[i*F + j + 1]]
+#   <prefix>.embeddings.npy  optional float32[count, dim]
+#   <prefix>.ids.npy         optional int64[count], stable chunk ids (see chunk_id)
+#
+# While generate_embeddings.py runs, newly encoded vectors are also appended to
+# <prefix>.spool.f32 / <prefix>.spool.ids (see EmbeddingSpool) so an
+# interrupted run can pick up where it stopped.
+
+
+def corpus_paths(prefix: str = CORPUS_PREFIX) -> dict:
+    return {
+        "header": f"{prefix}.json",
+        "blob": f"{prefix}.blob",
+        "offsets": f"{prefix}.offsets.npy",
+        "embeddings": f"{prefix}.embeddings.npy",
+        "ids": f"{prefix}.ids.npy",
+    }
+
+
+def corpus_exists(prefix: str = CORPUS_PREFIX) -> bool:
+    return os.path.exists(corpus_paths(prefix)["header"])
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(record: dict) -> int:
+    # Stable 63-bit id derived from the chunk's content and source: unchanged
+    # chunks keep their id across runs, edited ones get a new one
+    key = "\x00".join((record.get("url") or "", record.get("title") or "", record.get("text") or ""))
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & ((1 << 63) - 1)
+
+
+def _lookup_rows(sorted_ids: np.ndarray, order: np.ndarray, ids) -> np.ndarray:
+    # Rows of `ids` given ids sorted as sorted_ids = all_ids[order]; -1 where unknown
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(sorted_ids):
+        return np.full(ids.shape, -1, dtype=np.int64)
+    pos = np.clip(np.searchsorted(sorted_ids, ids), 0, len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == ids, order[pos], -1)
+
+
+class CorpusWriter:
+    """Streams records (and optionally their embeddings) into the binary corpus
+    format without holding the corpus in memory. Files are written under
+    temporary names and moved into place by `close()`."""
+
+    def __init__(self, prefix: str = CORPUS_PREFIX, fields=FIELDS, meta: Optional[dict] = None):
+        self.paths = corpus_paths(prefix)
+        self.fields = tuple(fields)
+        self.meta = meta or {}
+        self.count = 0
+        self.dim = None
+        self._ids = []
+        self._offsets = [0]
+        self._blob = open(self.paths["blob"] + ".tmp", "wb")
+        self._vectors = None  # raw float32 rows, wrapped into .npy on close
+
+    def add(self, record: dict, embedding: Optional[np.ndarray] = None, id: Optional[int] = None):
+        if (id is None) != (not self._ids) and self.count:
+            raise ValueError("ids must be given for every record or none")
+        if id is not None:
+            self._ids.append(id)
+        for field in self.fields:
+            data = (record.get(field) or "").encode("utf-8")
+            self._blob.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+        if embedding is not None:
+            vec = np.asarray(embedding, dtype="<f4").reshape(-1)
+            if self._vectors is None:
+                if self.count:
+                    raise ValueError("embeddings must be given for every record or none")
+                self.dim = vec.shape[0]
+                self._vectors = open(self.paths["embeddings"] + ".raw", "wb")
+            self._vectors.write(vec.tobytes())
+        elif self._vectors is not None:
+            raise ValueError("embeddings must be given for every record or none")
+        self.count += 1
+
+    def add_many(self, records: Iterable[dict], embeddings: Optional[np.ndarray] = None, ids=None):
+        for i, record in enumerate(records):
+            self.add(
+                record,
+                None if embeddings is None else embeddings[i],
+                None if ids is None else int(ids[i]),
+            )
+
+    def close(self):
+        self._blob.close()
+        np.save(self.paths["offsets"] + ".tmp.npy", np.array(self._offsets, dtype=np.uint64))
+        if self._vectors is not None:
+            self._vectors.close()
+            _raw_to_npy(self.paths["embeddings"] + ".raw", self.paths["embeddings"] + ".tmp",
+                        (self.count, self.dim))
+            os.replace(self.paths["embeddings"] + ".tmp", self.paths["embeddings"])
+        elif os.path.exists(self.paths["embeddings"]):
+            os.remove(self.paths["embeddings"])  # stale vectors from an older corpus
+        if self._ids:
+            np.save(self.paths["ids"] + ".tmp.npy", np.array(self._ids, dtype=np.int64))
+            os.replace(self.paths["ids"] + ".tmp.npy", self.paths["ids"])
+        elif os.path.exists(self.paths["ids"]):
+            os.remove(self.paths["ids"])
+        os.replace(self.paths["blob"] + ".tmp", self.paths["blob"])
+        os.replace(self.paths["offsets"] + ".tmp.npy", self.paths["offsets"])
+        # Header last: readers treat its presence as "corpus complete"
+        header = {
+            "count": self.count,
+            "fields": list(self.fields),
+            "dim": self.dim,
+            "has_ids": bool(self._ids),
+            "meta": self.meta,
+        }
+        with open(self.paths["header"] + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(self.paths["header"] + ".tmp", self.paths["header"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._blob.close()
+            if self._vectors is not None:
+                self._vectors.close()
+
+
+def _raw_to_npy(raw_path, npy_path, shape):
+    # Prepend an .npy header to raw float32 rows, copying in blocks
+    with open(npy_path, "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(
+            out, {"descr": "<f4", "fortran_order": False, "shape": shape}
+        )
+        while True:
+            block = raw.read(1 << 24)
+            if not block:
+                break
+            out.write(block)
+    os.remove(raw_path)
+
+
+def write_corpus(records, embeddings: Optional[np.ndarray] = None, prefix: str = CORPUS_PREFIX,
+                 ids=None, meta: Optional[dict] = None):
+    with CorpusWriter(prefix, meta=meta) as writer:
+        writer.add_many(records, embeddings, ids)
+    return writer.count
+
+
+class CorpusStore:
+    """Read-only, memory-mapped view of a corpus written by CorpusWriter.
+
+    Files are opened on first access, and nothing is parsed up front: a row is
+    decoded from the blob only when it is asked for."""
+
+    def __init__(self, prefix: str = CORPUS_PREFIX):
+        self.paths = corpus_paths(prefix)
+        self._header = None
+        self._offsets = None
+        self._blob = None
+        self._embeddings = None
+        self._ids = None
+        self._id_order = None
+        self._sorted_ids = None
+
+    def _open(self):
+        if self._header is not None:
+            return
+        with open(self.paths["header"], "r", encoding="utf-8") as f:
+            header = json.load(f)
+        self._offsets = np.load(self.paths["offsets"], mmap_mode="r")
+        if os.path.getsize(self.paths["blob"]):
+            self._blob = np.memmap(self.paths["blob"], dtype=np.uint8, mode="r")
+        else:
+            self._blob = np.zeros(0, dtype=np.uint8)
+        self._header = header
+
+    @property
+    def fields(self):
+        self._open()
+        return tuple(self._header["fields"])
+
+    def __len__(self):
+        self._open()
+        return self._header["count"]
+
+    def field(self, i: int, name: str) -> str:
+        self._open()
+        n_fields = len(self._header["fields"])
+        j = i * n_fields + self._header["fields"].index(name)
+        start, end = int(self._offsets[j]), int(self._offsets[j + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def get(self, i: int) -> dict:
+        self._open()
+        if not 0 <= i < self._header["count"]:
+            raise IndexError(i)
+        n_fields = len(self._header["fields"])
+        bounds = self._offsets[i * n_fields:(i + 1) * n_fields + 1]
+        return {
+            name: self._blob[int(bounds[j]):int(bounds[j + 1])].tobytes().decode("utf-8")
+            for j, name in enumerate(self._header["fields"])
+        }
+
+    def __getitem__(self, i: int) -> dict:
+        return self.get(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get(i)
+
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        # float32[count, dim] memmap, or None if the corpus was written without vectors
+        self._open()
+        if self._embeddings is None and os.path.exists(self.paths["embeddings"]):
+            self._embeddings = np.load(self.paths["embeddings"], mmap_mode="r")
+        return self._embeddings
+
+    @property
+    def meta(self) -> dict:
+        self._open()
+        return self._header.get("meta", {})
+
+    @property
+    def ids(self) -> Optional[np.ndarray]:
+        # int64[count] stable chunk ids, or None for corpora written without them
+        self._open()
+        if self._ids is None and self._header.get("has_ids"):
+            self._ids = np.load(self.paths["ids"], mmap_mode="r")
+        return self._ids
+
+    def rows_for_ids(self, ids) -> np.ndarray:
+        """Map index ids to corpus rows (-1 where unknown). Without stored ids the
+        index was built row by row, so ids already are rows."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.ids is None:
+            return np.where((ids >= 0) & (ids < len(self)), ids, -1)
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = np.asarray(self.ids)[self._id_order]
+        return _lookup_rows(self._sorted_ids, self._id_order, ids)
+
+
+class EmbeddingSpool:
+    """Append-only float32 vectors with an int64 id side-car, kept while a bulk
+    embedding run is in progress.
+
+    Vectors are written before their ids, so after an interruption every id on
+    disk has a complete vector; reopening with the same `meta` (model and
+    backend) makes those vectors reusable, anything else starts a new spool.
+    """
+
+    def __init__(self, prefix: str = CORPUS_PREFIX, meta: Optional[dict] = None, fresh: bool = False):
+        self.paths = {
+            "header": f"{prefix}.spool.json",
+            "vectors": f"{prefix}.spool.f32",
+            "ids": f"{prefix}.spool.ids",
+        }
+        self.meta = meta or {}
+        self.dim = None
+        self.count = 0
+        self._vectors = np.zeros((0, 0), dtype="<f4")
+        self._order = self._sorted_ids = np.zeros(0, dtype=np.int64)
+
+        header = None
+        if not fresh and os.path.exists(self.paths["header"]):
+            with open(self.paths["header"], "r", encoding="utf-8") as f:
+                header = json.load(f)
+        if header and header.get("meta") == self.meta and header.get("dim"):
+            self._resume(header["dim"])
+        else:
+            self.remove()
+
+    def _resume(self, dim: int):
+        self.dim = dim
+        ids = np.fromfile(self.paths["ids"], dtype="<i8") if os.path.exists(self.paths["ids"]) else np.zeros(0, "<i8")
+        n_vectors = os.path.getsize(self.paths["vectors"]) // (4 * dim) if os.path.exists(self.paths["vectors"]) else 0
+        self.count = min(len(ids), n_vectors)
+        # Drop a torn tail from the interrupted append
+        for path, itemsize in ((self.paths["ids"], 8), (self.paths["vectors"], 4 * dim)):
+            if os.path.exists(path):
+                os.truncate(path, self.count * itemsize)
+        if self.count:
+            self._vectors = np.memmap(self.paths["vectors"], dtype="<f4", mode="r", shape=(self.count, dim))
+            self._order = np.argsort(ids[:self.count], kind="stable")
+            self._sorted_ids = ids[:self.count][self._order]
+
+    def rows_for_ids(self, ids) -> np.ndarray:
+        # Only rows from before this run are looked up; new appends aren't indexed
+        return _lookup_rows(self._sorted_ids, self._order, ids)
+
+    def vectors(self, rows) -> np.ndarray:
+        return np.asarray(self._vectors[rows])
+
+    def append(self, ids, vectors: np.ndarray):
+        if not len(ids):
+            return
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.paths["header"], "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "meta": self.meta}, f)
+        with open(self.paths["vectors"], "ab") as f:
+            f.write(vectors.tobytes())
+        with open(self.paths["ids"], "ab") as f:
+            f.write(np.asarray(ids, dtype="<i8").tobytes())
+        self.count += len(ids)
+
+    def remove(self):
+        self._vectors = np.zeros((0, 0), dtype="<f4")
+        for path in self.paths.values():
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,139 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from ann_index import ids_path
+from bm25_index import bm25_path
+from index_generation import Generation, files_version, load_generation
+
+# --- CONFIG ---
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3  # bytes of loaded shards
+INDEX_FILE = "semantic_index.faiss"
+CORPUS_NAME = "corpus"
+
+
+class UnknownCourseError(KeyError):
+    """No shard directory for the requested course."""
+
+
+def resident_bytes(index_path: str) -> int:
+    # The FAISS index, its ids and the BM25 postings are read into memory; the
+    # corpus is memory-mapped, so its pages are the OS page cache's to evict
+    return sum(os.path.getsize(p) for p in (index_path, ids_path(index_path), bm25_path(index_path))
+               if os.path.exists(p))
+
+
+class CourseShards:
+    """Per-course indexes, one directory per course under `root`.
+
+    Each `root/<course>/` is laid out like the repo root (semantic_index.faiss,
+    corpus.*, built by running the pipeline in it). A shard is loaded as a
+    Generation on first use, and the least recently used shards are evicted
+    once the loaded ones take more than `memory_budget` bytes; searches still
+    running on an evicted shard keep it alive until they finish.
+    """
+
+    def __init__(self, root: str, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self._shards = OrderedDict()  # course -> (generation, bytes), least recently used first
+        self._lock = threading.Lock()
+        self._loading = {}  # course -> lock held while it loads
+        self._failed = {}  # course -> files version that failed to reload
+        self._courses = self._scan()
+        self.stats = {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0}
+
+    def _scan(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(os.path.join(self.root, name, INDEX_FILE)))
+
+    def paths(self, course: str):
+        directory = os.path.join(self.root, course)
+        return os.path.join(directory, INDEX_FILE), os.path.join(directory, CORPUS_NAME)
+
+    def courses(self) -> List[str]:
+        return list(self._courses)
+
+    def get(self, course: str) -> Generation:
+        with self._lock:
+            if course in self._shards:
+                self._shards.move_to_end(course)
+                self.stats["hits"] += 1
+                return self._shards[course][0]
+        if course not in self._courses:
+            self._courses = self._scan()  # a course added since startup
+            if course not in self._courses:
+                raise UnknownCourseError(course)
+        with self._lock:
+            loading = self._loading.setdefault(course, threading.Lock())
+
+        # One load per course; concurrent requests for it wait for that load
+        with loading:
+            with self._lock:
+                if course in self._shards:
+                    self._shards.move_to_end(course)
+                    return self._shards[course][0]
+            index_path, corpus_prefix = self.paths(course)
+            shard = load_generation(1, index_path, corpus_prefix, self.nprobe, self.ef_search)
+            self._put(course, shard)
+            self.stats["loads"] += 1
+            print(f"Loaded course {course} ({len(shard.corpus)} chunks)")
+            return shard
+
+    def refresh(self) -> List[str]:
+        """Reload loaded shards whose files changed and pick up new course
+        directories. A shard that fails to reload (e.g. its refresh is still
+        writing the files) keeps serving its current generation."""
+        self._courses = self._scan()
+        with self._lock:
+            loaded = [(course, shard) for course, (shard, _) in self._shards.items()]
+        reloaded = []
+        for course, shard in loaded:
+            index_path, corpus_prefix = self.paths(course)
+            version = files_version(index_path, corpus_prefix)
+            if version == shard.version or version == self._failed.get(course):
+                continue
+            try:
+                new = load_generation(shard.number + 1, index_path, corpus_prefix, self.nprobe, self.ef_search)
+            except Exception as e:
+                self._failed[course] = version
+                print(f"Reloading course {course} failed: {e}")
+                continue
+            with self._lock:
+                if course not in self._shards:
+                    continue  # evicted meanwhile; loads fresh on next use
+            self._put(course, new)
+            self.stats["reloads"] += 1
+            reloaded.append(course)
+        return reloaded
+
+    def _put(self, course: str, shard: Generation):
+        index_path, _ = self.paths(course)
+        with self._lock:
+            self._shards[course] = (shard, resident_bytes(index_path))
+            self._shards.move_to_end(course)
+            # Evict least recently used shards, never the one just loaded
+            while len(self._shards) > 1 and self.resident_bytes() > self.memory_budget:
+                evicted, _ = self._shards.popitem(last=False)
+                self.stats["evictions"] += 1
+                print(f"Evicted course {evicted} (memory budget)")
+
+    def resident_bytes(self) -> int:
+        return sum(size for _, size in self._shards.values())
+
+    def info(self) -> dict:
+        with self._lock:
+            loaded = {course: {**shard.info(), "bytes": size} for course, (shard, size) in self._shards.items()}
+            return {
+                "courses": self.courses(),
+                "loaded": loaded,
+                "resident_bytes": self.resident_bytes(),
+                "memory_budget": self.memory_budget,
+                **self.stats,
+            }
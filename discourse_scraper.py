@@ -1,92 +1,242 @@
-import requests
-import time
+import argparse
+import asyncio
 import json
-from datetime import datetime,timezone
-from dateutil import parser
 import os
+import random
+import time
+from datetime import datetime, timezone
+
+import httpx
+from dateutil import parser
 from dotenv import load_dotenv
 
 load_dotenv()
 
-BASE_URL = "https://discourse.onlinedegree.iitm.ac.in"
-CATEGORY_SLUG = "courses/tds-kb"
-CATEGORY_ID = 34  # You can confirm this from the category JSON
+BASE_URL = os.getenv("DISCOURSE_BASE_URL", "https://discourse.onlinedegree.iitm.ac.in")
+# Category and date range default to TDS Jan 2025; pass --category/--category-id/
+# --start/--end to crawl another course or term (see COURSES_DIR in the README)
+CATEGORY_SLUG = os.getenv("DISCOURSE_CATEGORY_SLUG", "courses/tds-kb")
+CATEGORY_ID = int(os.getenv("DISCOURSE_CATEGORY_ID", "34"))  # You can confirm this from the category JSON
 
 # Date range for filtering
 START_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
 END_DATE = datetime(2025, 4, 14, tzinfo=timezone.utc)
 
+OUTPUT_FILE = "discourse_posts.jsonl"
+# Topics fetched by an unfinished run; merged into OUTPUT_FILE when the run completes
+CHECKPOINT_FILE = "discourse_posts.checkpoint.jsonl"
+
+CONCURRENCY = 8  # topic fetches in flight
+RATE_LIMIT = 4.0  # requests per second
+MAX_RETRIES = 5
+POSTS_BATCH = 20  # Discourse returns at most 20 posts per request
+
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36",
     "cookie": os.getenv("DISCOURSE_COOKIE")
 }
 
-def get_all_topic_ids():
-    topic_ids = []
+
+class RateLimiter:
+    """Spaces requests at least 1/rate seconds apart across all tasks."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def get_json(client, limiter, url, params=None):
+    # GET with rate limiting and retry + jittered exponential backoff on 429/5xx
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.wait()
+        try:
+            res = await client.get(url, params=params)
+        except httpx.TransportError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"Network error on {url}: {e}; retrying")
+        else:
+            if res.status_code == 200:
+                return res.json()
+            if res.status_code != 429 and res.status_code < 500:
+                print(f"Failed to fetch {url} | Status code: {res.status_code}")
+                return None
+            if attempt == MAX_RETRIES:
+                print(f"Giving up on {url} | Status code: {res.status_code}")
+                return None
+            retry_after = res.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                await asyncio.sleep(int(retry_after))
+                continue
+        await asyncio.sleep(min(30, 2 ** attempt) * (0.5 + random.random()))
+    return None
+
+
+async def get_all_topics(client, limiter):
+    # Returns {topic_id: listing entry} for topics created in the date range
+    topics = {}
     page = 0
     print("Fetching topics...")
     while True:
-        url = f"{BASE_URL}/c/{CATEGORY_SLUG}/{CATEGORY_ID}.json?page={page}"
-        print(f"Trying page {page}: {url}")
+        url = f"{BASE_URL}/c/{CATEGORY_SLUG}/{CATEGORY_ID}.json"
+        print(f"Trying page {page}: {url}?page={page}")
         try:
-            res = requests.get(url, headers=headers)
-            if res.status_code != 200:
-                print(f"Failed to fetch page {page} | Status code: {res.status_code}")
-                break
-
-            data = res.json()
-            topics = data.get("topic_list", {}).get("topics", [])
-            if not topics:
-                print("No more topics.")
-                break
-
-            for topic in topics:
-                created_at =  parser.isoparse(topic['created_at']) 
-                if START_DATE <= created_at <= END_DATE:
-                    topic_ids.append(topic["id"])
-            page += 1
-            time.sleep(0.5)
+            data = await get_json(client, limiter, url, params={"page": page})
         except Exception as e:
             print(f"Error on page {page}: {e}")
             break
-    print(f"Total topics found: {len(topic_ids)}")
-    return topic_ids
+        if data is None:
+            break
+        page_topics = data.get("topic_list", {}).get("topics", [])
+        if not page_topics:
+            print("No more topics.")
+            break
 
-def fetch_topic_content(topic_id):
+        for topic in page_topics:
+            created_at = parser.isoparse(topic['created_at'])
+            if START_DATE <= created_at <= END_DATE:
+                topics[topic["id"]] = topic
+        page += 1
+    print(f"Total topics found: {len(topics)}")
+    return topics
+
+
+async def fetch_topic_content(client, limiter, topic):
+    topic_id = topic["id"]
     url = f"{BASE_URL}/t/{topic_id}.json"
     print(f"Fetching topic {topic_id}...")
     try:
-        res = requests.get(url, headers=headers)
-        if res.status_code != 200:
-            print(f"Failed to fetch topic {topic_id} | Status code: {res.status_code}")
+        data = await get_json(client, limiter, url)
+        if data is None:
             return None
-        data = res.json()
-        content = []
-        for post in data.get("post_stream", {}).get("posts", []):
-            content.append(post["cooked"])
+        post_stream = data.get("post_stream", {})
+        posts = list(post_stream.get("posts", []))
+
+        # The topic JSON only embeds the first 20 posts; fetch the rest by id
+        have = {post["id"] for post in posts}
+        missing = [pid for pid in post_stream.get("stream", []) if pid not in have]
+        for i in range(0, len(missing), POSTS_BATCH):
+            batch = missing[i:i + POSTS_BATCH]
+            more = await get_json(client, limiter, f"{BASE_URL}/t/{topic_id}/posts.json",
+                                  params=[("post_ids[]", pid) for pid in batch])
+            if more is None:
+                print(f"Failed to fetch posts {batch[0]}.. of topic {topic_id}")
+                return None
+            posts.extend(more.get("post_stream", {}).get("posts", []))
+        posts.sort(key=lambda post: post.get("post_number", 0))
+
         return {
             "title": data.get("title", ""),
-            "content": "\n\n".join(content),
-            "url": f"{BASE_URL}/t/{topic_id}"
+            "content": "\n\n".join(post["cooked"] for post in posts),
+            # Per-post HTML so chunks can link to /t/{topic_id}/{post_number}
+            "posts": [
+                {"post_number": post.get("post_number"), "created_at": post.get("created_at"),
+                 "cooked": post["cooked"]}
+                for post in posts
+            ],
+            "url": f"{BASE_URL}/t/{topic_id}",
+            "topic_id": topic_id,
+            "created_at": topic.get("created_at"),
+            # Discourse lists tags as names or as {"name": ...} depending on the version
+            "tags": [tag["name"] if isinstance(tag, dict) else tag for tag in topic.get("tags") or []],
+            # Used to skip the topic on the next crawl if nothing changed
+            "bumped_at": topic.get("bumped_at"),
+            "posts_count": topic.get("posts_count"),
         }
     except Exception as e:
         print(f"Error fetching topic {topic_id}: {e}")
         return None
 
-def save_all_topics():
-    topic_ids = get_all_topic_ids()
-    if not topic_ids:
-        print("No topic IDs fetched.")
-        return
-
-    with open("discourse_posts.jsonl", "w", encoding="utf-8") as f:
-        for tid in topic_ids:
-            post = fetch_topic_content(tid)
-            if post:
-                f.write(json.dumps(post) + "\n")
-                print(f" Saved: {post['title']}")
-            else:
-                print(f" Skipped topic {tid}")
+
+def load_records(path):
+    records = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partial line from an interrupted run
+                if "topic_id" in record:
+                    records[record["topic_id"]] = record
+    return records
+
+
+def parse_date(value):
+    # YYYY-MM-DD or a full ISO timestamp; dates without a zone are UTC
+    date = parser.isoparse(value)
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def unchanged(record, topic):
+    return (record is not None
+            and record.get("bumped_at") == topic.get("bumped_at")
+            and record.get("posts_count") == topic.get("posts_count"))
+
+
+async def save_all_topics(concurrency=CONCURRENCY, rate=RATE_LIMIT, full=False):
+    # Previous output + topics already fetched by an interrupted run
+    records = {} if full else load_records(OUTPUT_FILE)
+    records.update(load_records(CHECKPOINT_FILE))
+
+    limiter = RateLimiter(rate)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    request_headers = {k: v for k, v in headers.items() if v is not None}
+    async with httpx.AsyncClient(headers=request_headers, limits=limits, timeout=30,
+                                 follow_redirects=True) as client:
+        topics = await get_all_topics(client, limiter)
+        if not topics:
+            print("No topic IDs fetched.")
+            return
+
+        todo = [t for tid, t in topics.items() if not unchanged(records.get(tid), t)]
+        print(f"{len(topics) - len(todo)} topics unchanged since last crawl, {len(todo)} to fetch")
+
+        semaphore = asyncio.Semaphore(concurrency)
+        with open(CHECKPOINT_FILE, "a", encoding="utf-8") as checkpoint:
+            async def crawl(topic):
+                async with semaphore:
+                    post = await fetch_topic_content(client, limiter, topic)
+                if post:
+                    records[topic["id"]] = post
+                    checkpoint.write(json.dumps(post) + "\n")
+                    checkpoint.flush()
+                    print(f" Saved: {post['title']}")
+                else:
+                    print(f" Skipped topic {topic['id']}")
+
+            await asyncio.gather(*(crawl(t) for t in todo))
+
+    # Write the topics still in range, in listing order, then drop the checkpoint
+    tmp_path = OUTPUT_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for tid in topics:
+            if tid in records:
+                f.write(json.dumps(records[tid]) + "\n")
+    os.replace(tmp_path, OUTPUT_FILE)
+    os.remove(CHECKPOINT_FILE)
+    print(f"Wrote {sum(tid in records for tid in topics)} topics to {OUTPUT_FILE}")
+
 
 if __name__ == "__main__":
-    save_all_topics()
+    ap = argparse.ArgumentParser(description="Crawl Discourse topics into discourse_posts.jsonl")
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--rate", type=float, default=RATE_LIMIT, help="max requests per second")
+    ap.add_argument("--full", action="store_true", help="refetch every topic, ignoring the previous crawl")
+    ap.add_argument("--category", default=CATEGORY_SLUG, help="category slug, e.g. courses/tds-kb")
+    ap.add_argument("--category-id", type=int, default=CATEGORY_ID)
+    ap.add_argument("--start", type=parse_date, default=START_DATE, help="keep topics created from this date")
+    ap.add_argument("--end", type=parse_date, default=END_DATE, help="... up to this date")
+    args = ap.parse_args()
+    CATEGORY_SLUG, CATEGORY_ID = args.category, args.category_id
+    START_DATE, END_DATE = args.start, args.end
+    asyncio.run(save_all_topics(args.concurrency, args.rate, args.full))
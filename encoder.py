@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+
+# --- CONFIG ---
+# Local copies written by `python encoder.py export <model>`; next to this file,
+# so scripts run from another directory (e.g. courses/<name>/) still find them
+MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+# Documents (generate_embeddings.py) and queries (main.py, semantic_search.py)
+# must be embedded by the same model, so all three read these defaults
+MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_FILES = {"onnx": "onnx/model.onnx", "onnx-int8": "onnx/model.int8.onnx"}
+
+
+def local_model_path(name: str) -> str:
+    # "sentence-transformers/all-MiniLM-L6-v2" -> models/sentence-transformers__all-MiniLM-L6-v2
+    return os.path.join(MODEL_DIR, name.replace("/", "__"))
+
+
+def _read_json(path: str, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Encoder:
+    """Sentence embeddings from one model through a selectable backend.
+
+    "torch" runs sentence-transformers as-is, from the exported copy in
+    MODEL_DIR when there is one (no Hub lookups at startup). "onnx" and
+    "onnx-int8" run the transformer exported by `export_model(onnx=True)` with
+    onnxruntime, int8 being dynamically quantized weights; tokenization,
+    pooling and normalization follow the saved sentence-transformers config,
+    and neither torch nor transformers is imported.
+    """
+
+    def __init__(self, name: str = MODEL_NAME, backend: str = BACKEND,
+                 max_seq_length: Optional[int] = None, threads: Optional[int] = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; choose from {BACKENDS}")
+        self.name = name
+        self.backend = backend
+        path = local_model_path(name)
+        if backend == "torch":
+            # Imported here: torch is the slowest import in the app
+            from sentence_transformers import SentenceTransformer
+
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            self._model = SentenceTransformer(path if os.path.isdir(path) else name)
+            if max_seq_length:
+                self._model.max_seq_length = max_seq_length
+            self.dim = self._model.get_sentence_embedding_dimension()
+        else:
+            self._load_onnx(path, max_seq_length, threads)
+
+    def _load_onnx(self, path: str, max_seq_length: Optional[int], threads: Optional[int]):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        onnx_path = os.path.join(path, ONNX_FILES[self.backend])
+        if not os.path.exists(onnx_path):
+            flag = "--onnx" if self.backend == "onnx" else "--quantize"
+            raise FileNotFoundError(f"{onnx_path} not found; run `python encoder.py export {self.name} {flag}`")
+
+        st_config = _read_json(os.path.join(path, "sentence_bert_config.json"), {})
+        max_length = max_seq_length or st_config.get("max_seq_length") or 256
+        special = _read_json(os.path.join(path, "special_tokens_map.json"), {})
+        pad_token = special.get("pad_token", "[PAD]")
+        if isinstance(pad_token, dict):
+            pad_token = pad_token["content"]
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length)
+        self._tokenizer.enable_padding(pad_id=self._tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+        # Pooling and normalization come from the sentence-transformers modules
+        pooling = _read_json(os.path.join(path, "1_Pooling", "config.json"), {})
+        self._pooling = "cls" if pooling.get("pooling_mode_cls_token") else (
+            "max" if pooling.get("pooling_mode_max_tokens") else "mean")
+        modules = _read_json(os.path.join(path, "modules.json"), [])
+        self._normalize = any(m.get("type", "").endswith("Normalize") for m in modules)
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self._inputs = [i.name for i in self._session.get_inputs()]
+        self.dim = pooling.get("word_embedding_dimension") or self._session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """float32[len(texts), dim]; a single string gives a single vector."""
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if self.backend == "torch":
+            vectors = self._model.encode(texts, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                                         convert_to_numpy=True, **kwargs).astype("float32")
+        else:
+            vectors = self._encode_onnx(list(texts), batch_size, show_progress_bar)
+        return vectors[0] if single else vectors
+
+    def _encode_onnx(self, texts: List[str], batch_size: int, show_progress_bar: bool) -> np.ndarray:
+        vectors = np.empty((len(texts), self.dim), dtype="float32")
+        # Longest first, like sentence-transformers, so batches pad to similar lengths
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        starts = range(0, len(texts), batch_size)
+        if show_progress_bar:
+            from tqdm import tqdm
+            starts = tqdm(starts, desc="Batches")
+        for start in starts:
+            batch = order[start:start + batch_size]
+            encodings = self._tokenizer.encode_batch([texts[i] for i in batch])
+            feed = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self._session.run(None, {name: feed[name] for name in self._inputs})[0]
+            vectors[batch] = self._pool(hidden, feed["attention_mask"])
+        return vectors
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self._pooling == "cls":
+            pooled = hidden[:, 0]
+        elif self._pooling == "max":
+            pooled = np.where(mask[:, :, None] > 0, hidden, -1e9).max(axis=1)
+        else:
+            weights = mask[:, :, None].astype("float32")
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        if self._normalize:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype("float32")
+
+
+def export_model(name: str, onnx: bool = False, quantize: bool = False) -> str:
+    """Save `name` to MODEL_DIR, optionally with an ONNX export of the
+    transformer (onnx/model.onnx) and an int8 copy (onnx/model.int8.onnx)."""
+    from sentence_transformers import SentenceTransformer
+
+    path = local_model_path(name)
+    model = SentenceTransformer(name)
+    model.save(path)
+    if not (onnx or quantize):
+        return path
+
+    import torch
+
+    onnx_path = os.path.join(path, ONNX_FILES["onnx"])
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    transformer = model[0].auto_model.eval()
+    transformer.config.return_dict = False  # plain tuple outputs trace more reliably
+    sample = model.tokenizer(["An example sentence"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, tuple(sample[n] for n in input_names), onnx_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(onnx_path, os.path.join(path, ONNX_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+    return path
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Save embedding models locally so the app starts without the Hub")
+    sub = ap.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export")
+    export.add_argument("models", nargs="*", default=[MODEL_NAME])
+    export.add_argument("--onnx", action="store_true", help="also export the transformer to ONNX")
+    export.add_argument("--quantize", action="store_true", help="also write an int8-quantized ONNX copy")
+    args = ap.parse_args()
+    for name in args.models:
+        print(f"Saved {name} to {export_model(name, args.onnx, args.quantize)}")
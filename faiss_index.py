@@ -1,28 +1,108 @@
-import faiss
+import argparse
 import numpy as np
 import json
-from sentence_transformers import SentenceTransformer
+import os
+from ann_index import (DEFAULT_PARAMS, INDEX_TYPES, METRICS, build_index, load_index,
+                       load_index_ids, save_index, supports_updates, update_index)
+from bm25_index import BM25Index, bm25_path
+from chunk_filters import FilterIndex, corpus_records, filters_path
+from corpus_store import CORPUS_PREFIX, CorpusStore, corpus_exists, write_corpus
+from index_generation import write_build_marker
 
-# Load model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+INDEX_PATH = "semantic_index.faiss"
 
-# Load embedded data
-with open("embedded_chunks.jsonl", "r", encoding="utf-8") as f:
-    data = [json.loads(line) for line in f]
+# --- CLI: index type and tuning parameters (defaults keep the exact flat L2 index) ---
+ap = argparse.ArgumentParser(description="Build the FAISS index over the corpus embeddings.")
+ap.add_argument("--type", choices=INDEX_TYPES, default="flat")
+ap.add_argument("--metric", choices=METRICS, default="l2",
+                help="ip = inner product on normalized vectors (cosine similarity)")
+ap.add_argument("--nlist", type=int, default=DEFAULT_PARAMS["nlist"])
+ap.add_argument("--nprobe", type=int, default=DEFAULT_PARAMS["nprobe"])
+ap.add_argument("--pq-m", type=int, default=DEFAULT_PARAMS["pq_m"])
+ap.add_argument("--pq-nbits", type=int, default=DEFAULT_PARAMS["pq_nbits"])
+ap.add_argument("--hnsw-m", type=int, default=DEFAULT_PARAMS["hnsw_m"])
+ap.add_argument("--ef-construction", type=int, default=DEFAULT_PARAMS["ef_construction"])
+ap.add_argument("--ef-search", type=int, default=DEFAULT_PARAMS["ef_search"])
+ap.add_argument("--rebuild", action="store_true",
+                help="rebuild from scratch instead of updating the existing index in place")
+ap.add_argument("--no-bm25", action="store_true", help="skip building the BM25 keyword index")
+args = ap.parse_args()
 
-texts = [item["text"] for item in data]
-embeddings = np.array([item["embedding"] for item in data], dtype="float32")
+
+def build_bm25(corpus):
+    # Keyword index over the chunk texts (rows line up with the corpus rows)
+    if args.no_bm25:
+        # Postings of an earlier build would match a same-sized corpus and be served stale
+        if os.path.exists(bm25_path(INDEX_PATH)):
+            os.remove(bm25_path(INDEX_PATH))
+            print(" Removed the old BM25 index (--no-bm25).")
+        return
+    bm25 = BM25Index.build(corpus.field(i, "text") for i in range(len(corpus)))
+    bm25.save(bm25_path(INDEX_PATH))
+    print(f" BM25 index built with {len(bm25.vocab)} terms over {len(bm25)} chunks.")
+
+
+def build_filters(corpus):
+    # Source/tag bitsets and creation days for filtered search (rows line up with the corpus rows)
+    filters = FilterIndex.build(corpus_records(corpus))
+    filters.save(filters_path(INDEX_PATH))
+    print(f" Filter bitsets built for {len(filters.bitsets)} sources/tags over {len(filters)} chunks.")
+
+# Convert a corpus from the old embedded_chunks.jsonl format if that's all we have
+if not corpus_exists(CORPUS_PREFIX) and os.path.exists("embedded_chunks.jsonl"):
+    with open("embedded_chunks.jsonl", "r", encoding="utf-8") as f:
+        data = [json.loads(line) for line in f if line.strip()]
+    embeddings = np.array([item["embedding"] for item in data], dtype="float32")
+    write_corpus(data, embeddings, prefix=CORPUS_PREFIX)
+    print(f" Converted embedded_chunks.jsonl to {CORPUS_PREFIX}.*")
+
+# Load embedded data (memory-mapped float32 matrix + stable chunk ids)
+corpus = CorpusStore(CORPUS_PREFIX)
+corpus_ids = None if corpus.ids is None else np.asarray(corpus.ids)
+
+# Incremental update: if the existing index has the same type/metric and
+# tracks ids, only remove deleted/edited chunks and add new ones
+if not args.rebuild and corpus_ids is not None and os.path.exists(INDEX_PATH):
+    index, info = load_index(INDEX_PATH)
+    old_ids = load_index_ids(INDEX_PATH)
+    if (old_ids is not None and supports_updates(info) and info["type"] == args.type
+            and info["metric"] == args.metric and info["dim"] == corpus.embeddings.shape[1]):
+        removed = np.setdiff1d(old_ids, corpus_ids)
+        added_rows = np.flatnonzero(~np.isin(corpus_ids, old_ids))
+        update_index(index, info, np.asarray(corpus.embeddings[added_rows], dtype="float32"),
+                     corpus_ids[added_rows], removed)
+        save_index(index, info, INDEX_PATH, ids=corpus_ids)
+        print(f" FAISS index ({info['type']}, {info['metric']}) updated: "
+              f"+{len(added_rows)} / -{len(removed)}, {index.ntotal} vectors.")
+        build_bm25(corpus)
+        build_filters(corpus)
+        write_build_marker(INDEX_PATH, {"count": len(corpus), "type": info["type"]})
+        raise SystemExit(0)
+    print(" Existing index can't be updated in place, rebuilding.")
+
+embeddings = np.ascontiguousarray(corpus.embeddings, dtype="float32")
 
 # Build FAISS index
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatL2(dimension)
-index.add(embeddings)
+index, info = build_index(
+    embeddings,
+    index_type=args.type,
+    metric=args.metric,
+    ids=corpus_ids,
+    nlist=args.nlist,
+    nprobe=args.nprobe,
+    pq_m=args.pq_m,
+    pq_nbits=args.pq_nbits,
+    hnsw_m=args.hnsw_m,
+    ef_construction=args.ef_construction,
+    ef_search=args.ef_search,
+)
 
-# Save the index
-faiss.write_index(index, "semantic_index.faiss")
+# Save the index (ids are stable chunk ids, or corpus rows for old corpora) and its settings
+save_index(index, info, INDEX_PATH, ids=corpus_ids)
 
-# Save metadata for lookup
-with open("metadata.json", "w", encoding="utf-8") as f:
-    json.dump(data, f)
+print(f" FAISS index ({info['type']}, {info['metric']}) built with {index.ntotal} vectors.")
 
-print(f" FAISS index built with {len(embeddings)} vectors.")
+build_bm25(corpus)
+build_filters(corpus)
+# Last: a running server reloads once this changes (INDEX_WATCH_INTERVAL)
+write_build_marker(INDEX_PATH, {"count": len(corpus), "type": info["type"]})
@@ -0,0 +1,51 @@
+import math
+import re
+from typing import List
+
+from bm25_index import tokenize
+
+# --- CONFIG ---
+MAX_SENTENCES = 3
+MAX_SENTENCE_CHARS = 400
+MIN_SENTENCE_CHARS = 20
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+INTRO = "The answer service is busy right now, so here are the most relevant passages from the course materials:"
+NOTHING_FOUND = ("The answer service is busy right now and I couldn't find matching course material. "
+                 "Please try again in a moment.")
+
+
+def extractive_answer(question: str, chunks: List[dict], max_sentences: int = MAX_SENTENCES) -> str:
+    """A fast answer without the LLM: the sentences of the retrieved chunks
+    that share the most terms with the question, better-ranked chunks first.
+
+    Used when the LLM is failing, its circuit breaker is open or it misses the
+    answer deadline, so a question always gets a useful reply in bounded time.
+    """
+    terms = set(tokenize(question))
+    candidates = []  # (score, chunk rank, position, sentence)
+    for rank, chunk in enumerate(chunks):
+        for position, sentence in enumerate(SENTENCE_RE.split(chunk.get("text") or "")):
+            sentence = " ".join(sentence.split())
+            if len(sentence) < MIN_SENTENCE_CHARS:
+                continue
+            tokens = tokenize(sentence)
+            overlap = len(terms.intersection(tokens))
+            if not overlap:
+                continue
+            # Term overlap, damped for long sentences and lower-ranked chunks
+            score = overlap / math.sqrt(len(tokens)) / (1 + 0.25 * rank)
+            candidates.append((score, rank, position, sentence))
+    if not candidates and chunks:
+        # No term overlap at all: fall back to the opening of the best chunk
+        opening = " ".join((chunks[0].get("text") or "").split())
+        candidates = [(0.0, 0, 0, opening)] if opening else []
+    if not candidates:
+        return NOTHING_FOUND
+
+    best = sorted(candidates, key=lambda c: -c[0])[:max_sentences]
+    passages = []
+    for _, _, _, sentence in sorted(best, key=lambda c: (c[1], c[2])):
+        if len(sentence) > MAX_SENTENCE_CHARS:
+            sentence = sentence[:MAX_SENTENCE_CHARS].rsplit(" ", 1)[0] + " …"
+        passages.append(f"- {sentence}")
+    return INTRO + "\n\n" + "\n".join(passages)
@@ -1,28 +1,165 @@
-from sentence_transformers import SentenceTransformer
+import argparse
 import json
-from tqdm import tqdm
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+from corpus_store import CORPUS_PREFIX, CorpusStore, CorpusWriter, EmbeddingSpool, chunk_id, corpus_exists
+from encoder import BACKEND, BACKENDS, MODEL_NAME, Encoder
 
-# Load embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# --- CONFIG ---
+INPUT_FILE = "chunks.jsonl"
+READ_BATCH = 512  # chunks read, encoded and written per step
+ENCODE_BATCH = 32  # model.encode batch size inside a worker
+IN_FLIGHT_PER_WORKER = 2  # read-ahead batches per worker; bounds memory
 
-# Load chunks
-chunks = []
-with open("chunks.jsonl", "r", encoding="utf-8") as f:
-    for line in f:
-        chunks.append(json.loads(line))
+# --- WORKERS ---
+_encoder = None
 
-# Extract texts
-texts = [chunk['text'] for chunk in chunks]
+def _init_worker(model, backend, threads):
+    global _encoder
+    _encoder = Encoder(model, backend, threads=threads)
 
-# Generate embeddings
-print(" Generating embeddings...")
-embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+def _encode(texts):
+    return _encoder.encode(texts, batch_size=ENCODE_BATCH)
 
-# Save to file
-with open("embedded_chunks.jsonl", "w", encoding="utf-8") as f:
-    for chunk, vector in zip(chunks, embeddings):
-        chunk["embedding"] = vector.tolist()
-        f.write(json.dumps(chunk) + "\n")
+class _Done:
+    # Stand-in for a future when encoding in-process
+    def __init__(self, value):
+        self.value = value
 
-print(f"Saved {len(chunks)} embeddings to embedded_chunks.jsonl")
+    def result(self):
+        return self.value
+
+# --- PIPELINE ---
+def read_chunks(path, batch_size):
+    # Stream chunks in batches, dropping exact duplicates (same url/title/text => same id)
+    seen = set()
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            chunk = json.loads(line)
+            cid = chunk.get("chunk_id")
+            if cid is None:
+                cid = chunk_id(chunk)
+            if cid in seen:
+                continue
+            seen.add(cid)
+            batch.append((cid, chunk))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def embed_corpus(model, backend, workers, threads, full=False):
+    meta = {"model": model, "backend": backend}
+
+    # The previous corpus is the manifest of what's already embedded: reuse the
+    # vectors of chunks whose id (content hash) is unchanged
+    old = None
+    if not full and corpus_exists(CORPUS_PREFIX):
+        old = CorpusStore(CORPUS_PREFIX)
+        same_encoder = old.meta.get("model") == model and old.meta.get("backend", "torch") == backend
+        if old.ids is None or old.embeddings is None or not same_encoder:
+            old = None
+    # Vectors encoded by an interrupted run of this job
+    spool = EmbeddingSpool(CORPUS_PREFIX, meta, fresh=full)
+    if spool.count:
+        print(f" Resuming: {spool.count} vectors from an interrupted run")
+
+    pool = None
+    local_encoder = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model, backend, threads))
+
+    stats = {"chunks": 0, "reused": 0, "encoded": 0, "removed": 0, "encode_s": 0.0}
+    kept_from_old = 0
+    pending = deque()
+    start = time.perf_counter()
+
+    def submit(batch):
+        nonlocal local_encoder
+        ids = np.array([cid for cid, _ in batch], dtype=np.int64)
+        old_rows = old.rows_for_ids(ids) if old is not None else np.full(len(ids), -1)
+        spool_rows = spool.rows_for_ids(ids)
+        todo = np.flatnonzero((old_rows < 0) & (spool_rows < 0))
+        texts = [batch[i][1]["text"] for i in todo]
+        if not texts:
+            future = _Done(None)
+        elif pool is not None:
+            future = pool.submit(_encode, texts)
+        else:
+            if local_encoder is None:
+                local_encoder = Encoder(model, backend, threads=threads)
+            future = _Done(local_encoder.encode(texts, batch_size=ENCODE_BATCH))
+        pending.append((batch, ids, old_rows, spool_rows, todo, future))
+
+    def write_oldest(writer):
+        nonlocal kept_from_old
+        batch, ids, old_rows, spool_rows, todo, future = pending.popleft()
+        new_vectors = future.result()
+        if new_vectors is not None:
+            spool.append(ids[todo], new_vectors)
+            dim = new_vectors.shape[1]
+        else:
+            dim = spool.dim if (spool_rows >= 0).any() else old.embeddings.shape[1]
+
+        vectors = np.empty((len(batch), dim), dtype="float32")
+        from_old = np.flatnonzero(old_rows >= 0)
+        kept_from_old += len(from_old)
+        if len(from_old):
+            vectors[from_old] = old.embeddings[old_rows[from_old]]
+        from_spool = np.flatnonzero(spool_rows >= 0)
+        if len(from_spool):
+            vectors[from_spool] = spool.vectors(spool_rows[from_spool])
+        if new_vectors is not None:
+            vectors[todo] = new_vectors
+        writer.add_many([chunk for _, chunk in batch], vectors, ids)
+
+        stats["chunks"] += len(batch)
+        stats["encoded"] += len(todo)
+        stats["reused"] += len(batch) - len(todo)
+        elapsed = time.perf_counter() - start
+        print(f"  {stats['chunks']} chunks ({stats['encoded']} encoded, "
+              f"{stats['encoded'] / max(elapsed, 1e-9):.1f} chunks/sec)", end="\r")
+
+    try:
+        # Save text/url/title + ids + float32 vectors in the binary corpus format
+        with CorpusWriter(CORPUS_PREFIX, meta=meta) as writer:
+            for batch in read_chunks(INPUT_FILE, READ_BATCH):
+                submit(batch)
+                while len(pending) > max(1, workers) * IN_FLIGHT_PER_WORKER:
+                    write_oldest(writer)
+            while pending:
+                write_oldest(writer)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    spool.remove()
+
+    stats["encode_s"] = time.perf_counter() - start
+    if old is not None:
+        stats["removed"] = len(old) - kept_from_old
+    return stats
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embed chunks.jsonl into the corpus store.")
+    ap.add_argument("--full", action="store_true", help="re-encode every chunk instead of only new/changed ones")
+    ap.add_argument("--model", default=MODEL_NAME, help="embedding model (EMBEDDING_MODEL)")
+    ap.add_argument("--backend", default=BACKEND, choices=BACKENDS, help="encoder backend (EMBEDDING_BACKEND)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="encoder processes (1 = encode in this process)")
+    ap.add_argument("--threads", type=int, default=None, help="threads per worker (default: cores / workers)")
+    args = ap.parse_args()
+    threads = args.threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+
+    print(f" Embedding {INPUT_FILE} with {args.model} ({args.backend}), {args.workers} workers x {threads} threads")
+    stats = embed_corpus(args.model, args.backend, args.workers, threads, args.full)
+    print(f"\n {stats['chunks']} chunks: {stats['reused']} reused, {stats['encoded']} embedded, "
+          f"{stats['removed']} removed")
+    rate = stats["encoded"] / stats["encode_s"] if stats["encode_s"] else 0.0
+    print(f" Throughput: {rate:.1f} chunks/sec on {args.workers} workers x {threads} threads "
+          f"({stats['encode_s']:.1f}s)")
+    print(f"Saved {stats['chunks']} embeddings to {CORPUS_PREFIX}.*")
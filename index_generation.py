@@ -0,0 +1,132 @@
+import json
+import os
+import time
+from typing import NamedTuple, Optional
+
+import faiss
+import numpy as np
+
+from ann_index import EXACT_SEARCH_ROWS, enable_reconstruct, load_index, row_selector, search_params
+from answer_cache import index_fingerprint
+from bm25_index import bm25_path, load_bm25
+from chunk_filters import FilterIndex, RowFilter, corpus_records, filters_path, load_filters
+from corpus_store import CorpusStore, corpus_paths
+
+
+class IndexMismatchError(Exception):
+    """The index and corpus on disk come from different builds (e.g. a refresh is still writing them)."""
+
+
+def build_marker_path(index_path: str) -> str:
+    # semantic_index.faiss -> semantic_index.built.json
+    return os.path.splitext(index_path)[0] + ".built.json"
+
+
+def write_build_marker(index_path: str, info: dict):
+    # Written by faiss_index.py after every other index file: a complete build
+    path = build_marker_path(index_path)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"built_at": time.time(), **info}, f)
+    os.replace(path + ".tmp", path)
+
+
+def files_version(index_path: str, corpus_prefix: str) -> str:
+    """Changes once a rebuild of the index files has completed.
+
+    That is when faiss_index.py rewrites the build marker, after the index,
+    BM25 and filter files. Indexes built before the marker existed fall back
+    to fingerprinting each file (plus the corpus header)."""
+    marker = build_marker_path(index_path)
+    if os.path.exists(marker):
+        return f"built:{index_fingerprint(marker)}"
+    paths = (index_path, bm25_path(index_path), filters_path(index_path), corpus_paths(corpus_prefix)["header"])
+    return "/".join(index_fingerprint(path) for path in paths)
+
+
+class Selection(NamedTuple):
+    """The rows a filtered search may return, compiled for one generation."""
+    mask: np.ndarray  # bool per corpus row (for BM25)
+    bitmap: np.ndarray  # packed; referenced by the selector, so kept here
+    selector: faiss.IDSelector
+    params: faiss.SearchParameters
+    count: int
+    rows: Optional[np.ndarray]  # the selected rows, when few enough to search exactly
+
+
+class Generation:
+    """A corpus, FAISS index and BM25 postings loaded together.
+
+    A search takes the current generation once and uses it throughout, so a
+    reload that swaps in the next generation never mixes the rows of two
+    builds, and searches already running finish on the old one.
+    """
+
+    def __init__(self, number: int, version: str, corpus: CorpusStore, index, index_info: dict, bm25=None,
+                 filters: Optional[FilterIndex] = None):
+        self.number = number
+        self.version = version
+        self.corpus = corpus
+        self.index = index
+        self.index_info = index_info
+        self.bm25 = bm25
+        self.filters = filters
+        self.loaded_at = time.time()
+
+    def selection(self, row_filter: RowFilter) -> Selection:
+        # Compiled once per distinct filter and cached by the filter index
+        def compile_selection(bitmap, mask):
+            ids = self.corpus.ids if self.index_info.get("ids") else None
+            count = int(mask.sum())
+            selector = row_selector(self.index_info, bitmap, ids)
+            params = search_params(self.index, self.index_info, selector, count / max(len(mask), 1))
+            exact = count <= EXACT_SEARCH_ROWS and self.corpus.embeddings is not None
+            return Selection(mask, bitmap, selector, params, count, np.flatnonzero(mask) if exact else None)
+        return self.filters.select(row_filter, compile_selection)
+
+    def info(self) -> dict:
+        return {
+            "generation": self.number,
+            "version": self.version,
+            "chunks": len(self.corpus),
+            "index_type": self.index_info.get("type"),
+            "bm25": self.bm25 is not None,
+            "filters": self.filters.info() if self.filters is not None else None,
+            "loaded_at": round(self.loaded_at, 3),
+        }
+
+
+def load_generation(number: int, index_path: str, corpus_prefix: str, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None, strict: bool = True) -> Generation:
+    """Load the index and corpus on disk as generation `number`.
+
+    With `strict`, an index whose row count differs from the corpus raises
+    IndexMismatchError; otherwise it's only reported. A mismatched BM25 index
+    is dropped (dense retrieval only); missing or mismatched filter bitsets
+    are rebuilt from the corpus."""
+    version = files_version(index_path, corpus_prefix)
+    corpus = CorpusStore(corpus_prefix)
+    # Open every corpus file now: the refresh job replaces them in place, and a
+    # lazily opened one would come from the next build
+    rows = len(corpus)
+    corpus.ids
+    corpus.embeddings
+
+    index, index_info = load_index(index_path, nprobe=nprobe, ef_search=ef_search)
+    if index.ntotal != rows:
+        message = f"index has {index.ntotal} vectors but the corpus has {rows} chunks (re-run faiss_index.py)"
+        if strict:
+            raise IndexMismatchError(message)
+        print(f"Warning: {message}")
+    enable_reconstruct(index, index_info)
+
+    bm25 = load_bm25(index_path)
+    if bm25 is not None and len(bm25) != rows:
+        print("BM25 index doesn't match the corpus (re-run faiss_index.py); using dense retrieval only.")
+        bm25 = None
+
+    filters = load_filters(index_path)
+    if filters is None or len(filters) != rows:
+        # Indexes built before the bitsets existed; faiss_index.py precomputes them
+        print("Building the filter bitsets from the corpus (re-run faiss_index.py to precompute them).")
+        filters = FilterIndex.build(corpus_records(corpus))
+    return Generation(number, version, corpus, index, index_info, bm25, filters)
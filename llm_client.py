@@ -0,0 +1,219 @@
+import asyncio
+import json
+import random
+import time
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+
+# --- CONFIG ---
+DEFAULT_TIMEOUT = 30.0  # seconds for the whole completion
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_MAX_CONNECTIONS = 32  # pooled sockets to the LLM endpoint
+DEFAULT_MAX_CONCURRENCY = 32  # LLM calls allowed in flight at once
+DEFAULT_RETRIES = 2  # extra attempts after a 429/5xx or connection error
+DEFAULT_BACKOFF = 0.25  # seconds; attempt n waits uniform(0, BACKOFF * 2**n)
+DEFAULT_MAX_BACKOFF = 4.0
+DEFAULT_BREAKER_FAILURES = 5  # consecutive failed calls that open the circuit
+DEFAULT_BREAKER_RESET = 30.0  # seconds the circuit stays open before a trial call
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """The LLM endpoint failed repeatedly; calls are refused until the breaker resets."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Closed: calls go through. After `failures` failed calls in a row it opens
+    and refuses calls for `reset_timeout` seconds, then lets one trial call
+    through (half-open): success closes it again, failure re-opens it.
+    """
+
+    def __init__(self, failures: int = DEFAULT_BREAKER_FAILURES, reset_timeout: float = DEFAULT_BREAKER_RESET):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        # One trial at a time; a trial that never reported back (cancelled) expires
+        if state == "half_open" and (self._trial_started is None or now - self._trial_started >= self.reset_timeout):
+            self._trial_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self._trial_started is not None or self.consecutive_failures >= self.failures:
+            self.opened_at = time.monotonic()
+        self._trial_started = None
+
+    def info(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+class LLMClient:
+    """Shared async client for the chat-completions endpoint.
+
+    One pooled, keep-alive `httpx.AsyncClient` is reused by every request and a
+    semaphore caps how many completions are in flight at once. Rate limits,
+    5xx responses and connection errors are retried `retries` times with
+    jittered exponential backoff, and a circuit breaker stops calling the
+    endpoint while it keeps failing (CircuitOpenError). `on_event` is called
+    with "llm_retry" / "llm_circuit_open" for metrics.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: dict,
+        timeout: float = DEFAULT_TIMEOUT,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        retries: int = DEFAULT_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        breaker: Optional[CircuitBreaker] = None,
+        on_event: Optional[Callable[[str], None]] = None,
+    ):
+        self.url = url
+        # requests silently dropped None headers (e.g. a missing API key); httpx rejects them
+        self.headers = {k: v for k, v in headers.items() if v is not None}
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.on_event = on_event
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers, timeout=self.timeout, limits=self.limits
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+    def _event(self, name: str):
+        if self.on_event is not None:
+            self.on_event(name)
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            self._event("llm_circuit_open")
+            raise CircuitOpenError(f"LLM circuit open after {self.breaker.consecutive_failures} failures")
+
+    async def _backoff(self, attempt: int):
+        # "Full jitter": spreads out the retries of requests that failed together
+        self._event("llm_retry")
+        await asyncio.sleep(random.uniform(0, min(DEFAULT_MAX_BACKOFF, self.backoff * 2 ** attempt)))
+
+    async def chat(self, payload: dict) -> httpx.Response:
+        # Lazily start so scripts can use the client without a lifespan hook
+        await self.start()
+        self._check_breaker()
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await self._client.post(self.url, json=payload)
+            except httpx.TransportError:
+                if attempt >= self.retries:
+                    self.breaker.record_failure()
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS:
+                    # Other 4xx are the request's fault, not the endpoint's
+                    self.breaker.record_success()
+                    return response
+                if attempt >= self.retries:
+                    self.breaker.record_failure()
+                    return response
+            await self._backoff(attempt)
+            attempt += 1
+
+    async def stream_chat(self, payload: dict, usage: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield content deltas from a `"stream": true` completion (OpenAI SSE).
+
+        If the endpoint sends token usage (`stream_options.include_usage`), it
+        is copied into the `usage` dict when given. Failures before the first
+        delta are retried like `chat`; once tokens flow they are not."""
+        await self.start()
+        self._check_breaker()
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    async with self._client.stream("POST", self.url, json=payload) as response:
+                        if not response.is_success:
+                            body = (await response.aread()).decode("utf-8", "replace")
+                            raise httpx.HTTPStatusError(
+                                f"Error: {response.status_code} - {body}",
+                                request=response.request,
+                                response=response,
+                            )
+                        async for delta in self._iter_deltas(response, usage):
+                            attempt = None  # streaming started: no more retries
+                            yield delta
+                self.breaker.record_success()
+                return
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = isinstance(e, httpx.TransportError) or e.response.status_code in RETRY_STATUS
+                if attempt is None or not retryable or attempt >= self.retries:
+                    if retryable:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    raise
+            await self._backoff(attempt)
+            attempt += 1
+
+    async def _iter_deltas(self, response: httpx.Response, usage: Optional[dict]) -> AsyncIterator[str]:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if usage is not None and chunk.get("usage"):
+                usage.update(chunk["usage"])
+            choices = chunk.get("choices") or []
+            if choices:
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
@@ -1,58 +1,358 @@
-import requests
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import List, Optional
+from datetime import date
+from typing import List, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
-import faiss
+import asyncio
+import hmac
 import json
+import threading
+import time
 import uvicorn
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import os
-import base64
-from io import BytesIO
-from PIL import Image
-import pytesseract
 from dotenv import load_dotenv
+from llm_client import CircuitBreaker, CircuitOpenError, LLMClient
+from answer_cache import AnswerCache, normalize_question
+from query_batcher import MicroBatcher, SingleFlight, StreamFlight
+from corpus_store import CORPUS_PREFIX
+from ann_index import exact_search, prepare_queries, reconstruct
+from bm25_index import reciprocal_rank_fusion
+from index_generation import Generation, files_version, load_generation
+from course_shards import CourseShards, UnknownCourseError
+from chunk_filters import SOURCES, RowFilter, day_number
+from ocr import OCRPipeline
+from rerank import cosine_similarities, mmr
+from encoder import Encoder
+from context_builder import ContextBuilder
+from fallback_answer import extractive_answer
+from metrics import (TimingMiddleware, count, observe, observe_batch, record_context, record_llm_usage,
+                     render_metrics, span)
 load_dotenv()
 
 AIPIPE_API_KEY = os.getenv("AIPIPE_API_KEY")
-AIPIPE_LLM_URL = "https://aipipe.org/openai/v1/chat/completions"
+AIPIPE_LLM_URL = os.getenv("AIPIPE_LLM_URL", "https://aipipe.org/openai/v1/chat/completions")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# 429/5xx and connection errors are retried with jittered backoff; after
+# LLM_BREAKER_FAILURES failed calls in a row the endpoint isn't called for
+# LLM_BREAKER_RESET seconds. While the breaker is open, or when the LLM misses
+# LLM_DEADLINE (seconds to the answer, or to the first token when streaming;
+# 0 = none), the answer is extracted from the retrieved chunks instead
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.25"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "20")) or None
+# INDEX_PATH / CORPUS_PREFIX point the app at another index and corpus (e.g. a synthetic benchmark corpus)
+INDEX_PATH = os.getenv("INDEX_PATH", "semantic_index.faiss")
+# Query encoder: EMBEDDING_MODEL / EMBEDDING_BACKEND (torch, onnx, onnx-int8),
+# shared with generate_embeddings.py so queries and chunks use the same model
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
 
-# Configure Tesseract path based on environment
-if os.name == 'nt':  # Windows
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-else:  # Linux/Unix
-    pytesseract.pytesseract.tesseract_cmd = 'tesseract'
+# "eager" loads the model and index in the lifespan before the first request;
+# "background" accepts requests at once and loads them in a thread (GET /ready
+# answers 503 until done, and questions wait up to STARTUP_WAIT seconds)
+STARTUP_MODE = os.getenv("STARTUP_MODE", "eager")
+STARTUP_WAIT = float(os.getenv("STARTUP_WAIT", "30"))
+# Optional overrides of the search-time knobs saved with the index (IVF / HNSW)
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "0")) or None
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "0")) or None
+# Hot reload of a rebuilt index + corpus without a restart: POST /admin/reload
+# (enabled by setting ADMIN_TOKEN, sent as "Authorization: Bearer <token>"), or
+# polling the files every INDEX_WATCH_INTERVAL seconds (0 = off)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "0"))
+# Several courses/terms from one deployment: each COURSES_DIR/<course>/ holding
+# its own semantic_index.faiss + corpus.* is a course that questions select with
+# "course" (a name, or a list of up to COURSE_MAX_FANOUT searched in parallel
+# and merged). Course shards load on first use; the least recently used are
+# evicted beyond COURSE_MEMORY_BUDGET_MB. Questions without one use INDEX_PATH.
+COURSES_DIR = os.getenv("COURSES_DIR") or None
+COURSE_MEMORY_BUDGET_MB = int(os.getenv("COURSE_MEMORY_BUDGET_MB", "2048"))
+COURSE_MAX_FANOUT = int(os.getenv("COURSE_MAX_FANOUT", "8"))
+
+# "hybrid" fuses BM25 keyword hits with the vector results (needs semantic_index.bm25.npz)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_SPARSE_WEIGHT = float(os.getenv("HYBRID_SPARSE_WEIGHT", "0.5"))  # 0 = dense only, 1 = BM25 only
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # per retriever, before fusion
+
+# Post-filtering of the candidates (vectors read back from the index by id):
+# a cosine-similarity cutoff, at most RETRIEVAL_MAX_PER_URL chunks per page, and
+# MMR diversification (RETRIEVAL_MMR_LAMBDA=1 ranks by relevance only). When any
+# is on, RETRIEVAL_CANDIDATES hits are fetched and narrowed down to k.
+RETRIEVAL_MIN_SIMILARITY = float(os.getenv("RETRIEVAL_MIN_SIMILARITY", "0")) or None
+RETRIEVAL_MAX_PER_URL = int(os.getenv("RETRIEVAL_MAX_PER_URL", "2")) or None
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", "0.7"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "50"))
+
+# Answer cache (set ANSWER_CACHE_SIZE=0 to disable, ANSWER_CACHE_PATH to persist)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH") or None
+
+# Micro-batching of concurrent queries (QUERY_BATCH_SIZE=1 disables it)
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "2"))
+
+# OCR of image uploads (process pool size, input limits, result cache)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "20000000"))
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "2000"))
+OCR_MAX_BYTES = int(os.getenv("OCR_MAX_BYTES", str(10 * 1024 * 1024)))
+OCR_FETCH_TIMEOUT = float(os.getenv("OCR_FETCH_TIMEOUT", "10"))
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+
+# LLM context: retrieved chunks are merged/deduplicated and packed into this many
+# tokens (counted with tiktoken when installed); 0 sends them all, joined as-is
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+
+# Add an X-Timing header with the per-stage breakdown (ms) to every response
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"
 
 HEADERS = {
     "Authorization": AIPIPE_API_KEY,
     "Content-Type": "application/json"
 }
 
-# Load FAISS index and metadata
-index = faiss.read_index("semantic_index.faiss")
+# Shared, pooled client for LLM calls (opened/closed in the app lifespan)
+llm_client = LLMClient(
+    AIPIPE_LLM_URL,
+    HEADERS,
+    timeout=LLM_TIMEOUT,
+    max_connections=LLM_MAX_CONNECTIONS,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    retries=LLM_RETRIES,
+    backoff=LLM_RETRY_BACKOFF,
+    breaker=CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET),
+    on_event=count,
+)
+
+# Identical questions in flight at the same time share one retrieval + LLM call
+answer_flight = SingleFlight()
+stream_flight = StreamFlight()
+
+ocr_pipeline = OCRPipeline(
+    workers=OCR_WORKERS,
+    max_pixels=OCR_MAX_PIXELS,
+    max_side=OCR_MAX_SIDE,
+    max_bytes=OCR_MAX_BYTES,
+    fetch_timeout=OCR_FETCH_TIMEOUT,
+    cache_size=OCR_CACHE_SIZE,
+    on_timing=lambda stage, seconds: observe(f"image_{stage}", seconds),
+)
+
+# The index, corpus (memory-mapped), model and caches are loaded by
+# load_resources() so importing main stays cheap. The index, corpus and BM25
+# postings form one `generation`, replaced as a whole by reload_generation()
+generation: Optional[Generation] = None
+course_shards: Optional[CourseShards] = None
+model = answer_cache = context_builder = None
+resources_ready = threading.Event()
+startup_task: Optional[asyncio.Task] = None
+watch_task: Optional[asyncio.Task] = None
+startup_error = None
+_load_lock = threading.Lock()
+
+def check_model(corpus):
+    built_with = corpus.meta.get("model")
+    if built_with and built_with != model.name:
+        print(f"Warning: chunks were embedded with {built_with} but queries use {model.name}; "
+              "set EMBEDDING_MODEL or re-run generate_embeddings.py.")
+
+def load_resources():
+    global generation, course_shards, model, answer_cache, context_builder
+    with _load_lock:
+        if resources_ready.is_set():
+            return
+        start = time.perf_counter()
+        # Load FAISS index, corpus and BM25 postings
+        generation = load_generation(1, INDEX_PATH, CORPUS_PREFIX, INDEX_NPROBE, INDEX_EF_SEARCH, strict=False)
+        if COURSES_DIR:
+            course_shards = CourseShards(COURSES_DIR, COURSE_MEMORY_BUDGET_MB * 1024 * 1024,
+                                         nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH)
+            print(f"Courses in {COURSES_DIR}: {', '.join(course_shards.courses()) or 'none'}")
+
+        # Local LLM tokenizer for packing the context
+        if CONTEXT_TOKEN_BUDGET > 0:
+            context_builder = ContextBuilder(CONTEXT_TOKEN_BUDGET)
+
+        # Load local embedding model (from models/ if it was exported there)
+        model = Encoder(max_seq_length=128, threads=EMBEDDING_THREADS)
+        check_model(generation.corpus)
+
+        if ANSWER_CACHE_SIZE > 0:
+            answer_cache = AnswerCache(
+                model.get_sentence_embedding_dimension(),
+                max_entries=ANSWER_CACHE_SIZE,
+                ttl=ANSWER_CACHE_TTL,
+                similarity=ANSWER_CACHE_SIMILARITY,
+                max_bytes=ANSWER_CACHE_MAX_BYTES,
+                path=ANSWER_CACHE_PATH,
+                index_version=generation.version,
+            )
+            answer_cache.load()
+        observe("startup_load", time.perf_counter() - start, per_request=False)
+        print(f"Loaded index and model in {time.perf_counter() - start:.1f}s")
+        resources_ready.set()
+
+def reload_generation(force: bool = False) -> dict:
+    """Load the index and corpus on disk as the next generation and swap it in.
+
+    Searches already running keep the generation they started with. Raises
+    (keeping the current generation) if the index doesn't match the corpus,
+    e.g. while a refresh is still writing them."""
+    global generation
+    with _load_lock:
+        current = generation
+        courses = refresh_courses()
+        if not force and files_version(INDEX_PATH, CORPUS_PREFIX) == current.version:
+            return {"reloaded": False, "courses_reloaded": courses, **current.info()}
+        start = time.perf_counter()
+        try:
+            new = load_generation(current.number + 1, INDEX_PATH, CORPUS_PREFIX, INDEX_NPROBE, INDEX_EF_SEARCH)
+        except Exception:
+            count("index_reload_error")
+            raise
+        check_model(new.corpus)
+        generation = new
+        # Cached answers cite the old chunks; start over for the new generation
+        if answer_cache is not None:
+            if new.version == current.version:
+                # A forced reload of unchanged files keeps the version, so clear explicitly
+                answer_cache.clear()
+            answer_cache.set_index_version(new.version)
+        count("index_reload")
+        observe("index_reload", time.perf_counter() - start, per_request=False)
+        print(f"Loaded index generation {new.number} ({len(new.corpus)} chunks) "
+              f"in {time.perf_counter() - start:.1f}s")
+        return {"reloaded": True, "courses_reloaded": courses, **new.info()}
+
+# Reloads the loaded course shards whose files changed; returns their names
+def refresh_courses() -> List[str]:
+    if course_shards is None:
+        return []
+    courses = course_shards.refresh()
+    if courses:
+        # Scoped entries of those courses can't be told apart cheaply; start over
+        if answer_cache is not None:
+            answer_cache.clear()
+        count("index_reload", len(courses))
+        print(f"Reloaded courses: {', '.join(courses)}")
+    return courses
+
+# Changes whenever a reload swaps the default index or a course shard
+def serving_version() -> tuple:
+    return generation.number, course_shards.stats["reloads"] if course_shards is not None else 0
+
+# Reloads once the files have changed and then stayed the same for one interval
+# (faiss_index.py writes its build marker last; older indexes without one are
+# compared file by file)
+async def watch_index():
+    seen = failed = None
+    while True:
+        await asyncio.sleep(INDEX_WATCH_INTERVAL)
+        if not resources_ready.is_set():
+            continue
+        version = files_version(INDEX_PATH, CORPUS_PREFIX)
+        if version != generation.version and version == seen and version != failed:
+            try:
+                await asyncio.to_thread(reload_generation)
+            except Exception as e:
+                failed = version
+                print(f"Index reload failed: {e}")
+        elif course_shards is not None:
+            await asyncio.to_thread(refresh_courses)
+        seen = version
+
+async def _load_in_background():
+    global startup_error
+    try:
+        await asyncio.to_thread(load_resources)
+    except Exception as e:
+        startup_error = str(e)
+        print(f"Error loading resources: {e}")
 
-with open("embedded_chunks.jsonl", "r") as f:
-    embedded_chunks = [json.loads(line) for line in f if line.strip()]
+# True once the model and index are loaded; in background mode waits for the load
+async def wait_until_ready() -> bool:
+    if resources_ready.is_set():
+        return True
+    if startup_task is None:
+        return False
+    try:
+        await asyncio.wait_for(asyncio.shield(startup_task), STARTUP_WAIT)
+    except asyncio.TimeoutError:
+        pass
+    return resources_ready.is_set()
 
-with open("metadata.json", "r", encoding="utf-8") as f:
-    metadata = json.load(f)
+def not_ready_response() -> JSONResponse:
+    return JSONResponse(
+        {"answer": "The assistant is still starting up, please try again shortly.", "links": []},
+        status_code=503,
+        headers={"Retry-After": "5"},
+    )
 
-# Load local embedding model
-model = SentenceTransformer("paraphrase-MiniLM-L3-v2")
-model.max_seq_length = 128
+# Chunks a question may be answered from: any of the sources / tags given,
+# created within [since, until]. Unset fields don't restrict.
+class RetrievalFilter(BaseModel):
+    source: Optional[Union[str, List[str]]] = None  # "discourse" / "course"
+    tags: Optional[Union[str, List[str]]] = None  # Discourse topic tags
+    since: Optional[date] = None
+    until: Optional[date] = None
 
 # Define request body structure
 class QueryRequest(BaseModel):
     question: str
     image: Optional[str] = None  # base64 string
+    course: Optional[Union[str, List[str]]] = None  # course shard(s) to search (COURSES_DIR)
+    filter: Optional[RetrievalFilter] = None  # restrict retrieval to some chunks
+
+# RowFilter for a request's filter, None when it has none. Raises ValueError
+# for a filter the request can't have.
+def row_filter_for(retrieval_filter: Optional[RetrievalFilter]) -> Optional[RowFilter]:
+    if retrieval_filter is None:
+        return None
+    def values(value):
+        return tuple(sorted(set([value] if isinstance(value, str) else value or ())))
+    sources = values(retrieval_filter.source)
+    unknown = [s for s in sources if s not in SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown source {unknown[0]!r}; available: {', '.join(SOURCES)}")
+    since = day_number(retrieval_filter.since) if retrieval_filter.since else None
+    until = day_number(retrieval_filter.until) if retrieval_filter.until else None
+    if since is not None and until is not None and since > until:
+        raise ValueError("filter.since is after filter.until")
+    row_filter = RowFilter(sources, values(retrieval_filter.tags), since, until)
+    return row_filter if row_filter != RowFilter() else None
 
 # Set up FastAPI app
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global startup_task, watch_task
+    await llm_client.start()
+    if STARTUP_MODE == "background":
+        startup_task = asyncio.create_task(_load_in_background())
+    else:
+        await asyncio.to_thread(load_resources)
+    if INDEX_WATCH_INTERVAL > 0:
+        watch_task = asyncio.create_task(watch_index())
+    yield
+    if watch_task is not None:
+        watch_task.cancel()
+    await llm_client.close()
+    await ocr_pipeline.close()
+    if answer_cache is not None:
+        answer_cache.save()
+
+app = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 app.add_middleware(
     CORSMiddleware,
@@ -61,53 +361,246 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TimingMiddleware, header=TIMING_HEADER)
 
 # Semantic search logic
-def get_relevant_chunks(question: str, k: int = 5) -> List[dict]:
+def embed_questions(questions: List[str]) -> np.ndarray:
+    observe_batch("embed", len(questions))
+    with span("encode", per_request=False):
+        return model.encode(questions).astype("float32")
+
+def embed_question(question: str) -> np.ndarray:
+    return embed_questions([question])[0]
+
+def rows_for_index_ids(gen: Generation, ids) -> np.ndarray:
+    # Index ids are stable chunk ids, or plain corpus rows for indexes built without them
+    return gen.corpus.rows_for_ids(ids) if gen.index_info.get("ids") else np.asarray(ids)
+
+def chunks_for_rows(gen: Generation, rows) -> List[dict]:
+    results = []
+    for row in rows:
+        # FAISS pads with -1 when it finds fewer than k results
+        if 0 <= row < len(gen.corpus):
+            results.append(gen.corpus.get(int(row)))
+    return results
+
+def rerank_enabled() -> bool:
+    return bool(RETRIEVAL_MIN_SIMILARITY is not None or RETRIEVAL_MAX_PER_URL or RETRIEVAL_MMR_LAMBDA < 1)
+
+def candidate_vectors(gen: Generation, rows: np.ndarray) -> Optional[np.ndarray]:
+    # Read candidate vectors back from the index by id instead of re-encoding their text
+    corpus = gen.corpus
+    ids = corpus.ids[rows] if gen.index_info.get("ids") else rows
     try:
-        embedding = model.encode([question])[0].astype("float32")
-        distances, indices = index.search(np.array([embedding]), k)
-        results = []
+        return reconstruct(gen.index, ids)
+    except RuntimeError as e:
+        # Stale ids (index older than the corpus); the corpus keeps the same vectors
+        if corpus.embeddings is None:
+            print(f"Can't read candidate vectors ({e}); skipping reranking.")
+            return None
+        return np.asarray(corpus.embeddings[rows])
+
+def rerank_rows(gen: Generation, embedding: np.ndarray, rows, k: int, relevance=None) -> np.ndarray:
+    """Narrow ranked candidate rows down to k: drop those below
+    RETRIEVAL_MIN_SIMILARITY, cap rows per url and diversify with MMR.
+    `relevance` defaults to the candidates' cosine similarity to the question."""
+    rows = np.asarray(rows, dtype=np.int64)
+    valid = (rows >= 0) & (rows < len(gen.corpus))
+    rows = rows[valid]
+    vectors = candidate_vectors(gen, rows) if len(rows) else None
+    if vectors is None:
+        return rows[:k]
+    similarity = cosine_similarities(embedding, vectors)
+    relevance = similarity if relevance is None else np.asarray(relevance, dtype="float32")[valid]
+
+    if RETRIEVAL_MIN_SIMILARITY is not None:
+        keep = similarity >= RETRIEVAL_MIN_SIMILARITY
+        if not keep.all():
+            count("retrieval_below_cutoff", int((~keep).sum()))
+            rows, vectors, relevance = rows[keep], vectors[keep], relevance[keep]
+    groups = None
+    if RETRIEVAL_MAX_PER_URL:
+        urls = [gen.corpus.field(int(row), "url") for row in rows]
+        groups = np.unique(urls, return_inverse=True)[1] if urls else None
+    picked = mmr(relevance, vectors, k, RETRIEVAL_MMR_LAMBDA, groups, RETRIEVAL_MAX_PER_URL)
+    return rows[picked]
+
+# One FAISS search for many queries; items are (question, embedding, k) triples.
+# In hybrid mode each query's vector hits are fused with its BM25 hits (RRF).
+# With a row_filter only matching chunks are searched: FAISS skips the others
+# through an IDSelector over the precomputed bitsets, BM25 through their mask,
+# and filters matching only a few chunks are searched exactly over those.
+def search_chunks_batch(items: List[tuple], mode: Optional[str] = None, gen: Optional[Generation] = None,
+                        scored: bool = False, row_filter: Optional[RowFilter] = None) -> List[List[dict]]:
+    # The whole batch runs on one generation (the default index unless a course
+    # shard is given), even if a reload swaps it meanwhile
+    gen = gen or generation
+    try:
+        selection = mask = None
+        if row_filter is not None:
+            selection = gen.selection(row_filter)
+            if not selection.count:
+                count("retrieval_filter_empty", len(items))
+                return [[] for _ in items]
+            mask = selection.mask
+        hybrid = (mode or RETRIEVAL_MODE) == "hybrid" and gen.bm25 is not None
+        rerank = rerank_enabled()
+        max_k = max(k for _, _, k in items)
+        fetch_k = max(max_k, HYBRID_CANDIDATES) if hybrid else max_k
+        if rerank:
+            # Over-fetch; the extra candidates are filtered and diversified below
+            fetch_k = max(fetch_k, RETRIEVAL_CANDIDATES)
+        observe_batch("search", len(items))
+        queries = prepare_queries(np.array([e for _, e, _ in items]), gen.index_info)
+        with span("index_search", per_request=False):
+            if selection is not None and selection.rows is not None:
+                positions = exact_search(np.asarray(gen.corpus.embeddings[selection.rows]), queries, fetch_k,
+                                         gen.index_info)
+                dense = [selection.rows[p[p >= 0]] for p in positions]
+            else:
+                params = selection.params if selection is not None else None
+                _, indices = gen.index.search(queries, fetch_k, params=params)
+                dense = [rows_for_index_ids(gen, ids) for ids in indices]
 
-        for idx in indices[0]:
-            if idx < len(metadata):
-                chunk_info = {
-                    "text": embedded_chunks[idx]["text"],
-                    "url": metadata[idx].get("url", ""),
-                    "title": metadata[idx].get("title", ""),
-                }
-                results.append(chunk_info)
+        results = []
+        for dense_rows, (question, embedding, k) in zip(dense, items):
+            relevance = None
+            if hybrid:
+                with span("bm25_search", per_request=False):
+                    sparse_rows, _ = gen.bm25.search(question, fetch_k, mask)
+                rows, scores = reciprocal_rank_fusion(
+                    dense_rows, sparse_rows, HYBRID_SPARSE_WEIGHT, fetch_k if rerank else k, return_scores=True
+                )
+                # MMR relevance in hybrid mode is the fused score, scaled to [0, 1]
+                relevance = np.array(scores, dtype="float32") / max(scores[0], 1e-12) if scores else None
+            else:
+                rows = dense_rows if rerank else dense_rows[:k]
+            if rerank:
+                with span("rerank", per_request=False):
+                    rows = rerank_rows(gen, embedding, rows, k, relevance)
+            chunks = chunks_for_rows(gen, rows)
+            if scored:
+                score_chunks(gen, embedding, rows, chunks)
+            results.append(chunks)
         return results
     except Exception as e:
         print(f"Error in semantic search: {e}")
-        return []
+        return [[] for _ in items]
+
+# Cosine similarity of each hit to the question, comparable across course shards
+def score_chunks(gen: Generation, embedding: np.ndarray, rows, chunks: List[dict]):
+    rows = np.asarray(rows, dtype=np.int64)
+    rows = rows[(rows >= 0) & (rows < len(gen.corpus))]
+    vectors = candidate_vectors(gen, rows) if len(rows) else None
+    if vectors is None:
+        return
+    for chunk, score in zip(chunks, cosine_similarities(embedding, vectors)):
+        chunk["score"] = float(score)
+
+def merge_course_hits(hits: List[List[dict]], k: int) -> List[dict]:
+    if len(hits) == 1:
+        return hits[0]
+    merged = [chunk for shard_hits in hits for chunk in shard_hits]
+    merged.sort(key=lambda chunk: -chunk.get("score", -1.0))
+    return merged[:k]
+
+# Course shards are searched in parallel in here (FAISS releases the GIL)
+shard_pool = ThreadPoolExecutor(max_workers=COURSE_MAX_FANOUT, thread_name_prefix="course-search")
+
+# Batch function of search_batcher. Items are (question, embedding, k, shards,
+# row_filter), shards being (None,) for the default index or the course shards
+# to fan out to. Each shard is searched once per filter for all its queries in
+# the batch, shards run in parallel, and each query's hits from several shards
+# are merged by score.
+def search_sharded_batch(items: List[tuple]) -> List[List[dict]]:
+    groups = {}  # (shard, row_filter) -> positions of the items searching it
+    for i, (_, _, _, shards, row_filter) in enumerate(items):
+        for shard in shards:
+            groups.setdefault((shard, row_filter), []).append(i)
+
+    def search(group, members):
+        shard, row_filter = group
+        return search_chunks_batch([items[i][:3] for i in members], gen=shard, scored=shard is not None,
+                                   row_filter=row_filter)
 
-def synthesize_answer(question: str, context_chunks: List[dict]) -> str:
+    if len(groups) == 1:
+        found = {group: search(group, members) for group, members in groups.items()}
+    else:
+        futures = {group: shard_pool.submit(search, group, members) for group, members in groups.items()}
+        found = {group: future.result() for group, future in futures.items()}
+    hits = [{} for _ in items]
+    for group, members in groups.items():
+        for i, chunks in zip(members, found[group]):
+            hits[i][group[0]] = chunks
+    return [merge_course_hits([hits[i][shard] for shard in shards], k) for i, (_, _, k, shards, _) in enumerate(items)]
+
+def search_chunks(question: str, embedding: np.ndarray, k: int = 5, mode: Optional[str] = None,
+                  row_filter: Optional[RowFilter] = None) -> List[dict]:
+    return search_chunks_batch([(question, embedding, k)], mode, row_filter=row_filter)[0]
+
+def get_relevant_chunks(question: str, k: int = 5, mode: Optional[str] = None,
+                        row_filter: Optional[RowFilter] = None) -> List[dict]:
     try:
-        context = "\n\n".join(chunk["text"] for chunk in context_chunks)
-
-        system_prompt = (
-            "You are a helpful AI assistant answering student questions using the provided course materials. "
-            "Use only the given context to answer. If the answer is not found, say 'I couldn't find an exact answer.' "
-            "Be concise and accurate in your responses."
-        )
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
-        ]
-
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": messages,
-            "temperature": 0.2,
-            "max_tokens": 500
-        }
+        with span("embed"):
+            embedding = embed_question(question)
+        with span("search"):
+            return search_chunks(question, embedding, k, mode, row_filter)
+    except Exception as e:
+        print(f"Error in semantic search: {e}")
+        return []
 
-        response = requests.post(AIPIPE_LLM_URL, headers=HEADERS, json=payload)
+# Queries arriving within a few ms share one model.encode and one index.search
+embed_batcher = MicroBatcher(embed_questions, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS)
+search_batcher = MicroBatcher(search_sharded_batch, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS)
 
-        if response.ok:
-            content = response.json()["choices"][0]["message"]["content"].strip()
+def build_context(context_chunks: List[dict]) -> str:
+    if context_builder is None:
+        return "\n\n".join(chunk["text"] for chunk in context_chunks)
+    with span("context"):
+        context, stats = context_builder.build(context_chunks)
+    record_context(stats)
+    return context
+
+def build_llm_payload(question: str, context_chunks: List[dict], stream: bool = False) -> dict:
+    context = build_context(context_chunks)
+
+    system_prompt = (
+        "You are a helpful AI assistant answering student questions using the provided course materials. "
+        "Use only the given context to answer. If the answer is not found, say 'I couldn't find an exact answer.' "
+        "Be concise and accurate in your responses."
+    )
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Context:\n{context}\n\nQuestion: {question}"}
+    ]
+
+    payload = {
+        "model": "gpt-4o-mini",
+        "messages": messages,
+        "temperature": 0.2,
+        "max_tokens": 500
+    }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+# Extractive answer from the retrieved chunks, used when the LLM can't answer in time
+def fallback_answer(question: str, context_chunks: List[dict]) -> dict:
+    count("llm_fallback")
+    return {"answer": extractive_answer(question, context_chunks), "error": True, "fallback": True}
+
+async def synthesize_answer(question: str, context_chunks: List[dict]) -> str:
+    try:
+        payload = build_llm_payload(question, context_chunks)
+        with span("llm"):
+            response = await asyncio.wait_for(llm_client.chat(payload), LLM_DEADLINE)
+
+        if response.is_success:
+            completion = response.json()
+            record_llm_usage(completion.get("usage"))
+            content = completion["choices"][0]["message"]["content"].strip()
             try:
                 parsed = json.loads(content)
                 if isinstance(parsed, dict) and "answer" in parsed:
@@ -116,58 +609,139 @@ def synthesize_answer(question: str, context_chunks: List[dict]) -> str:
                 pass
             return {"answer": content}
         else:
-            return {"answer": f"Error: {response.status_code} - {response.text}"}
+            count("llm_error")
+            print(f"LLM error: {response.status_code} - {response.text[:200]}")
+            return fallback_answer(question, context_chunks)
+    except CircuitOpenError:
+        return fallback_answer(question, context_chunks)
+    except asyncio.TimeoutError:
+        count("llm_deadline")
+        return fallback_answer(question, context_chunks)
     except Exception as e:
+        count("llm_error")
         print(f"Error in answer synthesis: {e}")
-        return {"answer": "Sorry, I encountered an error while processing your request."}
+        return fallback_answer(question, context_chunks)
+
+# OCR the image if provided (in the OCR process pool), then combine with the question
+async def build_full_question(query: QueryRequest) -> str:
+    image_text = ""
+    if query.image:
+        with span("ocr"):
+            image_text = await ocr_pipeline.extract_text(query.image)
+
+    full_question = query.question
+    if image_text.strip():
+        full_question += "\n\nText extracted from image:\n" + image_text
+    return full_question
+
+def build_links(relevant_chunks: List[dict]) -> List[dict]:
+    links = []
+    for chunk in relevant_chunks:
+        if not chunk["url"]:
+            continue
+        # Corpora built before heading/link were stored only have the page url
+        text = chunk["title"] or chunk["url"]
+        if chunk.get("heading") and chunk["heading"] != chunk["title"]:
+            text = f"{text} › {chunk['heading']}"
+        links.append({"url": chunk.get("link") or chunk["url"], "text": text})
+    return links
+
+# Shared first half of both endpoints. Returns (cached_response, embedding, chunks):
+# on a cache hit only the cached {"answer", "links"} is set.
+async def retrieve(full_question: str, shards: Optional[dict] = None, row_filter: Optional[RowFilter] = None):
+    # Answers are cached per set of courses searched and filter
+    scope = request_scope(shards, row_filter)
+    if answer_cache is not None:
+        cached = answer_cache.get_exact(full_question, scope)
+        if cached is not None:
+            count("cache_exact_hit")
+            return cached, None, []
+
+    # Embedding + FAISS search are CPU-bound; they run batched in worker threads
+    # (the spans include the time spent waiting for a batch)
+    with span("embed"):
+        embedding = await embed_batcher.submit(full_question)
+    if answer_cache is not None:
+        cached = answer_cache.get_similar(embedding, scope)
+        if cached is not None:
+            count("cache_semantic_hit")
+            return cached, embedding, []
+        count("cache_miss")
+
+    with span("search"):
+        targets = tuple(shards.values()) if shards else (None,)
+        relevant_chunks = await search_batcher.submit((full_question, embedding, 5, targets, row_filter))
+    return None, embedding, relevant_chunks
+
+def request_scope(shards: Optional[dict], row_filter: Optional[RowFilter]) -> str:
+    scope = ",".join(shards) if shards else ""
+    return f"{scope}|{row_filter.key()}" if row_filter is not None else scope
+
+# {course: shard} for a request's `course` (a name, or a list to fan out to),
+# loading shards as needed; None searches the default index. Raises
+# ValueError / UnknownCourseError for a course the request can't have.
+async def load_course_shards(course) -> Optional[dict]:
+    if not course:
+        return None
+    if course_shards is None:
+        raise ValueError("This deployment serves a single course (COURSES_DIR isn't set)")
+    names = sorted(set([course] if isinstance(course, str) else course))
+    if len(names) > COURSE_MAX_FANOUT:
+        raise ValueError(f"At most {COURSE_MAX_FANOUT} courses can be searched at once")
+    with span("shard_load"):
+        shards = await asyncio.gather(*(asyncio.to_thread(course_shards.get, name) for name in names))
+    return dict(zip(names, shards))
+
+# Courses and filter of a request: (shards, row_filter)
+async def request_targets(query: QueryRequest):
+    row_filter = row_filter_for(query.filter)
+    return await load_course_shards(query.course), row_filter
+
+def request_error_response(e: Exception) -> JSONResponse:
+    if isinstance(e, UnknownCourseError):
+        message = f"Unknown course {e.args[0]!r}; available: {', '.join(course_shards.courses())}"
+    else:
+        message = str(e)
+    return JSONResponse({"answer": message, "links": []}, status_code=400)
+
+async def answer_question(full_question: str, shards: Optional[dict] = None,
+                          row_filter: Optional[RowFilter] = None) -> dict:
+    version = serving_version()
+    cached, embedding, relevant_chunks = await retrieve(full_question, shards, row_filter)
+    if cached is not None:
+        return cached
+
+    answer = await synthesize_answer(full_question, relevant_chunks)
+    failed = isinstance(answer, dict) and answer.get("error")
+
+    if isinstance(answer, dict) and "answer" in answer:
+        answer = answer["answer"]
+
+    response = {
+        "answer": answer,
+        "links": build_links(relevant_chunks)
+    }
+    # Fallback answers aren't cached so the next ask gets a real one, nor are
+    # answers from chunks of a generation replaced by a reload meanwhile
+    if answer_cache is not None and not failed and serving_version() == version:
+        answer_cache.put(full_question, embedding, response, request_scope(shards, row_filter))
+    return response
 
 # API endpoint
 @app.post("/api/")
 async def answer_query(query: QueryRequest):
+    if not await wait_until_ready():
+        return not_ready_response()
     try:
-        # Step 1: Decode and load image if provided
-        image_text = ""
-        if query.image:
-            try:
-                # Check if it's a URL or base64
-                if query.image.startswith("http://") or query.image.startswith("https://"):
-                    response = requests.get(query.image)
-                    image = Image.open(BytesIO(response.content))
-                elif query.image.startswith("file://"):
-                    local_path = query.image.replace("file://", "")
-                    image = Image.open(local_path)
-                else:
-                    image_data = base64.b64decode(query.image)
-                    image = Image.open(BytesIO(image_data))
-
-                # Run OCR
-                image_text = pytesseract.image_to_string(image)
-                print("Extracted from image:", image_text)
-
-            except Exception as e:
-                print(f"Error processing image: {e}")
-                image_text = ""
-
-        # Combine image text with question
-        full_question = query.question
-        if image_text.strip():
-            full_question += "\n\nText extracted from image:\n" + image_text
-        
-        relevant_chunks = get_relevant_chunks(full_question, k=5)
-        answer = synthesize_answer(full_question, relevant_chunks)
-        
-        if isinstance(answer, dict) and "answer" in answer:
-            answer = answer["answer"]
-
-        links = [
-            {"url": chunk["url"], "text": chunk["title"] or chunk["url"]}
-            for chunk in relevant_chunks if chunk["url"]
-        ]
-
-        return {
-            "answer": answer,
-            "links": links
-        }
+        shards, row_filter = await request_targets(query)
+    except (ValueError, UnknownCourseError) as e:
+        return request_error_response(e)
+    try:
+        full_question = await build_full_question(query)
+        key = (tuple(shards or ()), row_filter, normalize_question(full_question))
+        if key in answer_flight:
+            count("llm_coalesced")
+        return await answer_flight.run(key, lambda: answer_question(full_question, shards, row_filter))
     except Exception as e:
         print(f"Error in API endpoint: {e}")
         return {
@@ -175,6 +749,171 @@ async def answer_query(query: QueryRequest):
             "links": []
         }
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# First delta of an LLM stream, or None if it failed or missed LLM_DEADLINE
+# before sending anything (the caller then falls back to the extractive answer)
+async def first_token(stream) -> Optional[str]:
+    try:
+        return await asyncio.wait_for(stream.__anext__(), LLM_DEADLINE)
+    except StopAsyncIteration:
+        return ""
+    except CircuitOpenError:
+        pass
+    except asyncio.TimeoutError:
+        count("llm_deadline")
+    except Exception as e:
+        count("llm_error")
+        print(f"Error starting LLM stream: {e}")
+    await stream.aclose()
+    return None
+
+# Events (links, token...) of a streamed answer. Runs in stream_flight's own
+# task, shared by every identical question asked while it runs
+async def stream_answer(full_question: str, shards: Optional[dict], row_filter: Optional[RowFilter]):
+    try:
+        version = serving_version()
+        cached, embedding, relevant_chunks = await retrieve(full_question, shards, row_filter)
+        if cached is not None:
+            yield "links", cached["links"]
+            yield "token", cached["answer"]
+            return
+        links = build_links(relevant_chunks)
+        yield "links", links
+
+        payload = build_llm_payload(full_question, relevant_chunks, stream=True)
+        tokens = []
+        usage = {}
+        start = time.perf_counter()
+        stream = llm_client.stream_chat(payload, usage).__aiter__()
+        # The deadline covers the first token; a stream that started runs to LLM_TIMEOUT
+        first = await first_token(stream)
+        if first is None:
+            yield "token", fallback_answer(full_question, relevant_chunks)["answer"]
+            return
+        observe("llm_first_token", time.perf_counter() - start)
+        if first:
+            tokens.append(first)
+            yield "token", first
+        async for token in stream:
+            tokens.append(token)
+            yield "token", token
+        observe("llm", time.perf_counter() - start)
+        record_llm_usage(usage)
+        if answer_cache is not None and serving_version() == version:
+            answer = "".join(tokens).strip()
+            answer_cache.put(full_question, embedding, {"answer": answer, "links": links},
+                             request_scope(shards, row_filter))
+    except Exception as e:
+        count("stream_error")
+        print(f"Error in streaming endpoint: {e}")
+        yield "error", "Sorry, I encountered an error while processing your request."
+
+# Streaming endpoint: sends the links as soon as retrieval is done, then the
+# answer token by token as server-sent events (links, token..., done)
+@app.post("/api/stream")
+async def answer_query_stream(query: QueryRequest):
+    if not await wait_until_ready():
+        return not_ready_response()
+
+    try:
+        shards, row_filter = await request_targets(query)
+    except (ValueError, UnknownCourseError) as e:
+        return request_error_response(e)
+
+    async def events():
+        try:
+            full_question = await build_full_question(query)
+            # Identical questions in flight follow the first one's stream: one
+            # retrieval and one LLM call, tokens fanned out to all of them
+            key = (tuple(shards or ()), row_filter, normalize_question(full_question))
+            if key in stream_flight:
+                count("llm_coalesced")
+            async for event, data in stream_flight.run(
+                key, lambda: stream_answer(full_question, shards, row_filter)
+            ):
+                yield sse_event(event, data)
+        except Exception as e:
+            count("stream_error")
+            print(f"Error in streaming endpoint: {e}")
+            yield sse_event("error", "Sorry, I encountered an error while processing your request.")
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Liveness: the process is up and serving (model may still be loading)
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: 200 once the model and index are loaded, 503 before that
+@app.get("/ready")
+async def ready():
+    if resources_ready.is_set():
+        return {"ready": True, "generation": generation.number}
+    return JSONResponse({"ready": False, "error": startup_error}, status_code=503)
+
+# Prometheus text format: stage latency histograms, LLM token usage, cache and
+# batching counters (merged across workers when PROMETHEUS_MULTIPROC_DIR is set)
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+# OCR request counts, cache hits and average per-stage timings (fetch, decode, preprocess, ocr)
+@app.get("/ocr/stats")
+async def ocr_stats():
+    return ocr_pipeline.info()
+
+# Cache hit/miss counters (how many LLM calls the answer cache saved)
+@app.get("/cache/stats")
+async def cache_stats():
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.info()}
+
+# Load the rebuilt index + corpus (after the refresh job) and swap it in without
+# a restart; ?force=true reloads even if the files look unchanged
+@app.post("/admin/reload")
+async def admin_reload(request: Request, force: bool = False):
+    if ADMIN_TOKEN is None:
+        return JSONResponse({"error": "Set ADMIN_TOKEN to enable reloads"}, status_code=404)
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}"):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    if not resources_ready.is_set():
+        return JSONResponse({"error": "Still starting up"}, status_code=503)
+    try:
+        return await asyncio.to_thread(reload_generation, force)
+    except Exception as e:
+        return JSONResponse({"reloaded": False, "error": str(e), **generation.info()}, status_code=409)
+
+# Generation, version and size of the index + corpus being served
+@app.get("/index/stats")
+async def index_stats():
+    if generation is None:
+        return JSONResponse({"error": "Still starting up"}, status_code=503)
+    return generation.info()
+
+# Courses available under COURSES_DIR, the shards loaded and their memory use
+@app.get("/courses")
+async def courses():
+    if course_shards is None:
+        return {"enabled": False}
+    return {"enabled": True, **course_shards.info()}
+
+# LLM circuit breaker state and how many requests were coalesced
+@app.get("/llm/stats")
+async def llm_stats():
+    # Totals over both endpoints, then per endpoint
+    by_endpoint = {"api": answer_flight.info(), "stream": stream_flight.info()}
+    coalescing = {name: sum(info[name] for info in by_endpoint.values()) for name in by_endpoint["api"]}
+    return {"breaker": llm_client.breaker.info(), "coalescing": coalescing, "coalescing_by_endpoint": by_endpoint}
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
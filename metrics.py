@@ -0,0 +1,179 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+# --- CONFIG ---
+# Seconds; covers ~1 ms cache hits through multi-second LLM calls
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TIMING_HEADER = "X-Timing"
+
+STAGE_SECONDS = Histogram(
+    "virtual_ta_stage_seconds", "Time spent in each stage of answering a question",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "virtual_ta_request_seconds", "End-to-end HTTP request time",
+    ["path", "status"], buckets=STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "virtual_ta_llm_tokens_total", "Tokens reported in the LLM completion usage", ["kind"],
+)
+BATCH_SIZE = Histogram(
+    "virtual_ta_batch_size", "Questions per micro-batch", ["batcher"], buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+CONTEXT_TOKENS = Counter(
+    "virtual_ta_context_tokens_total", "LLM context tokens: retrieved (candidate), sent, and saved by packing", ["kind"],
+)
+CONTEXT_TOKENS_SAVED = Histogram(
+    "virtual_ta_context_tokens_saved", "Context tokens saved per request by deduplication and the token budget",
+    buckets=(0, 50, 100, 250, 500, 1000, 2000, 4000),
+)
+EVENTS = Counter(
+    "virtual_ta_events_total", "Cache hits/misses, LLM errors and other per-request outcomes", ["event"],
+)
+
+# Label children are looked up once; .labels() takes a lock on every call
+_stage_children = {}
+_event_children = {}
+# Per-request {stage: seconds}, set by TimingMiddleware or collect_timings
+_timings: ContextVar[Optional[dict]] = ContextVar("timings", default=None)
+_all_stages: ContextVar[bool] = ContextVar("all_stages", default=False)
+
+
+def observe(stage: str, seconds: float, per_request: bool = True):
+    # per_request=False for work shared by a batch of requests: it goes into
+    # the histogram but not into any one request's X-Timing breakdown
+    child = _stage_children.get(stage)
+    if child is None:
+        child = _stage_children[stage] = STAGE_SECONDS.labels(stage)
+    child.observe(seconds)
+    timings = _timings.get() if per_request or _all_stages.get() else None
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str, per_request: bool = True):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, per_request)
+
+
+@contextmanager
+def collect_timings(all_stages: bool = False):
+    """Collect the stage timings of the code run inside, like TimingMiddleware
+    does per request (for benchmarks calling the pipeline in-process).
+    `all_stages` also records batch-level stages (per_request=False), which is
+    only meaningful when nothing else is batched with this call."""
+    timings = {}
+    token = _timings.set(timings)
+    all_token = _all_stages.set(all_stages)
+    try:
+        yield timings
+    finally:
+        _all_stages.reset(all_token)
+        _timings.reset(token)
+
+
+def count(event: str, amount: int = 1):
+    child = _event_children.get(event)
+    if child is None:
+        child = _event_children[event] = EVENTS.labels(event)
+    child.inc(amount)
+
+
+def observe_batch(batcher: str, size: int):
+    BATCH_SIZE.labels(batcher).observe(size)
+
+
+def record_llm_usage(usage: Optional[dict]):
+    # OpenAI-style {"prompt_tokens", "completion_tokens", "total_tokens"}
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            LLM_TOKENS.labels(kind).inc(tokens)
+
+
+def record_context(stats: dict):
+    # Stats from ContextBuilder.build
+    for kind in ("candidate", "sent", "saved"):
+        CONTEXT_TOKENS.labels(kind).inc(stats[kind])
+    CONTEXT_TOKENS_SAVED.observe(stats["saved"])
+    if stats["deduplicated"]:
+        count("context_chunk_deduplicated", stats["deduplicated"])
+
+
+def format_timings(timings: dict) -> str:
+    # "ocr=0.0;embed=4.1;search=1.3;llm=812.5" in milliseconds
+    return ";".join(f"{stage}={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def parse_timings(header: str) -> dict:
+    # Inverse of format_timings: {stage: seconds}
+    timings = {}
+    for part in header.split(";"):
+        stage, _, ms = part.partition("=")
+        if stage and ms:
+            timings[stage] = float(ms) / 1000
+    return timings
+
+
+def render_metrics():
+    """Prometheus text exposition. With PROMETHEUS_MULTIPROC_DIR set (one
+    directory shared by all uvicorn workers), samples from every worker are
+    merged; otherwise only this process is reported."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class TimingMiddleware:
+    """ASGI middleware that times every HTTP request and collects the stage
+    spans recorded while handling it. With `header=True` the breakdown is
+    returned in an X-Timing response header (for streaming responses only the
+    stages finished before the first byte are included)."""
+
+    def __init__(self, app, header: bool = False, skip_paths=("/metrics",)):
+        self.app = app
+        self.header = header
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if self.header:
+                    timings["total"] = time.perf_counter() - start
+                    headers = list(message.get("headers", []))
+                    headers.append((TIMING_HEADER.lower().encode(), format_timings(timings).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.labels(path, str(status[0])).observe(time.perf_counter() - start)
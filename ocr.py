@@ -0,0 +1,202 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Callable, Optional, Tuple
+
+import httpx
+
+# --- CONFIG ---
+DEFAULT_WORKERS = 2  # tesseract processes running at once
+DEFAULT_MAX_PIXELS = 20_000_000  # decoded width * height; larger images are rejected
+DEFAULT_MAX_SIDE = 2000  # longest side after downscaling
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024  # encoded image size (base64-decoded, downloaded or read)
+DEFAULT_FETCH_TIMEOUT = 10.0
+DEFAULT_CACHE_SIZE = 256
+
+STAGES = ("fetch", "decode", "preprocess", "ocr")
+
+
+class ImageRejected(ValueError):
+    pass
+
+
+def _tesseract_cmd() -> str:
+    # Configure Tesseract path based on environment
+    if os.name == 'nt':  # Windows
+        return r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+    return 'tesseract'  # Linux/Unix
+
+
+def run_ocr(data: bytes, max_pixels: int, max_side: int) -> Tuple[str, dict]:
+    """Decode, preprocess and OCR one image. Runs in a worker process; PIL and
+    pytesseract are only imported there."""
+    from PIL import Image, ImageOps
+    import pytesseract
+
+    pytesseract.pytesseract.tesseract_cmd = _tesseract_cmd()
+    timings = {}
+
+    start = time.perf_counter()
+    image = Image.open(BytesIO(data))
+    # Size comes from the header, so reject huge images before decoding them
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageRejected(f"image is {width}x{height}, over the {max_pixels} pixel limit")
+    image.load()
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = ImageOps.exif_transpose(image).convert("L")
+    image.thumbnail((max_side, max_side))
+    image = ImageOps.autocontrast(image)
+    timings["preprocess"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text = pytesseract.image_to_string(image)
+    timings["ocr"] = time.perf_counter() - start
+    return text, timings
+
+
+class OCRPipeline:
+    """Extracts text from /api/ image uploads off the event loop.
+
+    Images come from a URL (fetched with a timeout and size cap), a file://
+    path or base64 data. OCR runs in a bounded process pool, and results are
+    cached by the SHA-256 of the image bytes so retries of the same screenshot
+    are free. Cumulative per-stage timings are kept in `stats` and, if given,
+    each timing is also passed to `on_timing(stage, seconds)`.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_pixels: int = DEFAULT_MAX_PIXELS,
+        max_side: int = DEFAULT_MAX_SIDE,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        fetch_timeout: float = DEFAULT_FETCH_TIMEOUT,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        on_timing: Optional[Callable[[str, float], None]] = None,
+    ):
+        self.workers = workers
+        self.max_pixels = max_pixels
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.fetch_timeout = fetch_timeout
+        self.cache_size = cache_size
+        self.on_timing = on_timing
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache = OrderedDict()  # sha256 -> text
+        self.stats = {
+            "requests": 0,
+            "cache_hits": 0,
+            "errors": 0,
+            **{f"{stage}_seconds": 0.0 for stage in STAGES},
+            **{f"{stage}_count": 0 for stage in STAGES},
+        }
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned, not forked: the server process already runs threads
+                # (uvicorn, torch, FAISS) that a fork could deadlock on
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _record(self, stage: str, seconds: float):
+        self.stats[f"{stage}_seconds"] += seconds
+        self.stats[f"{stage}_count"] += 1
+        if self.on_timing is not None:
+            self.on_timing(stage, seconds)
+
+    async def _fetch(self, url: str) -> bytes:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.fetch_timeout, follow_redirects=True)
+        async with self._client.stream("GET", url) as response:
+            response.raise_for_status()
+            declared = response.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise ImageRejected(f"image is {declared} bytes, over the {self.max_bytes} byte limit")
+            data = bytearray()
+            async for block in response.aiter_bytes():
+                data.extend(block)
+                if len(data) > self.max_bytes:
+                    raise ImageRejected(f"image is over the {self.max_bytes} byte limit")
+        return bytes(data)
+
+    def _read_file(self, path: str) -> bytes:
+        if os.path.getsize(path) > self.max_bytes:
+            raise ImageRejected(f"image is over the {self.max_bytes} byte limit")
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def load_bytes(self, image_ref: str) -> bytes:
+        start = time.perf_counter()
+        # Check if it's a URL, a local file or base64
+        if image_ref.startswith("http://") or image_ref.startswith("https://"):
+            data = await self._fetch(image_ref)
+        elif image_ref.startswith("file://"):
+            data = await asyncio.to_thread(self._read_file, image_ref.replace("file://", ""))
+        else:
+            if len(image_ref) * 3 // 4 > self.max_bytes:
+                raise ImageRejected(f"image is over the {self.max_bytes} byte limit")
+            try:
+                data = base64.b64decode(image_ref)
+            except binascii.Error as e:
+                raise ImageRejected(f"invalid base64 image: {e}")
+        self._record("fetch", time.perf_counter() - start)
+        return data
+
+    async def extract_text(self, image_ref: str) -> str:
+        self.stats["requests"] += 1
+        try:
+            data = await self.load_bytes(image_ref)
+            key = hashlib.sha256(data).hexdigest()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return self._cache[key]
+
+            loop = asyncio.get_running_loop()
+            text, timings = await loop.run_in_executor(
+                self._executor(), run_ocr, data, self.max_pixels, self.max_side
+            )
+            for stage, seconds in timings.items():
+                self._record(stage, seconds)
+
+            if self.cache_size > 0:
+                self._cache[key] = text
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            print("Extracted from image:", text)
+            return text
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error processing image: {e}")
+            return ""
+
+    def info(self) -> dict:
+        info = {k: v for k, v in self.stats.items() if not k.endswith(("_seconds", "_count"))}
+        info["cache_entries"] = len(self._cache)
+        for stage in STAGES:
+            count = self.stats[f"{stage}_count"]
+            info[f"{stage}_avg_ms"] = round(self.stats[f"{stage}_seconds"] / count * 1000, 2) if count else 0.0
+        return info
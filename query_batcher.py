@@ -0,0 +1,199 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+
+# --- CONFIG ---
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 2.0
+
+
+class MicroBatcher:
+    """Collects items submitted within `max_wait_ms` (up to `max_batch_size`)
+    and processes them with a single call to `fn` in a worker thread.
+
+    When no batch is running an item is dispatched straight away, so an idle
+    server pays no batching delay; batches only form under load.
+
+    `fn` takes a list of items and returns a sequence of results in the same
+    order; each `submit()` caller gets its own result back. With
+    `max_batch_size <= 1` items are processed one at a time, as before.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    ):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []  # (item, future)
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self._in_flight = 0
+        self.stats = {"batches": 0, "items": 0, "max_batch": 0}
+
+    async def submit(self, item):
+        if self.max_batch_size <= 1:
+            self._record(1)
+            return (await run_in_threadpool(self.fn, [item]))[0]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size or self._in_flight == 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self._in_flight += 1
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            # Keep a reference so the task isn't garbage-collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self._record(len(batch))
+        try:
+            results = await run_in_threadpool(self.fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._in_flight -= 1
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size):
+        self.stats["batches"] += 1
+        self.stats["items"] += size
+        self.stats["max_batch"] = max(self.stats["max_batch"], size)
+
+    def info(self) -> dict:
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "avg_batch": round(self.stats["items"] / batches, 2) if batches else 0.0,
+        }
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: while `run(key, fn)` is in flight,
+    further calls with the same key await the same result instead of calling
+    `fn` again.
+
+    The work runs in its own task, so a caller that goes away (client
+    disconnect) doesn't cancel it for the others. Results aren't kept once the
+    call finishes; that's the answer cache's job.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> future
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    async def run(self, key, fn: Callable[[], Any]):
+        future = self._calls.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        self.stats["calls"] += 1
+        future = asyncio.ensure_future(fn())
+        self._calls[key] = future
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(future)
+
+    def __contains__(self, key) -> bool:
+        return key in self._calls
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def info(self) -> dict:
+        return {**self.stats, "in_flight": self.in_flight()}
+
+
+class _Broadcast:
+    """Events of one producer, kept so followers that join late replay them."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+
+    async def feed(self, events: AsyncIterator):
+        try:
+            async for event in events:
+                async with self._changed:
+                    self.events.append(event)
+                    self._changed.notify_all()
+        except Exception as e:
+            self.error = e  # re-raised in every follower
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator:
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.events) or self.done)
+                new, done = self.events[sent:], self.done
+            sent += len(new)
+            for event in new:
+                yield event
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class StreamFlight:
+    """SingleFlight for streamed answers: while `run(key, produce)` is in
+    flight, further calls with the same key get the events of the first
+    call's `produce()` (an async iterator), the ones sent so far and then the
+    rest as they come, instead of producing their own.
+
+    The producer runs in its own task, so a follower that goes away (client
+    disconnect), the first one included, doesn't cut the stream short for
+    the others.
+    """
+
+    def __init__(self):
+        self._streams = {}  # key -> _Broadcast
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    async def run(self, key, produce: Callable[[], AsyncIterator]) -> AsyncIterator:
+        broadcast = self._streams.get(key)
+        if broadcast is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["calls"] += 1
+            broadcast = self._streams[key] = _Broadcast()
+            task = asyncio.ensure_future(broadcast.feed(produce()))
+            task.add_done_callback(lambda _: self._streams.pop(key, None))
+        async for event in broadcast.follow():
+            yield event
+
+    def __contains__(self, key) -> bool:
+        return key in self._streams
+
+    def in_flight(self) -> int:
+        return len(self._streams)
+
+    def info(self) -> dict:
+        return {**self.stats, "in_flight": self.in_flight()}
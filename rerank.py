@@ -0,0 +1,53 @@
+from typing import Optional
+
+import numpy as np
+
+# --- CONFIG ---
+DEFAULT_MMR_LAMBDA = 0.7  # 1 = relevance only, 0 = diversity only
+
+
+def unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype="float32")
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def cosine_similarities(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    return unit_rows(vectors) @ unit_rows(query).reshape(-1)
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_: float = DEFAULT_MMR_LAMBDA,
+        groups: Optional[np.ndarray] = None, max_per_group: Optional[int] = None) -> np.ndarray:
+    """Maximal marginal relevance over n candidates.
+
+    Picks k candidates one at a time, each maximizing
+    lambda * relevance - (1 - lambda) * max cosine similarity to those already
+    picked. The n x n similarity matrix is computed once, so each step is a
+    few vector operations. With `groups` (e.g. url codes), at most
+    `max_per_group` candidates of a group are picked. Returns candidate
+    positions in pick order (fewer than k if the caps run out of candidates).
+    """
+    relevance = np.asarray(relevance, dtype="float32")
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64)
+    unit = unit_rows(vectors)
+    similarity = unit @ unit.T
+
+    available = np.ones(n, dtype=bool)
+    redundancy = np.zeros(n, dtype="float32")
+    group_counts = np.zeros(groups.max() + 1, dtype=np.int64) if groups is not None else None
+    picked = []
+    for _ in range(min(k, n)):
+        scores = lambda_ * relevance - (1.0 - lambda_) * redundancy
+        scores[~available] = -np.inf
+        j = int(np.argmax(scores))
+        if not available[j]:
+            break
+        picked.append(j)
+        available[j] = False
+        redundancy = similarity[j] if len(picked) == 1 else np.maximum(redundancy, similarity[j])
+        if group_counts is not None and max_per_group:
+            group_counts[groups[j]] += 1
+            if group_counts[groups[j]] >= max_per_group:
+                available[groups == groups[j]] = False
+    return np.array(picked, dtype=np.int64)
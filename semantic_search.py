@@ -1,23 +1,22 @@
-import faiss
-import numpy as np
-import json
-from sentence_transformers import SentenceTransformer
+from encoder import Encoder
+from ann_index import load_index, prepare_queries
+from corpus_store import CORPUS_PREFIX, CorpusStore
 
 # Load model and data
-model = SentenceTransformer("all-MiniLM-L6-v2")
-index = faiss.read_index("semantic_index.faiss")
-
-with open("metadata.json", "r", encoding="utf-8") as f:
-    metadata = json.load(f)
+model = Encoder()  # same model/backend as generate_embeddings.py
+index, index_info = load_index("semantic_index.faiss")
+corpus = CorpusStore(CORPUS_PREFIX)  # opened lazily on first lookup
 
 # Search function
 def search(query, k=5):
-    query_vec = model.encode([query], convert_to_numpy=True).astype("float32")
+    query_vec = prepare_queries(model.encode([query]), index_info)
     distances, indices = index.search(query_vec, k)
+    # Index ids are stable chunk ids, or plain corpus rows for indexes built without them
+    rows = corpus.rows_for_ids(indices[0]) if index_info.get("ids") else indices[0]
     results = []
-    for i in indices[0]:
-        if i < len(metadata):
-            results.append(metadata[i])
+    for i in rows:
+        if 0 <= i < len(corpus):
+            results.append(corpus.get(int(i)))
     return results
 
 
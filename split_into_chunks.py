@@ -1,49 +1,421 @@
+import argparse
 import json
-from typing import List
+import os
+import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Iterable, Iterator, List, Optional
+from corpus_store import chunk_id, content_hash
+from encoder import MODEL_NAME, local_model_path
 
 # --- CONFIG ---
 INPUT_FILES = ["anand_scraped.jsonl", "discourse_posts.jsonl"]
 OUTPUT_FILE = "chunks.jsonl"
-CHUNK_SIZE = 300  # Number of words
-CHUNK_OVERLAP = 50  # Number of words to overlap between chunks
+FILE_SOURCES = {"anand_scraped.jsonl": "course", "discourse_posts.jsonl": "discourse"}  # for retrieval filters
+DEFAULT_MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2; read from the exported model when available
+MIN_CHUNK_TOKENS = 48  # a chunk this small keeps filling across heading/post boundaries
+OVERLAP_TOKENS = 32  # carried over only when one paragraph is too long for a chunk
+DOCS_PER_TASK = 64  # documents per worker task when --workers > 1
+
+BLOCK_TAGS = {"p", "div", "li", "pre", "blockquote", "tr", "table", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+# Scripts, styles and Discourse asides (quotes of other posts, link previews)
+SKIP_TAGS = {"script", "style", "aside", "svg", "noscript"}
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+# --- TOKENS ---
+class TokenCounter:
+    """Counts tokens the way the embedding model will see them. Uses the
+    model's own tokenizer if it was exported to models/ (encoder.py export),
+    otherwise estimates from words and punctuation."""
+
+    def __init__(self, model: str = MODEL_NAME):
+        path = local_model_path(model)
+        self.max_seq_length = DEFAULT_MAX_SEQ_LENGTH
+        config_path = os.path.join(path, "sentence_bert_config.json")
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                self.max_seq_length = json.load(f).get("max_seq_length") or self.max_seq_length
+        self._tokenizer = None
+        if os.path.exists(os.path.join(path, "tokenizer.json")):
+            from tokenizers import Tokenizer
+            self._tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+            self._tokenizer.no_truncation()
+            self._tokenizer.no_padding()
+
+    @property
+    def settings(self) -> str:
+        # Everything besides the document that decides where chunks are cut
+        return f"{self.max_seq_length}/{self._tokenizer is not None}/{MIN_CHUNK_TOKENS}/{OVERLAP_TOKENS}"
+
+    @property
+    def budget(self) -> int:
+        # Room for text once [CLS] and [SEP] are added
+        return self.max_seq_length - 2
+
+    def count(self, text: str) -> int:
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        # Word pieces split long/rare words, so estimate a little high
+        return int(len(WORD_RE.findall(text)) * 1.3) + 1
+
+
+# --- HTML ---
+class BlockExtractor(HTMLParser):
+    """Turns rendered HTML into text blocks (paragraphs, list items, code
+    blocks), noting the heading each block sits under and its anchor id."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []  # dicts: text, heading, anchor, is_heading
+        self._parts = []
+        self._skip = 0
+        self._pre = 0
+        self._heading_id = None
+        self.heading = ""
+        self.anchor = ""
+
+    def _flush(self, is_heading=False):
+        text = "".join(self._parts)
+        self._parts = []
+        text = text.strip("\n") if self._pre else re.sub(r"\s+", " ", text).strip()
+        if not text:
+            return
+        if is_heading:
+            self.heading, self.anchor = text, self._heading_id or ""
+        self.blocks.append({"text": text, "heading": self.heading, "anchor": self.anchor, "is_heading": is_heading})
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif self._skip:
+            return
+        elif tag == "br":
+            self._parts.append("\n")
+        elif tag in BLOCK_TAGS:
+            self._flush()
+            if tag == "pre":
+                self._pre += 1
+            if tag in HEADING_TAGS:
+                self._heading_id = dict(attrs).get("id")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag == "br" and not self._skip:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif self._skip:
+            return
+        elif tag in BLOCK_TAGS:
+            self._flush(is_heading=tag in HEADING_TAGS)
+            if tag == "pre":
+                self._pre = max(0, self._pre - 1)
+            if tag in HEADING_TAGS:
+                self._heading_id = None
+
+    def handle_data(self, data):
+        if not self._skip:
+            self._parts.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def html_blocks(html: str, heading: str = "") -> List[dict]:
+    parser = BlockExtractor()
+    parser.heading = heading
+    parser.feed(html)
+    parser.close()
+    return parser.blocks
+
+
+def text_blocks(text: str) -> List[dict]:
+    # Plain text (e.g. innerText): one block per paragraph
+    return [
+        {"text": p.strip(), "heading": "", "anchor": "", "is_heading": False}
+        for p in re.split(r"\n\s*\n|\n(?=\S)", text) if p.strip()
+    ]
+
+
+# --- CHUNKING ---
+def split_long(text: str, counter: TokenCounter, budget: int) -> Iterator[str]:
+    # Split one oversized block at sentence (or line, for code), then word boundaries
+    units = text.split("\n") if "\n" in text else SENTENCE_RE.split(text)
+    joiner = "\n" if "\n" in text else " "
+    current, size = [], 0
+    for unit in units:
+        n = counter.count(unit)
+        if n > budget:
+            words = unit.split()
+            step = max(1, len(words) * budget // n)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            pieces = [unit]
+        for piece in pieces:
+            n = counter.count(piece)
+            if current and size + n > budget:
+                yield joiner.join(current)
+                # Keep the tail of the previous piece for context
+                tail, tail_size = [], 0
+                for prev in reversed(current):
+                    tail_size += counter.count(prev)
+                    if tail_size > OVERLAP_TOKENS:
+                        break
+                    tail.insert(0, prev)
+                current, size = tail, sum(counter.count(t) for t in tail)
+            current.append(piece)
+            size += n
+    if current:
+        yield joiner.join(current)
+
+
+def pack_blocks(blocks: Iterable[dict], counter: TokenCounter) -> Iterator[dict]:
+    """Group consecutive blocks into chunks of at most `counter.budget` tokens.
+
+    A heading or post boundary starts a new chunk once the current one has
+    MIN_CHUNK_TOKENS, so chunks rarely straddle sections. Each chunk keeps the
+    heading/anchor/post of its first block."""
+    budget = counter.budget
+    current, size, first = [], 0, None
+
+    def emit():
+        chunk = dict(first, text="\n\n".join(current))
+        chunk.pop("is_heading", None)
+        return chunk
+
+    for block in blocks:
+        boundary = block["is_heading"] or (first is not None and block.get("post_number") != first.get("post_number"))
+        n = counter.count(block["text"])
+        if current and (size + n > budget or (boundary and size >= MIN_CHUNK_TOKENS)):
+            yield emit()
+            current, size, first = [], 0, None
+        if n > budget:
+            first = block
+            for piece in split_long(block["text"], counter, budget):
+                current = [piece]
+                yield emit()
+            current, first = [], None
+            continue
+        if first is None:
+            first = block
+        current.append(block["text"])
+        size += n
+    if current:
+        yield emit()
+
+
+def document_blocks(doc: dict) -> List[dict]:
+    if doc.get("posts"):
+        # Discourse topic: each post is its own block stream
+        blocks = []
+        for post in doc["posts"]:
+            for block in html_blocks(post.get("cooked") or ""):
+                block["post_number"] = post.get("post_number")
+                block["created_at"] = post.get("created_at")
+                blocks.append(block)
+        return blocks
+    if doc.get("html"):
+        return html_blocks(doc["html"])
+    content = doc.get("content") or doc.get("text") or ""
+    # Older Discourse scrapes only have the joined post HTML
+    return html_blocks(content) if "<" in content and "</" in content else text_blocks(content)
+
+
+def deep_link(url: Optional[str], chunk: dict) -> Optional[str]:
+    if not url:
+        return url
+    if chunk.get("post_number"):
+        return f"{url}/{chunk['post_number']}"  # Discourse post permalink
+    if chunk.get("anchor") and "#/" in url:
+        return f"{url}?id={chunk['anchor']}"  # Docsify heading anchor
+    return url
+
+
+def document_hash(doc: dict, settings: str) -> str:
+    # Same document, same chunker settings -> same chunks
+    return content_hash(json.dumps(doc, sort_keys=True, ensure_ascii=False) + "\x00" + settings)
+
+
+def chunk_document(doc: dict, counter: TokenCounter) -> List[dict]:
+    content = doc.get("content") or doc.get("text") or ""
+    title = doc.get("title", "Unknown")
+    url = doc.get("url", None)
+    if not content.strip() and not doc.get("posts") and not doc.get("html"):
+        return []
+    # Lets the next run reuse these chunks if the document hasn't changed
+    doc_hash = document_hash(doc, counter.settings)
 
-# --- FUNCTION ---
-def split_text(text: str, size: int, overlap: int) -> List[str]:
-    words = text.split()
     chunks = []
-    for i in range(0, len(words), size - overlap):
-        chunk = words[i:i + size]
-        if chunk:
-            chunks.append(" ".join(chunk))
+    for position, piece in enumerate(pack_blocks(document_blocks(doc), counter)):
+        chunk_obj = {
+            "text": piece["text"],
+            "title": title,
+            "url": url,
+            "heading": piece.get("heading", ""),
+            "link": deep_link(url, piece),
+            "source": doc.get("source") or ("discourse" if doc.get("posts") or doc.get("topic_id") else "course"),
+            "doc_hash": doc_hash,
+            "doc_position": position,  # chunk number within the document
+        }
+        if piece.get("post_number"):
+            chunk_obj["post_number"] = piece["post_number"]
+        if piece.get("created_at") or doc.get("created_at"):
+            chunk_obj["created_at"] = piece.get("created_at") or doc["created_at"]
+        if doc.get("tags"):
+            chunk_obj["tags"] = ",".join(doc["tags"])
+        chunk_obj["chunk_id"] = chunk_id(chunk_obj)
+        chunks.append(chunk_obj)
     return chunks
 
-# --- MAIN ---
-all_chunks = []
-
-for file_path in INPUT_FILES:
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            try:
-                doc = json.loads(line)
-                content = doc.get("content") or doc.get("text") or ""
-                title = doc.get("title", "Unknown")
-                url = doc.get("url", None)
-                if not content.strip():
+
+# --- STREAMING ---
+def read_documents(paths: Iterable[str]) -> Iterator[dict]:
+    for file_path in paths:
+        source = FILE_SOURCES.get(os.path.basename(file_path))
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    doc = json.loads(line)
+                except json.JSONDecodeError:
                     continue
+                if source and not doc.get("source"):
+                    doc["source"] = source
+                yield doc
+
+class PreviousChunks:
+    """The chunks of the last run's output, by doc_hash. Only the offsets are
+    kept in memory; a document's chunks (consecutive lines, doc_position 0,
+    1, ...) are read back when it turns out unchanged. Of several copies of
+    one document only the first is recorded."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.docs = {}  # doc_hash -> (offset of the first line, line count)
+        offset = 0
+        current = None  # doc_hash of the document whose span is still open
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    doc_hash, position = record.get("doc_hash"), record.get("doc_position")
+                except (ValueError, AttributeError):
+                    doc_hash = position = None
+                if doc_hash and position == 0 and doc_hash not in self.docs:
+                    # First chunk of a document not seen before: open its span
+                    self.docs[doc_hash] = (offset, 1)
+                    current = doc_hash
+                elif doc_hash and doc_hash == current and position == self.docs[doc_hash][1]:
+                    start, count = self.docs[doc_hash]
+                    self.docs[doc_hash] = (start, count + 1)
+                else:
+                    # A later copy, a line out of sequence, or output written
+                    # before doc_position existed: not reusable
+                    current = None
+                offset += len(line)
+        self._file = open(path, "rb")
+
+    def __len__(self):
+        return len(self.docs)
+
+    def get(self, doc_hash: str) -> Optional[List[dict]]:
+        if doc_hash not in self.docs:
+            return None
+        start, count = self.docs[doc_hash]
+        self._file.seek(start)
+        return [json.loads(self._file.readline()) for _ in range(count)]
 
-                for chunk in split_text(content, CHUNK_SIZE, CHUNK_OVERLAP):
-                    chunk_obj = {
-                        "text": chunk,
-                        "title": title,
-                        "url": url
-                    }
-                    all_chunks.append(chunk_obj)
-            except json.JSONDecodeError:
+    def close(self):
+        self._file.close()
+
+_counter = None
+
+def _init_worker(model):
+    global _counter
+    _counter = TokenCounter(model)
+
+def _chunk_many(docs):
+    return [chunk_document(doc, _counter) for doc in docs]
+
+def iter_chunks(docs: Iterable[dict], model: str = MODEL_NAME, workers: int = 1,
+                previous: Optional[PreviousChunks] = None, stats: Optional[dict] = None) -> Iterator[dict]:
+    """Chunks of `docs`. With workers > 1, documents are chunked in a process
+    pool, with a bounded number of batches in flight (reused documents may
+    then come out ahead of their neighbours).
+
+    Documents whose doc_hash is in `previous` reuse those chunks instead of
+    being chunked again; `stats` counts "reused" and "chunked" documents."""
+    counter = TokenCounter(model)
+    stats = stats if stats is not None else {}
+    stats.setdefault("reused", 0)
+    stats.setdefault("chunked", 0)
+
+    def reuse(doc) -> Optional[List[dict]]:
+        old = previous.get(document_hash(doc, counter.settings)) if previous is not None else None
+        stats["reused" if old is not None else "chunked"] += 1
+        return old
+
+    if workers <= 1:
+        for doc in docs:
+            old = reuse(doc)
+            yield from old if old is not None else chunk_document(doc, counter)
+        return
+
+    def batches():
+        # (False, documents to chunk) or (True, the chunks of an unchanged document)
+        batch = []
+        for doc in docs:
+            old = reuse(doc)
+            if old is not None:
+                yield True, old
                 continue
+            batch.append(doc)
+            if len(batch) == DOCS_PER_TASK:
+                yield False, batch
+                batch = []
+        if batch:
+            yield False, batch
+
+    def results(item):
+        return item.result() if isinstance(item, Future) else [item]
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model,)) as pool:
+        pending = deque()
+        for reused, item in batches():
+            pending.append(item if reused else pool.submit(_chunk_many, item))
+            while len(pending) > 2 * workers:
+                for doc_chunks in results(pending.popleft()):
+                    yield from doc_chunks
+        while pending:
+            for doc_chunks in results(pending.popleft()):
+                yield from doc_chunks
+
+
+# --- MAIN ---
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Split scraped pages and posts into chunks.jsonl")
+    ap.add_argument("--workers", type=int, default=1, help="chunking processes, for large inputs")
+    ap.add_argument("--model", default=MODEL_NAME, help="embedding model whose max_seq_length bounds a chunk")
+    ap.add_argument("--full", action="store_true", help="re-chunk every document, even unchanged ones")
+    args = ap.parse_args()
 
-# --- SAVE OUTPUT ---
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    for chunk in all_chunks:
-        f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+    # Unchanged documents (same doc_hash as in the last output) keep their chunks
+    previous = None if args.full or not os.path.exists(OUTPUT_FILE) else PreviousChunks(OUTPUT_FILE)
+    stats = {}
+    count = 0
+    # Write as we go: memory use doesn't grow with the input
+    with open(OUTPUT_FILE + ".tmp", "w", encoding="utf-8") as f:
+        for chunk in iter_chunks(read_documents(INPUT_FILES), args.model, args.workers, previous, stats):
+            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            count += 1
+    if previous is not None:
+        previous.close()
+    os.replace(OUTPUT_FILE + ".tmp", OUTPUT_FILE)
 
-print(f" Done. Wrote {len(all_chunks)} chunks to {OUTPUT_FILE}")
+    print(f" Done. Wrote {count} chunks to {OUTPUT_FILE} "
+          f"({stats['chunked']} documents chunked, {stats['reused']} unchanged)")